@@ -1,15 +1,53 @@
+import asyncio
+import atexit
+import base64
+import codecs
 import collections
+import contextlib
+import contextvars
+import cProfile
+import fcntl
+import functools
+import gzip
+import hashlib
+import http.client
 import io
 import json
 import os
+import platform
+import pstats
+import queue
+import random
 import re
+import resource
 import shlex
+import shutil
+import signal
+import socket
+import sqlite3
 import subprocess
+import tempfile
 import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
 import uuid
 import zipfile
-from queue import SimpleQueue
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from queue import Empty, SimpleQueue
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+try:  # Optional: zstd variants are only produced when the zstandard package is installed.
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+try:  # Installed from requirements.txt; without it the component index falls back to loading SBOMs whole.
+    import ijson
+except ImportError:  # pragma: no cover - depends on the environment
+    ijson = None
 
 from flask import Flask, Response, abort, jsonify, request, send_file
 
@@ -21,11 +59,94 @@ DELETE_IMAGE_AFTER_SUCCESS = os.environ.get("DELETE_IMAGE_AFTER_SUCCESS", "false
     "yes",
 }
 SBOM_OUTPUT_DIR = os.environ.get("SBOM_OUTPUT_DIR", "/tmp/sboms")
-ZIP_COMPRESSION = zipfile.ZIP_DEFLATED if hasattr(zipfile, "ZIP_DEFLATED") else zipfile.ZIP_STORED
+ZIP_METHODS = {
+    "deflated": zipfile.ZIP_DEFLATED,
+    "stored": zipfile.ZIP_STORED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+ZIP_COMPRESSION = ZIP_METHODS.get(os.environ.get("SBOM_ZIP_COMPRESSION", "deflated").lower(), zipfile.ZIP_DEFLATED)
+# Deflate/bzip2 level for ZIP entries; unset keeps the zlib default (6).
+ZIP_COMPRESSLEVEL = int(os.environ["SBOM_ZIP_LEVEL"]) if os.environ.get("SBOM_ZIP_LEVEL") else None
 TRIVY_SKIP_DB_UPDATE_DEFAULT = os.environ.get("TRIVY_SKIP_DB_UPDATE", "true")
 TRIVY_SKIP_POLICY_UPDATE_DEFAULT = os.environ.get("TRIVY_SKIP_POLICY_UPDATE", "true")
 TRIVY_NO_PROGRESS_DEFAULT = os.environ.get("TRIVY_NO_PROGRESS", "true")
 TRIVY_DISABLE_TELEMETRY_DEFAULT = os.environ.get("TRIVY_DISABLE_TELEMETRY", "true")
+# Number of tool/format combinations scanned concurrently per image in the bulk (ZIP) path.
+SBOM_BULK_WORKERS = max(1, int(os.environ.get("SBOM_BULK_WORKERS", "4")))
+# How many upcoming images are pulled while the current one is being scanned in multi-image batches.
+SBOM_PREFETCH_DEPTH = max(0, int(os.environ.get("SBOM_PREFETCH_DEPTH", "1")))
+SBOM_BATCH_MAX_IMAGES = max(1, int(os.environ.get("SBOM_BATCH_MAX_IMAGES", "200")))
+# Catalog each image once per tool and write every format from that single result.
+SBOM_MULTI_FORMAT = os.environ.get("SBOM_MULTI_FORMAT", "true").lower() in {"1", "true", "yes"}
+# Scanners used for Trivy's native JSON pass; "license" keeps package analyzers on without needing the vuln DB.
+TRIVY_MULTI_FORMAT_SCANNERS = os.environ.get("TRIVY_MULTI_FORMAT_SCANNERS", "license")
+TRIVY_REPORT_FILENAME = "trivy-report.json"
+# Content-addressed SBOM cache keyed by image digest + tool + tool version + format.
+SBOM_RESULT_CACHE = os.environ.get("SBOM_RESULT_CACHE", "true").lower() in {"1", "true", "yes"}
+SBOM_RESULT_CACHE_DIR = os.environ.get("SBOM_RESULT_CACHE_DIR", os.path.join(SBOM_OUTPUT_DIR, "cache"))
+SBOM_RESULT_CACHE_MAX_BYTES = int(os.environ.get("SBOM_RESULT_CACHE_MAX_BYTES", str(2 * 1024**3)))
+# Generated SBOMs are stored once per unique content under SBOM_ARCHIVE_DIR (same filesystem as
+# SBOM_OUTPUT_DIR); per-request files are hard links to it. A background GC deletes per-request files
+# older than SBOM_ARCHIVE_MAX_AGE seconds or, oldest first, beyond SBOM_ARCHIVE_MAX_BYTES (0 disables either).
+SBOM_ARCHIVE_DEDUP = os.environ.get("SBOM_ARCHIVE_DEDUP", "true").lower() in {"1", "true", "yes"}
+SBOM_ARCHIVE_DIR = os.environ.get("SBOM_ARCHIVE_DIR", os.path.join(SBOM_OUTPUT_DIR, "objects"))
+SBOM_ARCHIVE_DB = os.environ.get("SBOM_ARCHIVE_DB", os.path.join(SBOM_OUTPUT_DIR, "archive.sqlite3"))
+SBOM_ARCHIVE_MAX_BYTES = int(os.environ.get("SBOM_ARCHIVE_MAX_BYTES", str(5 * 1024**3)))
+SBOM_ARCHIVE_MAX_AGE = int(os.environ.get("SBOM_ARCHIVE_MAX_AGE", str(7 * 24 * 3600)))
+SBOM_ARCHIVE_GC_INTERVAL = float(os.environ.get("SBOM_ARCHIVE_GC_INTERVAL", "300"))
+SBOM_DIGEST_TIMEOUT = float(os.environ.get("SBOM_DIGEST_TIMEOUT", "10"))
+# Without a Docker daemon, images are fetched once into digest-keyed OCI layouts that both scanners read.
+SBOM_OCI_STAGING = os.environ.get("SBOM_OCI_STAGING", "true").lower() in {"1", "true", "yes"}
+SBOM_OCI_CACHE_DIR = os.environ.get("SBOM_OCI_CACHE_DIR", os.path.join(SBOM_OUTPUT_DIR, "oci"))
+SBOM_OCI_CACHE_MAX_BYTES = int(os.environ.get("SBOM_OCI_CACHE_MAX_BYTES", str(10 * 1024**3)))
+SBOM_OCI_TIMEOUT = float(os.environ.get("SBOM_OCI_TIMEOUT", "60"))
+# Docker Engine API endpoint used for probing, pulling and removing images (unix:// or plain tcp://).
+DOCKER_HOST = os.environ.get("DOCKER_HOST", "unix:///var/run/docker.sock")
+SBOM_DOCKER_PING_TTL = float(os.environ.get("SBOM_DOCKER_PING_TTL", "10"))
+# Run Trivy scans in client mode against a supervised local `trivy server` (or an external one via
+# SBOM_TRIVY_SERVER_URL); scans fall back to standalone mode whenever the server is unavailable.
+SBOM_TRIVY_SERVER = os.environ.get("SBOM_TRIVY_SERVER", "false").lower() in {"1", "true", "yes"}
+SBOM_TRIVY_SERVER_LISTEN = os.environ.get("SBOM_TRIVY_SERVER_LISTEN", "127.0.0.1:4954")
+SBOM_TRIVY_SERVER_URL = os.environ.get("SBOM_TRIVY_SERVER_URL", "")
+SBOM_TRIVY_SERVER_CHECK_INTERVAL = float(os.environ.get("SBOM_TRIVY_SERVER_CHECK_INTERVAL", "10"))
+SBOM_TRIVY_SERVER_STARTUP_TIMEOUT = float(os.environ.get("SBOM_TRIVY_SERVER_STARTUP_TIMEOUT", "60"))
+# Downloadable SBOMs get compressed sibling files once, in the background; downloads and JSON API
+# responses are then served with Content-Encoding negotiated from Accept-Encoding.
+SBOM_PRECOMPRESS = [
+    encoding
+    for encoding in (item.strip().lower() for item in os.environ.get("SBOM_PRECOMPRESS", "zstd,gzip").split(","))
+    if encoding == "gzip" or (encoding == "zstd" and zstandard is not None)
+]
+SBOM_GZIP_LEVEL = int(os.environ.get("SBOM_GZIP_LEVEL", "6"))
+SBOM_ZSTD_LEVEL = int(os.environ.get("SBOM_ZSTD_LEVEL", "3"))
+SBOM_COMPRESS_MIN_BYTES = int(os.environ.get("SBOM_COMPRESS_MIN_BYTES", "1024"))
+# Fair admission of scanner runs per worker process: at most SBOM_MAX_CONCURRENT_SCANS at once and
+# SBOM_CLIENT_MAX_SCANS per client. Clients are told apart by remote address, or by the first value of
+# SBOM_CLIENT_HEADER when set (e.g. X-Forwarded-For behind a proxy, or an API-token header).
+SBOM_MAX_CONCURRENT_SCANS = max(1, int(os.environ.get("SBOM_MAX_CONCURRENT_SCANS", str(max(4, os.cpu_count() or 1)))))
+SBOM_CLIENT_MAX_SCANS = max(1, int(os.environ.get("SBOM_CLIENT_MAX_SCANS", "4")))
+SBOM_CLIENT_HEADER = os.environ.get("SBOM_CLIENT_HEADER", "")
+# The scan limit adapts between SBOM_MIN_CONCURRENT_SCANS and SBOM_MAX_CONCURRENT_SCANS: it shrinks while the
+# 1-minute load per CPU exceeds SBOM_ADAPTIVE_LOAD_HIGH or available memory drops below SBOM_MEMORY_RESERVE,
+# and grows back once both recover. Scans queued longer than SBOM_QUEUE_TIMEOUT seconds fail as overloaded.
+SBOM_ADAPTIVE_CONCURRENCY = os.environ.get("SBOM_ADAPTIVE_CONCURRENCY", "true").lower() in {"1", "true", "yes"}
+SBOM_MIN_CONCURRENT_SCANS = max(1, int(os.environ.get("SBOM_MIN_CONCURRENT_SCANS", "1")))
+SBOM_ADAPTIVE_LOAD_HIGH = float(os.environ.get("SBOM_ADAPTIVE_LOAD_HIGH", "1.5"))
+SBOM_MEMORY_RESERVE = int(os.environ.get("SBOM_MEMORY_RESERVE", str(512 * 1024**2)))
+SBOM_QUEUE_TIMEOUT = float(os.environ.get("SBOM_QUEUE_TIMEOUT", "300"))
+ADAPTIVE_INTERVAL = 5.0
+# Per-scan limits applied to Syft/Trivy children (0 disables): address space in bytes, CPU seconds, nice value.
+# The best-effort I/O priority follows the nice value, so no separate ionice is needed.
+SBOM_SCAN_MAX_MEMORY = int(os.environ.get("SBOM_SCAN_MAX_MEMORY", "0"))
+SBOM_SCAN_MAX_CPU_SECONDS = int(os.environ.get("SBOM_SCAN_MAX_CPU_SECONDS", "0"))
+SBOM_SCAN_NICE = int(os.environ.get("SBOM_SCAN_NICE", "10"))
+# Comment lines sent on idle SSE streams; they also reveal disconnected clients so their scans get cancelled.
+SBOM_SSE_KEEPALIVE = float(os.environ.get("SBOM_SSE_KEEPALIVE", "15"))
+# Scanner stderr: only the last N lines are kept for error messages; parsed progress is forwarded at most
+# once per SBOM_PROGRESS_INTERVAL seconds (phase changes are always forwarded).
+SBOM_STDERR_TAIL_LINES = max(1, int(os.environ.get("SBOM_STDERR_TAIL_LINES", "200")))
+SBOM_PROGRESS_INTERVAL = float(os.environ.get("SBOM_PROGRESS_INTERVAL", "1"))
 app.config["PROPAGATE_EXCEPTIONS"] = False
 
 
@@ -49,8 +170,81 @@ SUPPORTED_FORMATS: Dict[str, Dict[str, str]] = {
     },
 }
 
+# Scan profiles selected with "profile": extra Syft/Trivy flags (and Syft config via environment). "full" keeps
+# each scanner's default cataloging; "fast" covers only OS packages of the squashed image, skipping language
+# catalogers and file metadata/digests, for CI gates that need a quick package inventory.
+SCAN_PROFILES: Dict[str, Dict[str, Any]] = {
+    "full": {
+        "label": "Full (all catalogers)",
+        "syft": [],
+        "syft_env": {},
+        "trivy": [],
+        "trivy_scanners": None,
+    },
+    "fast": {
+        "label": "Fast (OS packages only)",
+        "syft": ["--select-catalogers", "os", "--scope", "squashed"],
+        "syft_env": {"SYFT_FILE_METADATA_SELECTION": "none", "SYFT_FILE_METADATA_DIGESTS": ""},
+        "trivy": ["--pkg-types", "os"],
+        "trivy_scanners": "license",
+    },
+}
+DEFAULT_SCAN_PROFILE = "full"
+
+MANIFEST_ACCEPT = ", ".join(
+    [
+        "application/vnd.oci.image.index.v1+json",
+        "application/vnd.docker.distribution.manifest.list.v2+json",
+        "application/vnd.oci.image.manifest.v1+json",
+        "application/vnd.docker.distribution.manifest.v2+json",
+    ]
+)
+
+INDEX_MEDIA_TYPES = {
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+}
+
+ENCODING_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+
 MAX_DOWNLOAD_CACHE = 25
-DOWNLOAD_CACHE: "collections.OrderedDict[str, Tuple[Any, str, str]]" = collections.OrderedDict()
+DOWNLOAD_CACHE: "collections.OrderedDict[str, Tuple[str, str, str]]" = collections.OrderedDict()
+# "sqlite" shares download tokens across gunicorn workers via an index in SBOM_OUTPUT_DIR; "memory" keeps
+# them in DOWNLOAD_CACHE and therefore needs a single worker.
+SBOM_TOKEN_STORE = os.environ.get("SBOM_TOKEN_STORE", "sqlite").lower()
+SBOM_TOKEN_DB = os.environ.get("SBOM_TOKEN_DB", os.path.join(SBOM_OUTPUT_DIR, "downloads.sqlite3"))
+SBOM_DOWNLOAD_TTL = int(os.environ.get("SBOM_DOWNLOAD_TTL", str(24 * 3600)))
+SBOM_DOWNLOAD_MAX_BYTES = int(os.environ.get("SBOM_DOWNLOAD_MAX_BYTES", str(5 * 1024**3)))
+# When set (e.g. "/_sbom_files/"), downloads of files under SBOM_OUTPUT_DIR are handed to the fronting nginx
+# with X-Accel-Redirect: <prefix><path relative to SBOM_OUTPUT_DIR> instead of being streamed by a worker.
+SBOM_ACCEL_REDIRECT_PREFIX = os.environ.get("SBOM_ACCEL_REDIRECT_PREFIX", "")
+# Background job API: scans run on a bounded pool; job state lives in SQLite so any worker can report it.
+SBOM_JOB_WORKERS = max(1, int(os.environ.get("SBOM_JOB_WORKERS", "2")))
+SBOM_JOB_QUEUE_DEPTH = max(0, int(os.environ.get("SBOM_JOB_QUEUE_DEPTH", "16")))
+SBOM_JOB_DB = os.environ.get("SBOM_JOB_DB", os.path.join(SBOM_OUTPUT_DIR, "jobs.sqlite3"))
+SBOM_JOB_EVENT_POLL = float(os.environ.get("SBOM_JOB_EVENT_POLL", "0.5"))
+# Prometheus metrics at /metrics; samples are kept in SQLite so every gunicorn worker reports the same totals.
+SBOM_METRICS = os.environ.get("SBOM_METRICS", "true").lower() in {"1", "true", "yes"}
+SBOM_METRICS_DB = os.environ.get("SBOM_METRICS_DB", os.path.join(SBOM_OUTPUT_DIR, "metrics.sqlite3"))
+# Fraction of SBOM requests run under cProfile (0 disables); merged per-request dumps go to SBOM_PROFILE_DIR,
+# keeping the newest SBOM_PROFILE_KEEP files.
+SBOM_PROFILE_SAMPLE_RATE = float(os.environ.get("SBOM_PROFILE_SAMPLE_RATE", "0"))
+SBOM_PROFILE_DIR = os.environ.get("SBOM_PROFILE_DIR", os.path.join(SBOM_OUTPUT_DIR, "profiles"))
+SBOM_PROFILE_KEEP = int(os.environ.get("SBOM_PROFILE_KEEP", "50"))
+# Components of every generated SBOM are indexed in SQLite (in the background) for /api/components.
+SBOM_COMPONENT_INDEX = os.environ.get("SBOM_COMPONENT_INDEX", "true").lower() in {"1", "true", "yes"}
+SBOM_COMPONENT_DB = os.environ.get("SBOM_COMPONENT_DB", os.path.join(SBOM_OUTPUT_DIR, "components.sqlite3"))
+COMPONENT_PAGE_SIZE = 100
+COMPONENT_PAGE_MAX = 1000
+# /api/sbom/<token>/components pages through a stored SBOM using a byte-offset index of its top-level
+# packages/components array. The index is built on first use, reading the SBOM in fixed-size chunks,
+# and kept once per content hash under SBOM_OFFSET_INDEX_DIR (expired with SBOM_ARCHIVE_MAX_AGE).
+SBOM_OFFSET_INDEX_DIR = os.environ.get("SBOM_OFFSET_INDEX_DIR", os.path.join(SBOM_OUTPUT_DIR, "offsets"))
+OFFSET_INDEX_CHUNK_BYTES = 1024 * 1024
+OFFSET_INDEX_CACHE_SIZE = 8
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+RSS_BUCKETS = tuple(float(mib * 1024**2) for mib in (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192))
+CPU_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
 
 
 def _humanize_error(raw: str) -> str:
@@ -65,16 +259,31 @@ def _humanize_error(raw: str) -> str:
     return raw
 
 
-def _build_command(tool: str, image: str, sbom_format: str, prefer_local: bool = False) -> List[str]:
-    """Create the CLI command for the requested tool/format combination."""
+def _build_command(
+    tool: str,
+    image: str,
+    sbom_format: str,
+    prefer_local: bool = False,
+    oci_layout: Optional[str] = None,
+    trivy_server: Optional[str] = None,
+    profile: str = DEFAULT_SCAN_PROFILE,
+) -> List[str]:
+    """Create the CLI command for the requested tool/format combination.
+
+    With ``oci_layout`` the tool scans the locally staged OCI layout instead of fetching ``image``;
+    with ``trivy_server`` Trivy runs in client mode against that server. ``profile`` adds the
+    flags of that ``SCAN_PROFILES`` entry.
+    """
     if tool not in SUPPORTED_TOOLS:
         raise ValueError(f"Unsupported tool: {tool}")
     if sbom_format not in SUPPORTED_FORMATS:
         raise ValueError(f"Unsupported format: {sbom_format}")
+    if profile not in SCAN_PROFILES:
+        raise ValueError(f"Unsupported profile: {profile}")
 
     if tool == "syft":
         output_flag = SUPPORTED_FORMATS[sbom_format][tool]
-        return ["syft", image, "-o", output_flag]
+        return ["syft", *_syft_source(image, oci_layout), *SCAN_PROFILES[profile]["syft"], "-o", output_flag]
 
     format_flag = SUPPORTED_FORMATS[sbom_format][tool]
     command = [
@@ -82,465 +291,3433 @@ def _build_command(tool: str, image: str, sbom_format: str, prefer_local: bool =
         "image",
         "--format",
         format_flag,
+        *SCAN_PROFILES[profile]["trivy"],
     ]
+    if SCAN_PROFILES[profile]["trivy_scanners"]:
+        command.extend(["--scanners", SCAN_PROFILES[profile]["trivy_scanners"]])
+    if trivy_server:
+        command.extend(["--server", trivy_server])
+    command.extend(_trivy_source(image, prefer_local, oci_layout))
+    return command
+
+
+def _profile_env(tool: str, profile: str) -> Dict[str, str]:
+    """Scanner configuration a profile sets through the environment (Syft has no flags for it)."""
+    return dict(SCAN_PROFILES[profile]["syft_env"]) if tool == "syft" else {}
+
+
+def _command_preview(command: List[str], env: Optional[Dict[str, str]] = None) -> str:
+    """Shell-style rendering of a scanner command, including any profile environment assignments."""
+    assignments = [f"{name}={shlex.quote(value)}" for name, value in (env or {}).items()]
+    return " ".join(assignments + [shlex.quote(token) for token in command])
+
+
+def _image_source_name(image: str) -> Tuple[str, str]:
+    """Split a reference into the subject name and version an SBOM reports ("repo", "tag" or "sha256:...")."""
+    name, _, digest = image.strip().partition("@")
+    tag = ""
+    if ":" in name.rsplit("/", 1)[-1]:
+        name, tag = name.rsplit(":", 1)
+    return name, digest or tag or "latest"
+
+
+def _syft_source(image: str, oci_layout: Optional[str]) -> List[str]:
+    if not oci_layout:
+        return [image]
+    # Otherwise Syft names the SBOM subject after the local layout path.
+    name, version = _image_source_name(image)
+    return [f"oci-dir:{oci_layout}", "--source-name", name, "--source-version", version]
+
+
+def _trivy_source(image: str, prefer_local: bool, oci_layout: Optional[str]) -> List[str]:
+    if oci_layout:
+        return ["--input", oci_layout]
     # Prefer local daemon when available to avoid repeated remote pulls during bulk ZIP generation.
-    if prefer_local:
-        command.append("--image-src=auto")
-    else:
-        command.append("--image-src=remote")
+    return ["--image-src=auto" if prefer_local else "--image-src=remote", image]
 
-    command.append(image)
-    return command
 
+def _build_multi_format_commands(
+    tool: str,
+    image: str,
+    sbom_formats: List[str],
+    prefer_local: bool = False,
+    oci_layout: Optional[str] = None,
+    trivy_server: Optional[str] = None,
+    profile: str = DEFAULT_SCAN_PROFILE,
+) -> List[Tuple[List[str], List[str]]]:
+    """Create the command chain that catalogs ``image`` once and writes every requested format.
+
+    Returns ``(command, formats_written)`` steps to run in order inside a scratch
+    directory; each format is written to ``_build_filename(image, tool, format)``.
+    A step that writes no formats is a prerequisite for the steps after it.
+    """
+    if tool not in SUPPORTED_TOOLS:
+        raise ValueError(f"Unsupported tool: {tool}")
+    for sbom_format in sbom_formats:
+        if sbom_format not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported format: {sbom_format}")
+    if profile not in SCAN_PROFILES:
+        raise ValueError(f"Unsupported profile: {profile}")
+
+    if tool == "syft":
+        command = ["syft", *_syft_source(image, oci_layout), *SCAN_PROFILES[profile]["syft"]]
+        for sbom_format in sbom_formats:
+            output_flag = SUPPORTED_FORMATS[sbom_format][tool]
+            command.extend(["-o", f"{output_flag}={_build_filename(image, tool, sbom_format, profile)}"])
+        return [(command, list(sbom_formats))]
+
+    # Trivy scans once into its native JSON report, then `trivy convert` renders each SBOM format.
+    report = TRIVY_REPORT_FILENAME
+    steps: List[Tuple[List[str], List[str]]] = [
+        (
+            [
+                "trivy",
+                "image",
+                "--format",
+                "json",
+                "--list-all-pkgs",
+                *SCAN_PROFILES[profile]["trivy"],
+                "--scanners",
+                SCAN_PROFILES[profile]["trivy_scanners"] or TRIVY_MULTI_FORMAT_SCANNERS,
+                "--output",
+                report,
+                *(["--server", trivy_server] if trivy_server else []),
+                *_trivy_source(image, prefer_local, oci_layout),
+            ],
+            [],
+        )
+    ]
+    for sbom_format in sbom_formats:
+        format_flag = SUPPORTED_FORMATS[sbom_format][tool]
+        filename = _build_filename(image, tool, sbom_format, profile)
+        steps.append((["trivy", "convert", "--format", format_flag, "--output", filename, report], [sbom_format]))
+    return steps
+
+
+def _name_trivy_artifact(path: str, image_ref: str, oci_layout: str) -> None:
+    """Name the artifact in a Trivy document after ``image_ref`` instead of the ``--input`` layout path.
+
+    Trivy has no flag for the artifact name, so every occurrence of the (JSON-escaped) layout path is
+    replaced: the report's ``ArtifactName``, SPDX document name and namespace, CycloneDX root component.
+    """
+    old = json.dumps(oci_layout)[1:-1].encode("utf-8")
+    new = json.dumps(image_ref)[1:-1].encode("utf-8")
+    with open(path, "rb") as fp:
+        data = fp.read()
+    if old not in data:
+        return
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+    try:
+        with open(tmp_path, "wb") as fp:
+            fp.write(data.replace(old, new))
+        os.replace(tmp_path, path)
+    finally:
+        _discard_file(tmp_path)
 
-def _build_filename(image_ref: str, tool: str, sbom_format: str) -> str:
-    """Generate a descriptive, filesystem-safe SBOM filename."""
+
+def _build_filename(image_ref: str, tool: str, sbom_format: str, profile: str = DEFAULT_SCAN_PROFILE) -> str:
+    """Generate a descriptive, filesystem-safe SBOM filename (non-default profiles are appended)."""
     cleaned_image = image_ref.strip() or "sbom"
     cleaned_image = cleaned_image.replace("docker.io/", "").replace("index.docker.io/", "")
     cleaned_image = re.sub(r"[^A-Za-z0-9_.:/-]+", "-", cleaned_image)
     cleaned_image = cleaned_image.replace("/", "-").replace(":", "-").replace("@", "-")
     safe_image = re.sub(r"-{2,}", "-", cleaned_image).strip("-") or "sbom"
     extension = SUPPORTED_FORMATS[sbom_format].get("extension", "json")
-    return f"{safe_image}-{tool}-{sbom_format}.{extension}"
+    suffix = "" if profile == DEFAULT_SCAN_PROFILE else f"-{profile}"
+    return f"{safe_image}-{tool}-{sbom_format}{suffix}.{extension}"
 
 
-def _write_sbom_to_disk(sbom_output: str, filename: str) -> str:
-    """Persist SBOM content to disk and return the saved path."""
+def _new_output_path(filename: str) -> str:
+    """Return a fresh, uuid-prefixed path under ``SBOM_OUTPUT_DIR`` for a generated artifact."""
     os.makedirs(SBOM_OUTPUT_DIR, exist_ok=True)
-    saved_path = os.path.join(SBOM_OUTPUT_DIR, f"{uuid.uuid4().hex}-{filename}")
-    with open(saved_path, "w", encoding="utf-8") as fp:
-        fp.write(sbom_output)
-    return saved_path
-
+    return os.path.join(SBOM_OUTPUT_DIR, f"{uuid.uuid4().hex}-{filename}")
 
-def _write_bytes_to_disk(payload: bytes, filename: str) -> str:
-    """Persist binary content (e.g., ZIP) to disk and return the saved path."""
-    os.makedirs(SBOM_OUTPUT_DIR, exist_ok=True)
-    saved_path = os.path.join(SBOM_OUTPUT_DIR, f"{uuid.uuid4().hex}-{filename}")
-    with open(saved_path, "wb") as fp:
-        fp.write(payload)
-    return saved_path
 
+def _split_image_ref(image_ref: str) -> Tuple[str, str, str]:
+    """Split an image reference into (registry, repository, tag_or_digest) using Docker Hub defaults."""
+    name, _, digest = image_ref.strip().partition("@")
+    reference = digest or "latest"
+    if ":" in name.rsplit("/", 1)[-1]:
+        name, tag = name.rsplit(":", 1)
+        reference = digest or tag
+    first, _, rest = name.partition("/")
+    if rest and ("." in first or ":" in first or first == "localhost"):
+        registry, repository = first, rest
+    else:
+        registry, repository = "docker.io", name
+    if registry in {"docker.io", "index.docker.io", "registry-1.docker.io"}:
+        registry = "registry-1.docker.io"
+        if "/" not in repository:
+            repository = f"library/{repository}"
+    return registry, repository, reference
 
-def _cleanup_image(image_ref: str) -> str:
-    """Attempt to delete the pulled image via Docker CLI if configured."""
-    if not DELETE_IMAGE_AFTER_SUCCESS:
-        return "Image cleanup skipped (DELETE_IMAGE_AFTER_SUCCESS not enabled)."
 
-    command = ["docker", "image", "rm", "-f", image_ref]
-    try:
-        completed = subprocess.run(
-            command,
-            check=False,
-            capture_output=True,
-            text=True,
-            timeout=60,
-        )
-    except FileNotFoundError:
-        return "Docker CLI not available in container; cannot remove image."
-    except subprocess.TimeoutExpired:
-        return "Image cleanup timed out."
+class _StripAuthOnRedirect(urllib.request.HTTPRedirectHandler):
+    """Drop registry credentials when a blob request is redirected to another host (e.g. a CDN)."""
 
-    if completed.returncode == 0:
-        return f"Removed image: {image_ref}"
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        new_request = super().redirect_request(req, fp, code, msg, headers, newurl)
+        if new_request is not None and urllib.parse.urlparse(newurl).netloc != urllib.parse.urlparse(req.full_url).netloc:
+            new_request.headers.pop("Authorization", None)
+            new_request.unredirected_hdrs.pop("Authorization", None)
+        return new_request
 
-    stderr_output = completed.stderr.strip()
-    stdout_output = completed.stdout.strip()
-    details = "\n".join(filter(None, [stdout_output, stderr_output]))
-    return f"Image cleanup failed: {details or 'unknown error'}"
 
+_REGISTRY_OPENER = urllib.request.build_opener(_StripAuthOnRedirect())
 
-def _cache_download(data: str | bytes, filename: str, mimetype: str = "application/json") -> str:
-    """Store downloadable content in memory so the user can fetch it without re-generation."""
-    token = uuid.uuid4().hex
-    DOWNLOAD_CACHE[token] = (data, filename, mimetype)
-    if len(DOWNLOAD_CACHE) > MAX_DOWNLOAD_CACHE:
-        oldest_token = next(iter(DOWNLOAD_CACHE))
-        DOWNLOAD_CACHE.pop(oldest_token, None)
-    return token
 
+class _RegistrySession:
+    """Pull access to one repository on a registry, reusing the negotiated token across requests."""
 
-def _safe_image_folder(image_ref: str) -> str:
-    """Sanitize an image reference for use as a folder name inside the ZIP."""
-    cleaned_image = image_ref.replace("docker.io/", "").replace("index.docker.io/", "")
-    cleaned_image = re.sub(r"[^A-Za-z0-9_.:/-]+", "-", cleaned_image)
-    cleaned_image = cleaned_image.replace("/", "-").replace(":", "-").replace("@", "-")
-    return re.sub(r"-{2,}", "-", cleaned_image).strip("-") or "image"
+    def __init__(
+        self, image_ref: str, registry_username: str = "", registry_password: str = "", timeout: float = SBOM_DIGEST_TIMEOUT
+    ):
+        self.registry, self.repository, self.reference = _split_image_ref(image_ref)
+        scheme = "http" if self.registry.startswith(("localhost", "127.0.0.1")) else "https"
+        self.base_url = f"{scheme}://{self.registry}/v2/{self.repository}"
+        self.registry_username = registry_username
+        self.registry_password = registry_password
+        self.timeout = timeout
+        self.authorization: Optional[str] = None
 
+    def open(self, path: str, method: str = "GET", accept: Optional[str] = None):
+        """Open ``path`` below the repository, answering one auth challenge if the registry sends it."""
+        for attempt in range(2):
+            registry_request = urllib.request.Request(self.base_url + path, method=method)
+            if accept:
+                registry_request.add_header("Accept", accept)
+            if self.authorization:
+                registry_request.add_header("Authorization", self.authorization)
+            try:
+                return _REGISTRY_OPENER.open(registry_request, timeout=self.timeout)
+            except urllib.error.HTTPError as exc:
+                if exc.code != 401 or attempt:
+                    raise
+                challenge = exc.headers.get("WWW-Authenticate", "")
+                exc.close()
+                self.authorization = self._authorize(challenge)
+                if not self.authorization:
+                    raise
+        raise AssertionError("unreachable")
 
-def _prepare_single_entry(image_ref: str) -> Dict[str, Any]:
-    """Normalize a single user-provided image reference into the entry shape."""
-    ref = (image_ref or "").strip()
-    if not ref:
-        raise ValueError("Docker image reference is required.")
-    tag = "latest"
-    if ":" in ref and not ref.endswith(":/"):
-        _, _, tail = ref.partition("/")
-        name_part = tail or ref
-        if ":" in name_part:
-            tag = name_part.split(":", 1)[1] or "latest"
-    return {"name": ref, "image_ref": ref, "tag": tag, "pull_count": None, "description": ""}
+    def _authorize(self, challenge: str) -> Optional[str]:
+        if challenge.lower().startswith("bearer"):
+            token = _registry_token(challenge, self.registry_username, self.registry_password)
+            return f"Bearer {token}" if token else None
+        if challenge.lower().startswith("basic") and self.registry_username:
+            basic = f"{self.registry_username}:{self.registry_password}".encode("utf-8")
+            return "Basic " + base64.b64encode(basic).decode("ascii")
+        return None
 
 
-def _build_env(registry_username: str = "", registry_password: str = "") -> Dict[str, str]:
-    """Build environment for registry auth if provided."""
-    env = os.environ.copy()
-    # Avoid per-run Trivy DB/telemetry overhead for multi-pattern generation unless explicitly overridden.
-    env.setdefault("TRIVY_SKIP_DB_UPDATE", TRIVY_SKIP_DB_UPDATE_DEFAULT)
-    env.setdefault("TRIVY_SKIP_POLICY_UPDATE", TRIVY_SKIP_POLICY_UPDATE_DEFAULT)
-    env.setdefault("TRIVY_NO_PROGRESS", TRIVY_NO_PROGRESS_DEFAULT)
-    env.setdefault("TRIVY_DISABLE_TELEMETRY", TRIVY_DISABLE_TELEMETRY_DEFAULT)
+def _registry_token(challenge: str, registry_username: str = "", registry_password: str = "") -> Optional[str]:
+    """Exchange a Bearer WWW-Authenticate challenge for a pull token."""
+    params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+    realm = params.pop("realm", "")
+    if not realm:
+        return None
+    token_request = urllib.request.Request(f"{realm}?{urllib.parse.urlencode(params)}")
     if registry_username:
-        env["SYFT_REGISTRY_AUTH_USERNAME"] = registry_username
-        env["TRIVY_USERNAME"] = registry_username
-    if registry_password:
-        env["SYFT_REGISTRY_AUTH_PASSWORD"] = registry_password
-        env["TRIVY_PASSWORD"] = registry_password
-    return env
+        basic = f"{registry_username}:{registry_password}".encode("utf-8")
+        token_request.add_header("Authorization", "Basic " + base64.b64encode(basic).decode("ascii"))
+    with urllib.request.urlopen(token_request, timeout=SBOM_DIGEST_TIMEOUT) as resp:
+        body = json.loads(resp.read().decode("utf-8") or "{}")
+    return body.get("token") or body.get("access_token")
+
 
+def _resolve_image_digest(image_ref: str, registry_username: str = "", registry_password: str = "") -> Optional[str]:
+    """Resolve the manifest digest for an image reference from its registry; None if it cannot be resolved.
 
-def _docker_available(extra_env: Dict[str, str] | None = None) -> bool:
-    """Check whether Docker daemon is reachable; keeps timeout very short."""
-    env = _build_env(**(extra_env or {}))
-    inspect_cmd = ["docker", "version", "--format", "{{.Server.Version}}"]
+    Resolution uses the caller's credentials, so cached SBOMs of private images are
+    only served to callers that can read the manifest themselves. Digest references are
+    checked the same way: a digest the caller cannot read resolves to None (a cache miss).
+    """
+    session = _RegistrySession(image_ref, registry_username, registry_password)
     try:
-        completed = subprocess.run(
-            inspect_cmd,
-            capture_output=True,
-            text=True,
-            check=False,
-            timeout=5,
-            env=env,
-        )
-    except FileNotFoundError:
-        return False
-    except subprocess.TimeoutExpired:
-        return False
+        with _stage_timer("digest"), session.open(
+            f"/manifests/{session.reference}", method="HEAD", accept=MANIFEST_ACCEPT
+        ) as resp:
+            if session.reference.startswith("sha256:"):
+                return session.reference
+            return resp.headers.get("Docker-Content-Digest")
+    except (urllib.error.URLError, OSError, ValueError) as exc:
+        app.logger.info("Digest resolution failed for %s: %s", image_ref, exc)
+        return None
 
-    return completed.returncode == 0
 
+def _oci_blob_path(digest: str) -> str:
+    algorithm, _, hex_digest = digest.partition(":")
+    return os.path.join(SBOM_OCI_CACHE_DIR, "blobs", algorithm, hex_digest)
 
-def _ensure_image_cached(image_ref: str, extra_env: Dict[str, str] | None = None) -> str:
-    """Best-effort: avoid repeated pulls by checking local cache; pull if missing.
 
-    Note: When running inside a container without Docker socket access, this will
-    quickly return as Docker CLI won't be able to connect to the daemon.
-    """
-    env = _build_env(**(extra_env or {}))
+def _store_oci_blob(digest: str, chunks: Any) -> None:
+    """Write blob ``chunks`` into the shared store, verifying the digest; no-op if already stored."""
+    path = _oci_blob_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    hasher = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            for chunk in chunks:
+                hasher.update(chunk)
+                fp.write(chunk)
+        if f"sha256:{hasher.hexdigest()}" != digest:
+            raise ValueError(f"Digest mismatch for blob {digest}")
+        os.replace(tmp_path, path)
+    finally:
+        _discard_file(tmp_path)
 
-    if not _docker_available(extra_env):
-        return "Docker daemon not accessible; tool will fetch image directly."
 
-    # Docker is available, check if image exists
-    inspect_cmd = ["docker", "image", "inspect", image_ref]
+def _fetch_oci_blob(session: _RegistrySession, digest: str) -> bool:
+    """Download a blob into the shared store unless it is already there; return whether it was fetched."""
     try:
-        inspected = subprocess.run(
-            inspect_cmd,
-            capture_output=True,
-            text=True,
-            check=False,
-            timeout=30,
-            env=env,
-        )
-    except subprocess.TimeoutExpired:
-        return "Image inspect timed out; tool will fetch image directly."
+        # Refresh the mtime so a concurrent prune treats the blob as freshly referenced.
+        os.utime(_oci_blob_path(digest))
+        return False
+    except FileNotFoundError:
+        pass
+    with session.open(f"/blobs/{digest}") as resp:
+        _store_oci_blob(digest, iter(lambda: resp.read(1024 * 1024), b""))
+    return True
 
-    if inspected.returncode == 0:
-        return "Image already present locally."
 
-    pull_cmd = ["docker", "pull", image_ref]
-    try:
-        pulled = subprocess.run(
-            pull_cmd,
-            capture_output=True,
-            text=True,
-            check=False,
-            timeout=300,
-            env=env,
-        )
-    except subprocess.TimeoutExpired:
-        return "Image pull timed out; tool will attempt to fetch."
+def _pick_platform_manifest(index: Dict[str, Any]) -> Dict[str, Any]:
+    """Choose the linux manifest matching this host's architecture from an image index."""
+    machine = platform.machine().lower()
+    arch = {"x86_64": "amd64", "aarch64": "arm64"}.get(machine, machine)
+    candidates = [item for item in index.get("manifests", []) if (item.get("platform") or {}).get("os") == "linux"]
+    for item in candidates:
+        if item["platform"].get("architecture") == arch:
+            return item
+    if not candidates:
+        raise ValueError("Image index has no linux manifest.")
+    return candidates[0]
 
-    if pulled.returncode == 0:
-        return "Image pulled successfully."
 
-    stderr_output = pulled.stderr.strip()
-    stdout_output = pulled.stdout.strip()
-    details = "\n".join(filter(None, [stdout_output, stderr_output]))
-    return f"Image pull failed (continuing with tool fetch): {details or 'unknown error'}"
+_OCI_STAGE_LOCKS: Dict[str, threading.Lock] = collections.defaultdict(threading.Lock)
 
 
-def _run_command(command: List[str], extra_env: Dict[str, str] | None = None) -> Tuple[bool, str]:
-    """Execute the CLI tool, stream stderr to logs, and return (success, output_or_error)."""
-    timeout = int(os.environ.get("SBOM_GENERATION_TIMEOUT", "600"))
-    command_preview = " ".join(shlex.quote(token) for token in command)
-    app.logger.info("SBOM command start: %s", command_preview)
+def _stage_oci_layout(
+    image_ref: str, image_digest: str, registry_username: str = "", registry_password: str = ""
+) -> Tuple[str, str]:
+    """Fetch an image once into a digest-keyed OCI layout and return (layout_path, note).
 
-    try:
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            env=_build_env(**(extra_env or {})),
-        )
-    except FileNotFoundError:
-        return False, (
-            "The requested SBOM tool is not installed inside the container. "
-            "If you are developing locally, please install both Syft and Trivy, "
-            "or build/run the provided Docker image."
-        )
-    except OSError as exc:
-        return False, f"Failed to start SBOM tool: {exc}"
+    Blobs live in a shared store under ``SBOM_OCI_CACHE_DIR`` and are hard-linked into
+    each layout, so layers shared between images are downloaded and stored once.
+    """
+    layout_path = os.path.join(SBOM_OCI_CACHE_DIR, "layouts", image_digest.replace(":", "-"))
+    with _OCI_STAGE_LOCKS[image_digest]:
+        if os.path.isfile(os.path.join(layout_path, "index.json")):
+            os.utime(layout_path)
+            return layout_path, "Image already staged in local OCI layout."
 
-    stderr_lines: List[str] = []
+        session = _RegistrySession(image_ref, registry_username, registry_password, timeout=SBOM_OCI_TIMEOUT)
+        manifest_digest = image_digest
+        while True:
+            with session.open(f"/manifests/{manifest_digest}", accept=MANIFEST_ACCEPT) as resp:
+                manifest_bytes = resp.read()
+                media_type = resp.headers.get("Content-Type", "").split(";", 1)[0]
+            _store_oci_blob(manifest_digest, [manifest_bytes])
+            manifest = json.loads(manifest_bytes.decode("utf-8"))
+            media_type = manifest.get("mediaType") or media_type
+            if media_type not in INDEX_MEDIA_TYPES:
+                break
+            manifest_digest = _pick_platform_manifest(manifest)["digest"]
 
-    def _stream_stderr(pipe):
-        for line in iter(pipe.readline, ""):
-            striped = line.rstrip()
-            if striped:
-                app.logger.info("[sbom-progress] %s", striped)
-                stderr_lines.append(striped)
+        blob_digests = [manifest["config"]["digest"]] + [layer["digest"] for layer in manifest.get("layers", [])]
+        fetched = sum(1 for digest in blob_digests if _fetch_oci_blob(session, digest))
 
-    stderr_thread = threading.Thread(target=_stream_stderr, args=(process.stderr,), daemon=True)
-    stderr_thread.start()
+        os.makedirs(os.path.dirname(layout_path), exist_ok=True)
+        tmp_layout = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(layout_path))
+        try:
+            os.makedirs(os.path.join(tmp_layout, "blobs", "sha256"))
+            for digest in [manifest_digest] + blob_digests:
+                target = os.path.join(tmp_layout, "blobs", "sha256", digest.partition(":")[2])
+                if not os.path.exists(target):
+                    try:
+                        os.link(_oci_blob_path(digest), target)
+                    except OSError:
+                        shutil.copyfile(_oci_blob_path(digest), target)
+            with open(os.path.join(tmp_layout, "oci-layout"), "w", encoding="utf-8") as fp:
+                json.dump({"imageLayoutVersion": "1.0.0"}, fp)
+            index = {
+                "schemaVersion": 2,
+                "mediaType": "application/vnd.oci.image.index.v1+json",
+                "manifests": [
+                    {
+                        "mediaType": media_type,
+                        "digest": manifest_digest,
+                        "size": len(manifest_bytes),
+                        "annotations": {"org.opencontainers.image.ref.name": session.reference},
+                    }
+                ],
+            }
+            with open(os.path.join(tmp_layout, "index.json"), "w", encoding="utf-8") as fp:
+                json.dump(index, fp)
+            os.rename(tmp_layout, layout_path)
+        except OSError:
+            shutil.rmtree(tmp_layout, ignore_errors=True)
+            if not os.path.isfile(os.path.join(layout_path, "index.json")):
+                raise
 
-    try:
-        stdout_data, stderr_data = process.communicate(timeout=timeout)
-    except subprocess.TimeoutExpired:
-        process.kill()
-        return False, "SBOM generation timed out. Try a smaller image or increase the timeout."
-    finally:
-        stderr_thread.join(timeout=1)
+    _evict_oci_cache()
+    reused = len(blob_digests) - fetched
+    return layout_path, f"Image staged to local OCI layout ({fetched} blobs fetched, {reused} reused)."
 
-    if stderr_data:
-        for line in stderr_data.splitlines():
-            striped = line.strip()
-            if striped:
-                app.logger.info("[sbom-progress] %s", striped)
-                stderr_lines.append(striped)
 
-    rc = process.returncode
-    if rc != 0:
-        details = "\n".join(filter(None, [stdout_data.strip(), "\n".join(stderr_lines)]))
-        snippet = (details or "").strip()
-        if len(snippet) > 1200:
-            snippet = snippet[:1200] + "...(truncated)"
-        app.logger.error("SBOM command failed (rc=%s): %s | stderr/summary: %s", rc, command_preview, snippet)
-        return False, details or "SBOM tool failed without providing output."
+def _prune_oci_blobs() -> int:
+    """Delete store blobs no layout links to any more; return the bytes still stored.
 
-    app.logger.info("SBOM command finished (rc=%s)", rc)
-    return True, stdout_data
+    Unlinked blobs younger than the scan timeout may belong to a layout still being staged and are kept.
+    """
+    grace = int(os.environ.get("SBOM_GENERATION_TIMEOUT", "600"))
+    total_bytes = 0
+    store_dir = os.path.join(SBOM_OCI_CACHE_DIR, "blobs", "sha256")
+    if not os.path.isdir(store_dir):
+        return 0
+    with os.scandir(store_dir) as it:
+        for item in it:
+            try:
+                stat = item.stat()
+            except FileNotFoundError:
+                continue
+            if stat.st_nlink <= 1 and not item.name.startswith(".tmp-") and time.time() - stat.st_mtime > grace:
+                os.remove(item.path)
+            else:
+                total_bytes += stat.st_size
+    return total_bytes
 
 
-def _generate_bulk_sboms(
-    image_entries: List[Dict[str, Any]],
-    registry_username: str = "",
-    registry_password: str = "",
-    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
-) -> Dict[str, Any]:
-    """Generate SBOMs for multiple images (Syft/Trivy x SPDX/CycloneDX) and bundle them as a ZIP."""
-    combinations = [(tool, sbom_format) for tool in SUPPORTED_TOOLS for sbom_format in SUPPORTED_FORMATS]
-    total = len(image_entries) * len(combinations)
-    completed = 0
-    results: List[Dict[str, Any]] = []
-    zip_buffer = io.BytesIO()
-    had_failure = False
-    auth_kwargs = {"registry_username": registry_username, "registry_password": registry_password}
-    prefer_local = _docker_available(auth_kwargs)
-
-    with zipfile.ZipFile(zip_buffer, mode="w", compression=ZIP_COMPRESSION) as zip_file:
-        for entry in image_entries:
-            image_ref = entry["image_ref"]
-            folder = _safe_image_folder(image_ref)
-            prefetch_note = _ensure_image_cached(image_ref, {"registry_username": registry_username, "registry_password": registry_password})
-            app.logger.info("Prefetch result for %s: %s", image_ref, prefetch_note)
-            entry["prefetch"] = prefetch_note
-            if progress_cb:
-                progress_cb(
-                    {
-                        "type": "prefetch",
-                        "image_ref": image_ref,
-                        "message": prefetch_note,
-                        "completed": completed,
-                        "total": total,
-                    }
-                )
+def _evict_oci_cache() -> None:
+    """Remove least-recently-used layouts until the blob store fits ``SBOM_OCI_CACHE_MAX_BYTES``.
 
-            for tool, sbom_format in combinations:
-                if progress_cb:
-                    progress_cb(
-                        {
-                            "type": "start",
-                            "image_ref": image_ref,
-                            "tool": tool,
-                            "format": sbom_format,
-                            "completed": completed,
-                            "total": total,
-                        }
-                    )
+    Layouts used within the scan timeout are kept so running scans never lose their input.
+    """
+    total_bytes = _prune_oci_blobs()
+    if total_bytes <= SBOM_OCI_CACHE_MAX_BYTES:
+        return
+    layouts_dir = os.path.join(SBOM_OCI_CACHE_DIR, "layouts")
+    grace = int(os.environ.get("SBOM_GENERATION_TIMEOUT", "600"))
+    layouts = sorted(
+        (item.stat().st_mtime, item.path) for item in os.scandir(layouts_dir) if item.is_dir() and not item.name.startswith(".tmp-")
+    )
+    for mtime, path in layouts:
+        if total_bytes <= SBOM_OCI_CACHE_MAX_BYTES or time.time() - mtime < grace:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total_bytes = _prune_oci_blobs()
 
-                command = _build_command(tool, image_ref, sbom_format, prefer_local=prefer_local)
-                command_preview = " ".join(shlex.quote(token) for token in command)
-                success, output_or_error = _run_command(command, extra_env=auth_kwargs)
-                record: Dict[str, Any] = {
-                    "image_ref": image_ref,
-                    "tool": tool,
-                    "format": sbom_format,
-                    "command": command_preview,
-                    "success": success,
-                }
 
-                if success:
-                    filename = _build_filename(image_ref, tool, sbom_format)
-                    zip_file.writestr(f"{folder}/{filename}", output_or_error)
-                    saved_path = _write_sbom_to_disk(output_or_error, filename)
-                    record.update({"filename": filename, "saved_path": saved_path})
-                    app.logger.info("SBOM success [%s %s %s] -> %s", image_ref, tool, sbom_format, filename)
-                else:
-                    had_failure = True
-                    friendly = _friendly_error(output_or_error)
-                    record["error"] = friendly
-                    app.logger.warning("SBOM failure [%s %s %s]: %s", image_ref, tool, sbom_format, friendly)
-                    zip_file.writestr(f"errors/{folder}-{tool}-{sbom_format}.txt", friendly)
+@functools.lru_cache(maxsize=None)
+def _tool_version(tool: str) -> str:
+    """Return the installed version of a scanner (memoized for the process lifetime)."""
+    command = [tool, "version"] if tool == "syft" else [tool, "--version"]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, check=False, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return "unknown"
+    match = re.search(r"^Version:\s*(\S+)", completed.stdout, re.MULTILINE)
+    return match.group(1) if match else "unknown"
 
-                results.append(record)
-                completed += 1
-                if progress_cb:
-                    progress_cb(
-                        {
-                            "type": "record",
-                            "record": record,
-                            "completed": completed,
-                            "total": total,
-                        }
-                    )
 
-            entry["cleanup_message"] = _cleanup_image(image_ref)
-            if progress_cb:
-                progress_cb(
-                    {
-                        "type": "cleanup",
-                        "image_ref": image_ref,
-                        "message": entry["cleanup_message"],
-                        "completed": completed,
-                        "total": total,
-                    }
-                )
+def _scan_chain(tool: str, sbom_formats: List[str], profile: str = DEFAULT_SCAN_PROFILE) -> str:
+    """Name the command chain a scan of ``sbom_formats`` runs, for result cache keys ("" for a direct scan).
 
-    zip_buffer.seek(0)
-    zip_bytes = zip_buffer.getvalue()
-    zip_filename = f"sboms-batch-{uuid.uuid4().hex}.zip"
-    zip_token = _cache_download(zip_bytes, zip_filename, mimetype="application/zip")
-    zip_saved_path = _write_bytes_to_disk(zip_bytes, zip_filename)
+    Trivy writes several formats by converting a native JSON report scanned with ``--scanners``,
+    which differs in content from its direct single-format output; Syft writes every format from
+    one catalog either way.
+    """
+    if tool == "trivy" and len(sbom_formats) > 1:
+        return "report:" + (SCAN_PROFILES[profile]["trivy_scanners"] or TRIVY_MULTI_FORMAT_SCANNERS)
+    return ""
 
-    if progress_cb:
-        progress_cb(
-            {
-                "type": "zip_ready",
-                "zip_token": zip_token,
-                "zip_filename": zip_filename,
-                "zip_saved_path": zip_saved_path,
-                "completed": completed,
-                "total": total,
-                "had_failures": had_failure,
-            }
-        )
 
-    return {
-        "success": True,
-        "all_succeeded": not had_failure,
-        "had_failures": had_failure,
-        "zip_token": zip_token,
-        "zip_filename": zip_filename,
-        "zip_saved_path": zip_saved_path,
-        "records": results,
-    }
+def _result_cache_path(
+    image_digest: str, tool: str, sbom_format: str, profile: str = DEFAULT_SCAN_PROFILE, chain: str = ""
+) -> str:
+    parts = [image_digest, tool, _tool_version(tool), sbom_format]
+    # Default-profile direct-scan keys predate profiles and chains, so existing cache entries stay valid.
+    if profile != DEFAULT_SCAN_PROFILE:
+        parts.append(profile)
+    if chain:
+        parts.append(chain)
+    key = "|".join(parts)
+    extension = SUPPORTED_FORMATS[sbom_format].get("extension", "json")
+    return os.path.join(SBOM_RESULT_CACHE_DIR, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.{extension}")
 
 
-@app.route("/api/sbom/all", methods=["POST"])
-def api_sbom_all():
-    """Generate SBOMs for all tool/format combinations for a single image and bundle them as ZIP."""
-    payload = request.get_json(silent=True) or {}
-    image_ref = (payload.get("image_ref") or "").strip()
-    registry_username = payload.get("registry_username") or ""
-    registry_password = payload.get("registry_password") or ""
+def _result_cache_get(
+    image_digest: str, tool: str, sbom_format: str, profile: str = DEFAULT_SCAN_PROFILE, chain: str = ""
+) -> Optional[str]:
+    """Return the path of a cached SBOM and refresh its LRU position (file mtime), or None on a miss."""
+    path = _result_cache_path(image_digest, tool, sbom_format, profile, chain)
+    try:
+        os.utime(path)
+    except OSError:
+        return None
+    return path
 
-    if not image_ref:
-        return jsonify({"success": False, "error": "Docker image reference is required (example: nginx:latest)."}), 400
 
+def _result_cache_put(
+    image_digest: str,
+    tool: str,
+    sbom_format: str,
+    source_path: str,
+    profile: str = DEFAULT_SCAN_PROFILE,
+    chain: str = "",
+) -> None:
+    """Link (or copy) an SBOM file into the result cache, then evict least-recently-used entries over the size budget."""
+    path = _result_cache_path(image_digest, tool, sbom_format, profile, chain)
+    os.makedirs(SBOM_RESULT_CACHE_DIR, exist_ok=True)
+    tmp_path = os.path.join(SBOM_RESULT_CACHE_DIR, f".tmp-{uuid.uuid4().hex}")
     try:
-        entry = _prepare_single_entry(image_ref)
-    except Exception as exc:  # noqa: BLE001 - return friendly message
-        return jsonify({"success": False, "error": str(exc)}), 400
+        _link_or_copy(source_path, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        _discard_file(tmp_path)
+    _evict_result_cache()
 
-    bulk_result = _generate_bulk_sboms([entry], registry_username=registry_username, registry_password=registry_password)
-    had_failures = bulk_result.get("had_failures", False)
-    status_code = 200
 
-    return (
-        jsonify(
-            {
-                "success": True,
-                "all_succeeded": not had_failures,
-                "had_failures": had_failures,
-                "image_ref": image_ref,
-                "records": bulk_result["records"],
-                "zip_download_token": bulk_result["zip_token"],
-                "zip_filename": bulk_result["zip_filename"],
-                "zip_saved_path": bulk_result["zip_saved_path"],
-            }
-        ),
-        status_code,
-    )
+def _evict_result_cache() -> None:
+    entries = []
+    with os.scandir(SBOM_RESULT_CACHE_DIR) as it:
+        for item in it:
+            if item.is_file() and not item.name.startswith(".tmp-"):
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= SBOM_RESULT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
 
 
-@app.route("/api/sbom/all/stream", methods=["POST"])
-def api_sbom_all_stream():
-    """Stream progress for the 4-pattern ZIP generation using SSE-style events."""
-    payload = request.get_json(silent=True) or {}
-    image_ref = (payload.get("image_ref") or "").strip()
-    registry_username = payload.get("registry_username") or ""
-    registry_password = payload.get("registry_password") or ""
+# Per-request artifacts in SBOM_OUTPUT_DIR are named "<uuid4 hex>-<filename>" (see _new_output_path).
+_OUTPUT_NAME = re.compile(r"^[0-9a-f]{32}-")
 
-    if not image_ref:
-        return (
-            jsonify({"success": False, "error": "Docker image reference is required (example: nginx:latest)."}),
-            400,
-        )
 
-    try:
-        entry = _prepare_single_entry(image_ref)
-    except Exception as exc:  # noqa: BLE001 - return friendly message
-        return jsonify({"success": False, "error": str(exc)}), 400
+def _file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
-    def stream_events():
-        q: SimpleQueue = SimpleQueue()
-        sentinel = object()
 
-        def push(event: Dict[str, Any]):
-            event.setdefault("image_ref", image_ref)
-            q.put(event)
+class _SbomArchive:
+    """Content-addressed storage for generated SBOMs with quota-based garbage collection.
 
-        def worker():
+    Each unique payload is kept once under ``SBOM_ARCHIVE_DIR`` (named by its SHA-256) and
+    per-request files are hard links to it; a SQLite index records object sizes and last use.
+    ``collect()`` deletes per-request files past the age quota and, oldest first, while they
+    exceed the byte quota, then drops objects nothing links to any more. Files touched within
+    the scan timeout are never collected, so running requests keep their outputs.
+    """
+
+    def __init__(self, db_path: str, objects_dir: str):
+        self.db_path = db_path
+        self.objects_dir = objects_dir
+        self._gc_thread: Optional[threading.Thread] = None
+        self._gc_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS archive_objects (
+                    digest TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return _sqlite_connection(self.db_path)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def store(self, path: str) -> None:
+        """Archive the content of ``path``; if it is already archived, ``path`` becomes a link to that copy."""
+        digest = _file_sha256(path)
+        object_path = self._object_path(digest)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        deduplicated = False
+        try:
+            os.link(path, object_path)
+        except FileExistsError:
+            tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+            try:
+                os.link(object_path, tmp_path)
+                os.replace(tmp_path, path)
+                # Shared inode: refreshing it keeps the new link from looking old to the GC.
+                os.utime(path)
+                deduplicated = True
+            except FileNotFoundError:
+                # Collected between the two links; keep the freshly written copy un-archived.
+                return
+            finally:
+                _discard_file(tmp_path)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO archive_objects (digest, size, created_at, last_used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(digest) DO UPDATE SET last_used = excluded.last_used",
+                (digest, os.path.getsize(path), now, now),
+            )
+        store = _metrics()
+        if deduplicated and store is not None:
+            store.inc("sbom_archive_dedup_hits_total", {})
+
+    def object_for(self, path: str) -> Optional[str]:
+        """Return the archived object ``path`` is a link to, or None."""
+        try:
+            stat = os.stat(path)
+            if stat.st_nlink < 2:
+                return None
+            object_path = self._object_path(_file_sha256(path))
+            return object_path if os.stat(object_path).st_ino == stat.st_ino else None
+        except OSError:
+            return None
+
+    def total_bytes(self) -> int:
+        return self._connect().execute("SELECT COALESCE(SUM(size), 0) FROM archive_objects").fetchone()[0]
+
+    def start_gc(self) -> None:
+        with self._gc_lock:
+            if self._gc_thread is None and SBOM_ARCHIVE_GC_INTERVAL > 0:
+                self._gc_thread = threading.Thread(target=self._gc_loop, name="sbom-archive-gc", daemon=True)
+                self._gc_thread.start()
+
+    def _gc_loop(self) -> None:
+        while True:
+            try:
+                self.collect()
+            except Exception as exc:  # noqa: BLE001 - a failed sweep is retried next interval
+                app.logger.warning("SBOM archive GC failed: %s", exc)
+            time.sleep(SBOM_ARCHIVE_GC_INTERVAL)
+
+    def collect(self) -> None:
+        """Apply the age and byte quotas to ``SBOM_OUTPUT_DIR``; only one worker process sweeps at a time."""
+        if not os.path.isdir(SBOM_OUTPUT_DIR):
+            return
+        with open(os.path.join(SBOM_OUTPUT_DIR, ".archive-gc.lock"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            self._collect_outputs()
+            self._collect_objects()
+            _collect_offset_indexes()
+
+    def _collect_outputs(self) -> None:
+        now = time.time()
+        grace = int(os.environ.get("SBOM_GENERATION_TIMEOUT", "600"))
+        entries = []
+        variant_bytes: Dict[str, int] = collections.Counter()
+        with os.scandir(SBOM_OUTPUT_DIR) as it:
+            for item in it:
+                if not _OUTPUT_NAME.match(item.name) or not item.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:
+                    continue
+                base, extension = os.path.splitext(item.path)
+                if extension in ENCODING_SUFFIXES.values():
+                    # Compressed variants are accounted to, and removed with, the file they belong to.
+                    variant_bytes[base] += stat.st_size
+                    continue
+                entries.append((stat.st_mtime, item.path, stat.st_ino, stat.st_size))
+        entries = [(mtime, path, ino, size + variant_bytes[path]) for mtime, path, ino, size in entries]
+        # Hard links share an inode: count its bytes once and only free them with its last name.
+        names_per_inode = collections.Counter(ino for _, _, ino, _ in entries)
+        total_bytes = sum({ino: size for _, _, ino, size in entries}.values())
+        removed = 0
+        for mtime, path, ino, size in sorted(entries):
+            if now - mtime < grace:
+                break
+            expired = SBOM_ARCHIVE_MAX_AGE > 0 and now - mtime > SBOM_ARCHIVE_MAX_AGE
+            over_quota = SBOM_ARCHIVE_MAX_BYTES > 0 and total_bytes > SBOM_ARCHIVE_MAX_BYTES
+            if not expired and not over_quota:
+                break
+            for variant in [path] + [path + suffix for suffix in ENCODING_SUFFIXES.values()]:
+                _discard_file(variant)
+            removed += 1
+            names_per_inode[ino] -= 1
+            if not names_per_inode[ino]:
+                total_bytes -= size
+        if removed:
+            app.logger.info("SBOM archive GC removed %d files; %d bytes remain", removed, total_bytes)
+
+    def _collect_objects(self) -> None:
+        if not os.path.isdir(self.objects_dir):
+            return
+        grace = int(os.environ.get("SBOM_GENERATION_TIMEOUT", "600"))
+        dropped = []
+        for shard in os.scandir(self.objects_dir):
+            if not shard.is_dir():
+                continue
+            with os.scandir(shard.path) as it:
+                for item in it:
+                    try:
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    if stat.st_nlink <= 1 and time.time() - stat.st_mtime > grace:
+                        os.remove(item.path)
+                        dropped.append((item.name,))
+        if dropped:
+            with self._connect() as conn:
+                conn.executemany("DELETE FROM archive_objects WHERE digest = ?", dropped)
+
+
+@functools.lru_cache(maxsize=None)
+def _archive() -> _SbomArchive:
+    archive = _SbomArchive(SBOM_ARCHIVE_DB, SBOM_ARCHIVE_DIR)
+    archive.start_gc()
+    return archive
+
+
+def _archive_output(path: str) -> None:
+    """Deduplicate a freshly written per-request file against the archive (best effort)."""
+    archive = _archive()
+    if not SBOM_ARCHIVE_DEDUP:
+        return
+    try:
+        archive.store(path)
+    except (OSError, sqlite3.Error) as exc:
+        app.logger.warning("Could not archive %s: %s", path, exc)
+
+
+def _link_or_copy(source_path: str, target_path: str) -> None:
+    """Hard-link ``source_path`` to ``target_path``, copying when links are not possible (e.g. across filesystems)."""
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+
+class _DockerError(RuntimeError):
+    """Raised when the Docker Engine API answers with an error."""
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a unix domain socket (the Docker Engine API socket)."""
+
+    def __init__(self, socket_path: str, timeout: float = 60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class _DockerClient:
+    """Minimal Docker Engine API client that keeps one keep-alive connection per thread."""
+
+    def __init__(self, docker_host: str):
+        self.docker_host = docker_host
+        self._local = threading.local()
+        self._ping_lock = threading.Lock()
+        self._ping_checked_at: Optional[float] = None
+        self._ping_ok = False
+
+    def _new_connection(self, timeout: float) -> http.client.HTTPConnection:
+        parsed = urllib.parse.urlparse(self.docker_host)
+        if parsed.scheme == "unix":
+            return _UnixHTTPConnection(parsed.path, timeout=timeout)
+        if parsed.scheme in {"tcp", "http"}:
+            return http.client.HTTPConnection(parsed.hostname or "localhost", parsed.port or 2375, timeout=timeout)
+        raise ValueError(f"Unsupported DOCKER_HOST: {self.docker_host}")
+
+    def _close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def _request(
+        self, method: str, path: str, timeout: float, headers: Optional[Dict[str, str]] = None
+    ) -> http.client.HTTPResponse:
+        """Send a request on this thread's connection, reconnecting once if the daemon dropped it."""
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = self._new_connection(timeout)
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                conn.request(method, path, headers=headers or {})
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest, BrokenPipeError, ConnectionResetError):
+                self._close()
+                if attempt:
+                    raise
+            except (OSError, http.client.HTTPException):
+                self._close()
+                raise
+        raise AssertionError("unreachable")
+
+    @staticmethod
+    def _error_message(resp: http.client.HTTPResponse, body: bytes) -> str:
+        try:
+            return json.loads(body.decode("utf-8")).get("message") or f"HTTP {resp.status}"
+        except ValueError:
+            return body.decode("utf-8", errors="replace").strip() or f"HTTP {resp.status}"
+
+    def ping(self) -> bool:
+        resp = self._request("GET", "/_ping", timeout=5)
+        resp.read()
+        return resp.status == 200
+
+    def available(self) -> bool:
+        """Return whether the daemon answers /_ping, caching the answer for ``SBOM_DOCKER_PING_TTL`` seconds."""
+        with self._ping_lock:
+            if self._ping_checked_at is not None and time.monotonic() - self._ping_checked_at < SBOM_DOCKER_PING_TTL:
+                return self._ping_ok
+        try:
+            with _stage_timer("docker_probe"):
+                ok = self.ping()
+        except (OSError, http.client.HTTPException, ValueError):
+            ok = False
+        with self._ping_lock:
+            self._ping_checked_at = time.monotonic()
+            self._ping_ok = ok
+        return ok
+
+    def inspect_image(self, image_ref: str) -> Optional[Dict[str, Any]]:
+        resp = self._request("GET", f"/images/{urllib.parse.quote(image_ref, safe='')}/json", timeout=30)
+        body = resp.read()
+        if resp.status == 404:
+            return None
+        if resp.status != 200:
+            raise _DockerError(self._error_message(resp, body))
+        return json.loads(body.decode("utf-8"))
+
+    def pull_image(
+        self,
+        image_ref: str,
+        registry_auth: Optional[str] = None,
+        progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+        timeout: float = 300,
+    ) -> None:
+        """Pull an image, passing each streamed progress message to ``progress_cb``."""
+        headers = {"X-Registry-Auth": registry_auth} if registry_auth else {}
+        query = urllib.parse.urlencode({"fromImage": image_ref})
+        deadline = time.monotonic() + timeout
+        resp = self._request("POST", f"/images/create?{query}", timeout=timeout, headers=headers)
+        if resp.status != 200:
+            raise _DockerError(self._error_message(resp, resp.read()))
+        try:
+            for line in iter(resp.readline, b""):
+                if time.monotonic() > deadline:
+                    raise TimeoutError("image pull exceeded its deadline")
+                line = line.strip()
+                if not line:
+                    continue
+                message = json.loads(line.decode("utf-8"))
+                if message.get("error"):
+                    raise _DockerError(message["error"])
+                if progress_cb:
+                    progress_cb(message)
+        except BaseException:
+            # The stream was abandoned mid-response, so this connection cannot be reused.
+            self._close()
+            raise
+
+    def remove_image(self, image_ref: str, force: bool = True) -> None:
+        query = urllib.parse.urlencode({"force": "1" if force else "0"})
+        resp = self._request("DELETE", f"/images/{urllib.parse.quote(image_ref, safe='')}?{query}", timeout=60)
+        body = resp.read()
+        if resp.status != 200:
+            raise _DockerError(self._error_message(resp, body))
+
+
+@functools.lru_cache(maxsize=None)
+def _docker_client() -> _DockerClient:
+    return _DockerClient(DOCKER_HOST)
+
+
+def _registry_auth_header(image_ref: str, registry_username: str = "", registry_password: str = "") -> Optional[str]:
+    """Build the X-Registry-Auth header for a pull, falling back to ``auths`` in the Docker config file."""
+    registry, _, _ = _split_image_ref(image_ref)
+    server = "https://index.docker.io/v1/" if registry == "registry-1.docker.io" else registry
+    if not registry_username:
+        config_path = os.path.join(os.environ.get("DOCKER_CONFIG", os.path.expanduser("~/.docker")), "config.json")
+        try:
+            with open(config_path, "r", encoding="utf-8") as fp:
+                auths = json.load(fp).get("auths", {})
+            encoded = (auths.get(server) or auths.get(registry) or {}).get("auth", "")
+            registry_username, _, registry_password = base64.b64decode(encoded).decode("utf-8").partition(":")
+        except (OSError, ValueError):
+            return None
+        if not registry_username:
+            return None
+    auth = {"username": registry_username, "password": registry_password, "serveraddress": server}
+    return base64.urlsafe_b64encode(json.dumps(auth).encode("utf-8")).decode("ascii")
+
+
+def _cleanup_image(image_ref: str) -> str:
+    """Attempt to delete the pulled image through the Docker Engine API if configured."""
+    if not DELETE_IMAGE_AFTER_SUCCESS:
+        return "Image cleanup skipped (DELETE_IMAGE_AFTER_SUCCESS not enabled)."
+
+    client = _docker_client()
+    if not client.available():
+        return "Docker daemon not accessible; cannot remove image."
+    try:
+        client.remove_image(image_ref, force=True)
+    except (socket.timeout, TimeoutError):
+        return "Image cleanup timed out."
+    except (_DockerError, OSError, http.client.HTTPException) as exc:
+        return f"Image cleanup failed: {exc or 'unknown error'}"
+    return f"Removed image: {image_ref}"
+
+
+class _TrivyServer:
+    """Supervise a local ``trivy server`` so Trivy scans share its warm cache and DB handles.
+
+    A monitor thread, started on first use, starts the server, health-checks it via
+    ``/healthz`` and restarts it when it crashes (with exponential backoff). A healthy
+    server started by another worker process on the same address is reused rather
+    than duplicated. Scans never wait for a (re)start: ``url()`` returns None, meaning
+    standalone mode, until the server has passed a health check.
+    """
+
+    def __init__(self, listen: str):
+        self.listen = listen
+        self.base_url = f"http://{listen}"
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._healthy_until = 0.0
+        self._retry_after = 0.0
+        self._backoff = 1.0
+        self._monitor: Optional[threading.Thread] = None
+
+    def url(self) -> Optional[str]:
+        if time.monotonic() < self._healthy_until and not self._crashed():
+            return self.base_url
+        with self._lock:
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._monitor_loop, name="trivy-server-monitor", daemon=True)
+                self._monitor.start()
+        self._wake.set()
+        return None
+
+    def mark_unhealthy(self) -> None:
+        self._healthy_until = 0.0
+        self._wake.set()
+
+    def _crashed(self) -> bool:
+        return self._process is not None and self._process.poll() is not None
+
+    def _check(self) -> bool:
+        try:
+            with urllib.request.urlopen(f"{self.base_url}/healthz", timeout=2) as resp:
+                ok = resp.status == 200
+        except (urllib.error.URLError, OSError, http.client.HTTPException):
+            ok = False
+        # Valid until the monitor's next check plus slack, so scans never block on /healthz.
+        self._healthy_until = time.monotonic() + 2 * SBOM_TRIVY_SERVER_CHECK_INTERVAL if ok else 0.0
+        return ok
+
+    def _ensure_running(self) -> bool:
+        if not self._crashed() and self._check():
+            return True
+        if time.monotonic() < self._retry_after:
+            return False
+        if self._start():
+            self._backoff = 1.0
+            return True
+        self._retry_after = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, 300.0)
+        return False
+
+    def _start(self) -> bool:
+        self.stop()
+        os.makedirs(SBOM_OUTPUT_DIR, exist_ok=True)
+        command = ["trivy", "server", "--listen", self.listen]
+        app.logger.info("Starting Trivy server: %s", " ".join(command))
+        try:
+            with open(os.path.join(SBOM_OUTPUT_DIR, "trivy-server.log"), "ab") as log_file:
+                self._process = subprocess.Popen(
+                    command, stdout=log_file, stderr=subprocess.STDOUT, env=_build_env(), start_new_session=True
+                )
+        except OSError as exc:
+            app.logger.warning("Trivy server could not be started: %s", exc)
+            return False
+        store = _metrics()
+        if store is not None:
+            store.inc("sbom_trivy_server_starts_total", {})
+        deadline = time.monotonic() + SBOM_TRIVY_SERVER_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self._check():
+                return True
+            if self._crashed():
+                # Most likely the address is taken; use the server already there if it is healthy.
+                app.logger.warning("Trivy server exited during startup (rc=%s)", self._process.returncode)
+                self._process = None
+                return self._check()
+            time.sleep(0.25)
+        app.logger.warning("Trivy server did not become healthy within %ss", SBOM_TRIVY_SERVER_STARTUP_TIMEOUT)
+        self.stop()
+        return False
+
+    def _monitor_loop(self) -> None:
+        while True:
+            try:
+                self._ensure_running()
+            except Exception as exc:  # noqa: BLE001 - keep supervising whatever went wrong
+                app.logger.warning("Trivy server supervision failed: %s", exc)
+            self._wake.wait(
+                max(0.0, self._retry_after - time.monotonic()) or SBOM_TRIVY_SERVER_CHECK_INTERVAL
+            )
+            self._wake.clear()
+
+    def stop(self) -> None:
+        process, self._process = self._process, None
+        self._healthy_until = 0.0
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+@functools.lru_cache(maxsize=None)
+def _trivy_server() -> Optional[_TrivyServer]:
+    if not SBOM_TRIVY_SERVER or SBOM_TRIVY_SERVER_URL:
+        return None
+    server = _TrivyServer(SBOM_TRIVY_SERVER_LISTEN)
+    atexit.register(server.stop)
+    return server
+
+
+def _trivy_server_url() -> Optional[str]:
+    """Return the Trivy server to scan against, or None to run Trivy standalone."""
+    if SBOM_TRIVY_SERVER_URL:
+        return SBOM_TRIVY_SERVER_URL
+    server = _trivy_server()
+    return server.url() if server is not None else None
+
+
+# Client-mode failures that point at the server rather than the image (twirp is Trivy's RPC layer).
+_TRIVY_SERVER_ERRORS = ("connection refused", "connection reset", "twirp")
+
+
+def _trivy_server_failed(error: str) -> bool:
+    text = (error or "").lower()
+    return any(marker in text for marker in _TRIVY_SERVER_ERRORS)
+
+
+_SQLITE_LOCAL = threading.local()
+
+
+def _sqlite_connection(db_path: str) -> sqlite3.Connection:
+    """Return this thread's connection to ``db_path`` (WAL mode so several processes can share it)."""
+    connections = getattr(_SQLITE_LOCAL, "connections", None)
+    if connections is None:
+        connections = _SQLITE_LOCAL.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        connections[db_path] = conn
+    return conn
+
+
+class _MemoryTokenStore:
+    """Keep download tokens in the process-local ``DOWNLOAD_CACHE`` (single worker only)."""
+
+    def put(self, token: str, path: str, filename: str, mimetype: str) -> None:
+        DOWNLOAD_CACHE[token] = (path, filename, mimetype)
+        if len(DOWNLOAD_CACHE) > MAX_DOWNLOAD_CACHE:
+            oldest_token = next(iter(DOWNLOAD_CACHE))
+            DOWNLOAD_CACHE.pop(oldest_token, None)
+
+    def get(self, token: str) -> Optional[Tuple[str, str, str]]:
+        return DOWNLOAD_CACHE.get(token)
+
+    def total_bytes(self) -> int:
+        total = 0
+        for path, *_ in list(DOWNLOAD_CACHE.values()):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+
+class _SqliteTokenStore:
+    """Share download tokens between processes: a SQLite index of files under ``SBOM_OUTPUT_DIR``.
+
+    Entries expire after ``SBOM_DOWNLOAD_TTL`` seconds, and the oldest are dropped once the
+    referenced files exceed ``SBOM_DOWNLOAD_MAX_BYTES``. The referenced files themselves
+    (e.g. ``saved_path``) are left to the archive GC.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS download_tokens (
+                    token TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    mimetype TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_download_tokens_created ON download_tokens (created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return _sqlite_connection(self.db_path)
+
+    def put(self, token: str, path: str, filename: str, mimetype: str) -> None:
+        size = os.path.getsize(path)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO download_tokens (token, path, filename, mimetype, size, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (token, path, filename, mimetype, size, time.time()),
+            )
+        self._evict()
+
+    def get(self, token: str) -> Optional[Tuple[str, str, str]]:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT path, filename, mimetype FROM download_tokens WHERE token = ? AND created_at >= ?",
+                (token, time.time() - SBOM_DOWNLOAD_TTL),
+            )
+            .fetchone()
+        )
+        if not row or not os.path.isfile(row[0]):
+            return None
+        return row[0], row[1], row[2]
+
+    def total_bytes(self) -> int:
+        return self._connect().execute("SELECT COALESCE(SUM(size), 0) FROM download_tokens").fetchone()[0]
+
+    def _evict(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM download_tokens WHERE created_at < ?", (time.time() - SBOM_DOWNLOAD_TTL,))
+            total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM download_tokens").fetchone()[0]
+            if total_bytes <= SBOM_DOWNLOAD_MAX_BYTES:
+                return
+            evicted = []
+            for token, size in conn.execute("SELECT token, size FROM download_tokens ORDER BY created_at"):
+                if total_bytes <= SBOM_DOWNLOAD_MAX_BYTES:
+                    break
+                evicted.append((token,))
+                total_bytes -= size
+            conn.executemany("DELETE FROM download_tokens WHERE token = ?", evicted)
+
+
+@functools.lru_cache(maxsize=None)
+def _token_store() -> "_MemoryTokenStore | _SqliteTokenStore":
+    if SBOM_TOKEN_STORE == "memory":
+        return _MemoryTokenStore()
+    return _SqliteTokenStore(SBOM_TOKEN_DB)
+
+
+def _cache_download(path: str, filename: str, mimetype: str = "application/json") -> str:
+    """Register a generated file under a new token so the user can fetch it without re-generation."""
+    token = uuid.uuid4().hex
+    _token_store().put(token, path, filename, mimetype)
+    if mimetype == "application/json" and SBOM_PRECOMPRESS:
+        _precompress_executor().submit(_precompress, path)
+    return token
+
+
+@functools.lru_cache(maxsize=None)
+def _precompress_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="sbom-precompress")
+
+
+def _compress_bytes(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=SBOM_ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=SBOM_GZIP_LEVEL, mtime=0)
+
+
+def _precompress(path: str) -> None:
+    """Write ``path.zst`` / ``path.gz`` next to a downloadable file so downloads never compress on the fly.
+
+    Variants of archived content are kept next to the archive object too, so identical SBOMs are
+    compressed once and later copies only get hard links.
+    """
+    try:
+        if os.path.getsize(path) < SBOM_COMPRESS_MIN_BYTES:
+            return
+        archived = _archive().object_for(path) if SBOM_ARCHIVE_DEDUP else None
+        for encoding in SBOM_PRECOMPRESS:
+            target = path + ENCODING_SUFFIXES[encoding]
+            tmp_path = f"{target}.tmp-{uuid.uuid4().hex}"
+            archived_variant = archived + ENCODING_SUFFIXES[encoding] if archived else None
+            try:
+                if archived_variant and os.path.isfile(archived_variant):
+                    try:
+                        os.link(archived_variant, tmp_path)
+                        os.replace(tmp_path, target)
+                        continue
+                    except FileNotFoundError:
+                        pass
+                with open(path, "rb") as source, open(tmp_path, "wb") as raw:
+                    if encoding == "zstd":
+                        zstandard.ZstdCompressor(level=SBOM_ZSTD_LEVEL).copy_stream(source, raw)
+                    else:
+                        with gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=SBOM_GZIP_LEVEL, mtime=0) as dst:
+                            shutil.copyfileobj(source, dst, 1024 * 1024)
+                os.replace(tmp_path, target)
+                if archived_variant:
+                    with contextlib.suppress(OSError):
+                        os.link(target, archived_variant)
+            finally:
+                _discard_file(tmp_path)
+    except OSError as exc:
+        app.logger.warning("Precompression of %s failed: %s", path, exc)
+
+
+def _negotiate_encoding(accept_encoding: str, available: List[str]) -> Optional[str]:
+    """Return the first of ``available`` (server preference order) the client accepts, or None for identity."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = re.search(r"q\s*=\s*([0-9.]+)", params)
+        try:
+            accepted[name.strip().lower()] = float(quality.group(1)) if quality else 1.0
+        except ValueError:
+            continue
+    for encoding in available:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _safe_image_folder(image_ref: str) -> str:
+    """Sanitize an image reference for use as a folder name inside the ZIP."""
+    cleaned_image = image_ref.replace("docker.io/", "").replace("index.docker.io/", "")
+    cleaned_image = re.sub(r"[^A-Za-z0-9_.:/-]+", "-", cleaned_image)
+    cleaned_image = cleaned_image.replace("/", "-").replace(":", "-").replace("@", "-")
+    return re.sub(r"-{2,}", "-", cleaned_image).strip("-") or "image"
+
+
+def _prepare_single_entry(image_ref: str) -> Dict[str, Any]:
+    """Normalize a single user-provided image reference into the entry shape."""
+    ref = (image_ref or "").strip()
+    if not ref:
+        raise ValueError("Docker image reference is required.")
+    tag = "latest"
+    if ":" in ref and not ref.endswith(":/"):
+        _, _, tail = ref.partition("/")
+        name_part = tail or ref
+        if ":" in name_part:
+            tag = name_part.split(":", 1)[1] or "latest"
+    return {"name": ref, "image_ref": ref, "tag": tag, "pull_count": None, "description": ""}
+
+
+class _MetricsStore:
+    """Counters, gauges and histograms in a SQLite file shared by all worker processes.
+
+    Counter and histogram samples accumulate across processes; gauges are kept per
+    process and only live processes are summed when scraped.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS metric_samples (
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (name, labels, pid)
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return _sqlite_connection(self.db_path)
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> str:
+        return ",".join(f'{key}="{_escape_label(str(value))}"' for key, value in sorted(labels.items()))
+
+    def _add(self, samples: List[Tuple[str, str, int, float]]) -> None:
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT INTO metric_samples (name, labels, pid, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (name, labels, pid) DO UPDATE SET value = value + excluded.value",
+                    samples,
+                )
+        except sqlite3.Error as exc:
+            # Metrics must never fail a scan.
+            app.logger.warning("Failed to record metric %s: %s", samples[0][0], exc)
+
+    def inc(self, name: str, labels: Dict[str, str], amount: float = 1.0) -> None:
+        self._add([(name, self._labels(labels), 0, amount)])
+
+    def gauge_add(self, name: str, labels: Dict[str, str], amount: float) -> None:
+        self._add([(name, self._labels(labels), os.getpid(), amount)])
+
+    def observe(self, name: str, labels: Dict[str, str], value: float, buckets: Tuple[float, ...]) -> None:
+        # Every bucket is written (adding 0 above the value) so each series exposes the full ``le`` set.
+        samples = [
+            (f"{name}_bucket", self._labels({**labels, "le": _format_bound(bound)}), 0, 1.0 if value <= bound else 0.0)
+            for bound in buckets
+        ]
+        samples.append((f"{name}_bucket", self._labels({**labels, "le": "+Inf"}), 0, 1.0))
+        samples.append((f"{name}_sum", self._labels(labels), 0, value))
+        samples.append((f"{name}_count", self._labels(labels), 0, 1.0))
+        self._add(samples)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """Return (name, labels, value) rows, dropping gauge rows of processes that have exited."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name, labels, pid, value FROM metric_samples ORDER BY name, labels").fetchall()
+            dead = {pid for _, _, pid, _ in rows if pid and not _pid_alive(pid)}
+            if dead:
+                conn.executemany("DELETE FROM metric_samples WHERE pid = ?", [(pid,) for pid in dead])
+        totals: Dict[Tuple[str, str], float] = collections.OrderedDict()
+        for name, labels, pid, value in rows:
+            if pid not in dead:
+                totals[(name, labels)] = totals.get((name, labels), 0.0) + value
+        return [(name, labels, value) for (name, labels), value in totals.items()]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_bound(bound: float) -> str:
+    return str(int(bound)) if float(bound).is_integer() else str(bound)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def _metrics() -> Optional[_MetricsStore]:
+    return _MetricsStore(SBOM_METRICS_DB) if SBOM_METRICS else None
+
+
+METRIC_HELP: Dict[str, Tuple[str, str]] = {
+    "sbom_stage_duration_seconds": ("histogram", "Time spent per SBOM pipeline stage."),
+    "sbom_failures_total": ("counter", "Failed SBOM generations by error category."),
+    "sbom_scans_in_flight": ("gauge", "Scanner subprocesses currently running."),
+    "sbom_download_cache_bytes": ("gauge", "Bytes referenced by download tokens."),
+    "sbom_subprocess_peak_rss_bytes": ("histogram", "Peak resident set size of each scanner subprocess."),
+    "sbom_subprocess_cpu_seconds": ("histogram", "User plus system CPU time of each scanner subprocess."),
+    "sbom_trivy_server_starts_total": ("counter", "Starts (including restarts) of the supervised Trivy server."),
+    "sbom_scan_concurrency_limit": ("gauge", "Current adaptive limit of concurrent scanner runs."),
+    "sbom_archive_bytes": ("gauge", "Bytes of unique SBOM content in the deduplicated archive."),
+    "sbom_archive_dedup_hits_total": ("counter", "Generated SBOMs whose content was already archived."),
+}
+
+
+def _observe(name: str, labels: Dict[str, str], value: float, buckets: Tuple[float, ...] = DURATION_BUCKETS) -> None:
+    store = _metrics()
+    if store is not None:
+        store.observe(name, labels, value, buckets)
+
+
+def _count_failure(tool: str, raw_error: str) -> None:
+    store = _metrics()
+    if store is not None:
+        store.inc("sbom_failures_total", {"tool": tool, "category": _error_category(raw_error)})
+
+
+class _Trace:
+    """Spans recorded while serving one request (a child trace scopes them to one image or scan).
+
+    Spans bubble up to the request-level trace, which streams each one as a ``span`` progress
+    event and may carry the request's cProfile profiles.
+    """
+
+    def __init__(
+        self,
+        parent: Optional["_Trace"] = None,
+        progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+        attrs: Optional[Dict[str, Any]] = None,
+        name: str = "",
+    ):
+        self.parent = parent
+        self.root: _Trace = parent.root if parent is not None else self
+        self.started = time.monotonic()
+        self.attrs = {**(parent.attrs if parent is not None else {}), **(attrs or {})}
+        self.spans: List[Dict[str, Any]] = []
+        self.progress_cb = progress_cb
+        self.profiles: Optional[List[cProfile.Profile]] = None
+        self.profile_path: Optional[str] = None
+        if parent is None and SBOM_PROFILE_SAMPLE_RATE > 0 and random.random() < SBOM_PROFILE_SAMPLE_RATE:
+            self.profiles = []
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            self.profile_path = os.path.join(SBOM_PROFILE_DIR, f"{stamp}-{name or 'request'}-{uuid.uuid4().hex[:8]}.prof")
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, tool: str, sbom_format: str, started: float, duration: float) -> None:
+        span = {
+            **self.attrs,
+            "stage": stage,
+            "tool": tool,
+            "format": sbom_format,
+            "start": round(started - self.root.started, 3),
+            "duration": round(duration, 3),
+        }
+        trace: Optional[_Trace] = self
+        while trace is not None:
+            with trace._lock:
+                trace.spans.append(span)
+            trace = trace.parent
+        if self.root.progress_cb:
+            self.root.progress_cb({"type": "span", **span})
+
+    def timings(self, sbom_format: Optional[str] = None) -> Dict[str, float]:
+        """Seconds per stage, summed over spans (stages nest: ``scan`` includes ``command``).
+
+        With ``sbom_format`` only spans covering that format (or no particular format) count;
+        the request-level trace also reports its wall-clock ``total``.
+        """
+        totals: Dict[str, float] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            if sbom_format and span["format"] and sbom_format not in span["format"].split("+"):
+                continue
+            totals[span["stage"]] = totals.get(span["stage"], 0.0) + span["duration"]
+        timings = {stage: round(seconds, 3) for stage, seconds in totals.items()}
+        if self.parent is None:
+            timings["total"] = round(time.monotonic() - self.started, 3)
+        return timings
+
+    def add_profile(self, profiler: cProfile.Profile) -> None:
+        with self._lock:
+            self.profiles.append(profiler)
+
+    def dump_profile(self) -> None:
+        """Merge the per-thread profiles into ``profile_path`` and prune old dumps."""
+        if not self.profiles:
+            return
+        try:
+            os.makedirs(SBOM_PROFILE_DIR, exist_ok=True)
+            stats = pstats.Stats(self.profiles[0])
+            for profiler in self.profiles[1:]:
+                stats.add(profiler)
+            stats.dump_stats(self.profile_path)
+            dumps = sorted(
+                (entry.path for entry in os.scandir(SBOM_PROFILE_DIR) if entry.name.endswith(".prof")),
+                key=os.path.getmtime,
+            )
+            for stale in dumps[: max(0, len(dumps) - SBOM_PROFILE_KEEP)]:
+                os.remove(stale)
+        except OSError as exc:
+            app.logger.warning("Failed to write profile %s: %s", self.profile_path, exc)
+            self.profile_path = None
+
+
+_TRACE: "contextvars.ContextVar[Optional[_Trace]]" = contextvars.ContextVar("sbom_trace", default=None)
+
+
+@contextlib.contextmanager
+def _tracing(name: str = "", progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None, **attrs: Any):
+    """Trace the enclosed block: a request-level trace at the outermost call, a child trace inside one."""
+    parent = _TRACE.get()
+    trace = _Trace(parent, progress_cb if parent is None else None, attrs, name)
+    token = _TRACE.set(trace)
+    profiler = None
+    if trace.profiles is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield trace
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            trace.add_profile(profiler)
+        _TRACE.reset(token)
+        if trace.profiles is not None:
+            trace.dump_profile()
+
+
+def _traced(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap ``fn`` for an executor so it runs in the caller's trace (and is profiled when the request is)."""
+    context = contextvars.copy_context()
+    trace = _TRACE.get()
+
+    def run(*args: Any, **kwargs: Any) -> Any:
+        if trace is None or trace.root.profiles is None:
+            return context.run(fn, *args, **kwargs)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return context.run(fn, *args, **kwargs)
+        finally:
+            profiler.disable()
+            trace.root.add_profile(profiler)
+
+    return run
+
+
+def _trace_span(stage: str, tool: str, sbom_format: str, started: float) -> None:
+    """Record a span that started at ``started`` (monotonic) and ends now on the current trace."""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.record(stage, tool, sbom_format, started, time.monotonic() - started)
+
+
+@contextlib.contextmanager
+def _stage_timer(stage: str, tool: str = "", sbom_format: str = ""):
+    """Record the duration of the enclosed block in ``sbom_stage_duration_seconds`` and on the current trace."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        _observe(
+            "sbom_stage_duration_seconds",
+            {"stage": stage, "tool": tool, "format": sbom_format},
+            time.monotonic() - started,
+        )
+        _trace_span(stage, tool, sbom_format, started)
+
+
+def _sample_order(row: Tuple[str, str, float]) -> Tuple[str, str, int, float]:
+    """Group each series' buckets (ascending ``le``), then its sum and count."""
+    name, labels, _ = row
+    le_match = re.search(r'(?:^|,)le="([^"]*)"', labels)
+    series = re.sub(r'(?:^|,)le="[^"]*"', "", labels)
+    family = re.sub(r"_(bucket|sum|count)$", "", name)
+    rank = {"bucket": 0, "sum": 1, "count": 2}.get(name.rsplit("_", 1)[-1], 0) if family != name else 0
+    return family, series, rank, float(le_match.group(1)) if le_match else 0.0
+
+
+def _render_metrics() -> str:
+    """Render all samples in the Prometheus text exposition format."""
+    store = _metrics()
+    rows = store.samples() if store is not None else []
+    rows.append(("sbom_download_cache_bytes", "", float(_token_store().total_bytes())))
+    rows.append(("sbom_archive_bytes", "", float(_archive().total_bytes())))
+    families: Dict[str, List[str]] = collections.OrderedDict((name, []) for name in METRIC_HELP)
+    for name, labels, value in sorted(rows, key=_sample_order):
+        family = re.sub(r"_(bucket|sum|count)$", "", name) if name not in METRIC_HELP else name
+        text_value = str(int(value)) if value.is_integer() else repr(value)
+        sample = f"{name}{{{labels}}} {text_value}" if labels else f"{name} {text_value}"
+        families.setdefault(family, []).append(sample)
+    lines: List[str] = []
+    for family, samples in families.items():
+        kind, help_text = METRIC_HELP.get(family, ("untyped", ""))
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def _build_env(registry_username: str = "", registry_password: str = "") -> Dict[str, str]:
+    """Build environment for registry auth if provided."""
+    env = os.environ.copy()
+    # Avoid per-run Trivy DB/telemetry overhead for multi-pattern generation unless explicitly overridden.
+    env.setdefault("TRIVY_SKIP_DB_UPDATE", TRIVY_SKIP_DB_UPDATE_DEFAULT)
+    env.setdefault("TRIVY_SKIP_POLICY_UPDATE", TRIVY_SKIP_POLICY_UPDATE_DEFAULT)
+    env.setdefault("TRIVY_NO_PROGRESS", TRIVY_NO_PROGRESS_DEFAULT)
+    env.setdefault("TRIVY_DISABLE_TELEMETRY", TRIVY_DISABLE_TELEMETRY_DEFAULT)
+    if registry_username:
+        env["SYFT_REGISTRY_AUTH_USERNAME"] = registry_username
+        env["TRIVY_USERNAME"] = registry_username
+    if registry_password:
+        env["SYFT_REGISTRY_AUTH_PASSWORD"] = registry_password
+        env["TRIVY_PASSWORD"] = registry_password
+    return env
+
+
+def _docker_available() -> bool:
+    """Check whether Docker daemon is reachable (cached ping; keeps timeout very short)."""
+    return _docker_client().available()
+
+
+def _ensure_image_cached(
+    image_ref: str,
+    extra_env: Dict[str, str] | None = None,
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> str:
+    """Best-effort: avoid repeated pulls by checking local cache; pull if missing.
+
+    Pull progress is summarised as ``pull`` events (layers done / seen) through
+    ``progress_cb``, at most once per second plus on every status line without a layer.
+
+    Note: When running inside a container without Docker socket access, this will
+    quickly return as the Engine API socket cannot be reached.
+    """
+    if not _docker_available():
+        return "Docker daemon not accessible; tool will fetch image directly."
+
+    client = _docker_client()
+    try:
+        if client.inspect_image(image_ref) is not None:
+            return "Image already present locally."
+    except (socket.timeout, TimeoutError):
+        return "Image inspect timed out; tool will fetch image directly."
+    except (_DockerError, OSError, http.client.HTTPException) as exc:
+        app.logger.info("Image inspect failed for %s: %s", image_ref, exc)
+
+    layers: Dict[str, str] = {}
+    last_emit = 0.0
+
+    def on_progress(message: Dict[str, Any]) -> None:
+        nonlocal last_emit
+        status = message.get("status", "")
+        is_layer = "progressDetail" in message and bool(message.get("id"))
+        if is_layer:
+            layers[message["id"]] = status
+        now = time.monotonic()
+        if progress_cb and (not is_layer or now - last_emit >= 1.0):
+            last_emit = now
+            progress_cb(
+                {
+                    "type": "pull",
+                    "image_ref": image_ref,
+                    "message": status,
+                    "layers_done": sum(1 for value in layers.values() if value in {"Pull complete", "Already exists"}),
+                    "layers_total": len(layers),
+                }
+            )
+
+    auth = _registry_auth_header(image_ref, **(extra_env or {}))
+    try:
+        client.pull_image(image_ref, registry_auth=auth, progress_cb=on_progress, timeout=300)
+    except (socket.timeout, TimeoutError):
+        return "Image pull timed out; tool will attempt to fetch."
+    except (_DockerError, OSError, http.client.HTTPException, ValueError) as exc:
+        return f"Image pull failed (continuing with tool fetch): {exc or 'unknown error'}"
+    return "Image pulled successfully."
+
+
+_PROGRESS_PHASES: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("fetching", re.compile(r"\b(pull|pulling|download|fetch|loading image|copying)", re.IGNORECASE)),
+    ("cataloging", re.compile(r"\b(catalog|analy[sz]|detect|scanning|indexing)", re.IGNORECASE)),
+    ("writing", re.compile(r"\b(convert|encod|writ|report)", re.IGNORECASE)),
+]
+_PROGRESS_PACKAGES = re.compile(r"\b(?:packages?|pkgs?)\s*[=:]?\s*\"?(\d+)|(\d+)\s+packages?\b", re.IGNORECASE)
+_PROGRESS_LAYERS = re.compile(r"\blayers?\b\D{0,12}?(\d+)\s*(?:/|of)\s*(\d+)", re.IGNORECASE)
+
+
+def _parse_progress_line(line: str) -> Dict[str, Any]:
+    """Extract phase / package count / layer progress from one Syft or Trivy log line (empty if none)."""
+    parsed: Dict[str, Any] = {}
+    for phase, pattern in _PROGRESS_PHASES:
+        if pattern.search(line):
+            parsed["phase"] = phase
+            break
+    packages = _PROGRESS_PACKAGES.search(line)
+    if packages:
+        parsed["packages"] = int(packages.group(1) or packages.group(2))
+    layers = _PROGRESS_LAYERS.search(line)
+    if layers:
+        parsed["layers_done"], parsed["layers_total"] = int(layers.group(1)), int(layers.group(2))
+    return parsed
+
+
+class _ProgressTracker:
+    """Consume scanner stderr: keep a bounded tail for errors and forward throttled ``progress`` events."""
+
+    def __init__(self, tool: str, progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.tail: "collections.deque[str]" = collections.deque(maxlen=SBOM_STDERR_TAIL_LINES)
+        self.state: Dict[str, Any] = {"type": "progress", "tool": tool, "phase": "starting"}
+        self.progress_cb = progress_cb
+        self._last_emit = 0.0
+        self._dirty = False
+
+    def feed(self, line: str) -> None:
+        line = line.rstrip()
+        if not line:
+            return
+        self.tail.append(line)
+        app.logger.debug("[sbom-progress] %s", line)
+        parsed = _parse_progress_line(line)
+        if not parsed:
+            return
+        phase_changed = parsed.get("phase", self.state["phase"]) != self.state["phase"]
+        self.state.update(parsed)
+        self.state["message"] = line[:200]
+        self._dirty = True
+        if phase_changed or time.monotonic() - self._last_emit >= SBOM_PROGRESS_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        if not (self.progress_cb and self._dirty):
+            return
+        self._dirty = False
+        self._last_emit = time.monotonic()
+        try:
+            self.progress_cb(dict(self.state))
+        except Exception as exc:  # noqa: BLE001 - a broken listener must not stop stderr from draining
+            app.logger.warning("Progress callback failed: %s", exc)
+
+    def drain(self, pipe) -> None:
+        for line in iter(pipe.readline, ""):
+            self.feed(line)
+        pipe.close()
+        self.flush()
+
+
+def _wait_with_rusage(
+    process: subprocess.Popen, timeout: float, cancelled: Optional[Callable[[], bool]] = None
+) -> Optional[Any]:
+    """Wait like ``Popen.wait`` but reap the child with ``wait4`` to get its own resource usage.
+
+    Raises ``_ScanCancelled`` (leaving the child running) as soon as ``cancelled()`` returns True.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.005
+    while True:
+        try:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        except ChildProcessError:
+            process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            return None
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return usage
+        if cancelled is not None and cancelled():
+            raise _ScanCancelled(f"Cancelled: {process.args[0]}")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.1)
+
+
+# Set by the ASGI entry point (asgi.py): scanner pipes and exits are then watched by its event loop
+# instead of two reader threads per subprocess. The thread that started the scan still waits for it
+# and runs the progress and cancellation callbacks.
+_SUBPROCESS_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _watch_process(
+    process: subprocess.Popen,
+    tracker: "_ProgressTracker",
+    stdout_chunks: List[str],
+    timeout: float,
+    cancelled: Optional[Callable[[], bool]],
+) -> Optional[Any]:
+    """Drain the scanner's pipes and wait for it; return its rusage.
+
+    Blocks the calling thread either way; under ASGI the draining happens on ``_SUBPROCESS_LOOP``
+    rather than on two reader threads. On timeout or cancellation the process group is killed
+    before the exception propagates.
+    """
+    loop = _SUBPROCESS_LOOP
+    if loop is not None and not loop.is_closed() and hasattr(os, "pidfd_open"):
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except OSError:
+            pidfd = None
+        if pidfd is not None:
+            return _watch_process_on_loop(loop, process, pidfd, tracker, stdout_chunks, timeout, cancelled)
+
+    stderr_thread = threading.Thread(target=tracker.drain, args=(process.stderr,), daemon=True)
+    stderr_thread.start()
+    stdout_thread = None
+    if process.stdout is not None:
+        stdout_thread = threading.Thread(target=lambda: stdout_chunks.append(process.stdout.read()), daemon=True)
+        stdout_thread.start()
+    try:
+        return _wait_with_rusage(process, timeout, cancelled)
+    except (subprocess.TimeoutExpired, _ScanCancelled):
+        _kill_process_group(process)
+        raise
+    finally:
+        stderr_thread.join(timeout=5)
+        if stdout_thread is not None:
+            stdout_thread.join(timeout=5)
+
+
+def _watch_process_on_loop(
+    loop: asyncio.AbstractEventLoop,
+    process: subprocess.Popen,
+    pidfd: int,
+    tracker: "_ProgressTracker",
+    stdout_chunks: List[str],
+    timeout: float,
+    cancelled: Optional[Callable[[], bool]],
+) -> Optional[Any]:
+    """Watch the process on ``loop`` while this thread feeds its stderr lines to ``tracker``.
+
+    The loop only reads the pipes and queues the lines; progress callbacks (which may write to
+    SQLite) and the ``cancelled`` check run here, so a slow listener never stalls the loop.
+    """
+    lines: "queue.SimpleQueue[Optional[str]]" = queue.SimpleQueue()
+    stop = threading.Event()
+    future = asyncio.run_coroutine_threadsafe(
+        _watch_process_async(process, pidfd, lines.put, stdout_chunks, timeout, stop.is_set), loop
+    )
+    future.add_done_callback(lambda _future: lines.put(None))
+    try:
+        while True:
+            if cancelled is not None and not stop.is_set() and cancelled():
+                stop.set()
+            try:
+                line = lines.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if line is None:
+                break
+            tracker.feed(line)
+    finally:
+        tracker.flush()
+    return future.result()
+
+
+def _read_pipe_on_loop(
+    loop: asyncio.AbstractEventLoop, pipe: Any, on_line: Optional[Callable[[str], None]], chunks: List[str]
+) -> "asyncio.Future[None]":
+    """Read ``pipe`` via a reader callback until EOF, passing lines to ``on_line`` (or collecting ``chunks``)."""
+    fd = pipe.fileno()
+    os.set_blocking(fd, False)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    finished = loop.create_future()
+    partial = [""]
+
+    def on_readable() -> None:
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        text = decoder.decode(data, final=not data)
+        if on_line is None:
+            chunks.append(text)
+        else:
+            *lines, partial[0] = (partial[0] + text).split("\n")
+            for line in lines:
+                on_line(line)
+            if not data and partial[0]:
+                on_line(partial[0])
+        if not data:
+            loop.remove_reader(fd)
+            pipe.close()
+            if not finished.done():
+                finished.set_result(None)
+
+    loop.add_reader(fd, on_readable)
+    return finished
+
+
+async def _watch_process_async(
+    process: subprocess.Popen,
+    pidfd: int,
+    on_stderr_line: Callable[[str], None],
+    stdout_chunks: List[str],
+    timeout: float,
+    cancelled: Optional[Callable[[], bool]],
+) -> Optional[Any]:
+    """Event-loop twin of the threaded watcher in ``_watch_process``; stderr lines go to ``on_stderr_line``.
+
+    The child is spawned by ``_run_command`` as usual (same session, limits and environment)
+    and watched through a pidfd rather than ``asyncio.create_subprocess_exec``, so it can
+    still be reaped with ``wait4`` and keep its per-process rusage.
+    """
+    loop = asyncio.get_running_loop()
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    pipes = [_read_pipe_on_loop(loop, process.stderr, on_stderr_line, [])]
+    if process.stdout is not None:
+        pipes.append(_read_pipe_on_loop(loop, process.stdout, None, stdout_chunks))
+    deadline = loop.time() + timeout
+    try:
+        try:
+            while not exited.done():
+                if cancelled is not None and cancelled():
+                    raise _ScanCancelled(f"Cancelled: {process.args[0]}")
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(process.args, timeout)
+                await asyncio.wait({exited}, timeout=min(0.2, remaining))
+        except (subprocess.TimeoutExpired, _ScanCancelled):
+            for sig in (signal.SIGTERM, signal.SIGKILL):
+                try:
+                    os.killpg(process.pid, sig)
+                except ProcessLookupError:
+                    break
+                await asyncio.wait({exited}, timeout=5)
+                if exited.done():
+                    break
+            raise
+        finally:
+            if exited.done():
+                _, status, usage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+        await asyncio.wait(pipes, timeout=5)
+        return usage
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+        for pipe in (process.stderr, process.stdout):
+            if pipe is not None and not pipe.closed:
+                loop.remove_reader(pipe.fileno())
+                pipe.close()
+
+
+def _limit_scanner_resources(pid: int) -> None:
+    """Lower a freshly started scanner's priority and cap its memory and CPU time.
+
+    Applied from the parent right after ``Popen`` rather than in a ``preexec_fn``, which is not
+    safe to run after fork in this multi-threaded process. CPU time already used still counts
+    against ``RLIMIT_CPU``, and processes the scanner starts later inherit the limits.
+    """
+    try:
+        if SBOM_SCAN_NICE:
+            niceness = min(19, os.getpriority(os.PRIO_PROCESS, 0) + SBOM_SCAN_NICE)
+            os.setpriority(os.PRIO_PROCESS, pid, niceness)
+        if SBOM_SCAN_MAX_MEMORY:
+            resource.prlimit(pid, resource.RLIMIT_AS, (SBOM_SCAN_MAX_MEMORY, SBOM_SCAN_MAX_MEMORY))
+        if SBOM_SCAN_MAX_CPU_SECONDS:
+            # SIGXCPU at the soft limit, SIGKILL shortly after if the tool ignores it.
+            resource.prlimit(pid, resource.RLIMIT_CPU, (SBOM_SCAN_MAX_CPU_SECONDS, SBOM_SCAN_MAX_CPU_SECONDS + 5))
+    except ProcessLookupError:
+        pass
+    except OSError as exc:
+        app.logger.warning("Could not apply resource limits to scanner pid %s: %s", pid, exc)
+
+
+def _kill_process_group(process: subprocess.Popen) -> None:
+    """Stop a scanner and everything it spawned: SIGTERM to its process group, SIGKILL after a grace period."""
+    for sig, grace in ((signal.SIGTERM, 5), (signal.SIGKILL, None)):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            break
+        try:
+            process.wait(timeout=grace)
+            break
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def _record_rusage(tool: str, usage: Any) -> None:
+    if usage is None:
+        return
+    # ru_maxrss is reported in KiB on Linux.
+    _observe("sbom_subprocess_peak_rss_bytes", {"tool": tool}, usage.ru_maxrss * 1024.0, RSS_BUCKETS)
+    _observe("sbom_subprocess_cpu_seconds", {"tool": tool}, usage.ru_utime + usage.ru_stime, CPU_BUCKETS)
+
+
+def _run_command(
+    command: List[str],
+    extra_env: Dict[str, str] | None = None,
+    cwd: Optional[str] = None,
+    output_path: Optional[str] = None,
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+    env_overrides: Optional[Dict[str, str]] = None,
+) -> Tuple[bool, str]:
+    """Execute the CLI tool, following its stderr for progress, and return (success, output_or_error).
+
+    With ``output_path`` the tool writes its stdout straight into that file and the
+    path is returned on success instead of the captured output. Stderr is read by a
+    single thread: the last ``SBOM_STDERR_TAIL_LINES`` lines are kept for the error
+    message, and recognised progress lines reach ``progress_cb`` as throttled
+    ``progress`` events. The child's peak RSS and CPU time are recorded as metrics.
+
+    The tool runs in its own process group, which is killed on timeout or once
+    ``cancelled()`` returns True (then ``_ScanCancelled`` is raised).
+    """
+    timeout = int(os.environ.get("SBOM_GENERATION_TIMEOUT", "600"))
+    command_preview = _command_preview(command, env_overrides)
+    app.logger.info("SBOM command start: %s", command_preview)
+    started = time.monotonic()
+
+    stdout_file = open(output_path, "wb") if output_path else None
+    try:
+        process = subprocess.Popen(
+            command,
+            stdout=stdout_file or subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            env={**_build_env(**(extra_env or {})), **(env_overrides or {})},
+            cwd=cwd,
+            start_new_session=True,
+        )
+    except FileNotFoundError:
+        _discard_file(output_path)
+        return False, (
+            "The requested SBOM tool is not installed inside the container. "
+            "If you are developing locally, please install both Syft and Trivy, "
+            "or build/run the provided Docker image."
+        )
+    except OSError as exc:
+        _discard_file(output_path)
+        return False, f"Failed to start SBOM tool: {exc}"
+    finally:
+        # The child holds its own descriptor; the parent's copy is not needed once it has started.
+        if stdout_file:
+            stdout_file.close()
+    _limit_scanner_resources(process.pid)
+
+    tool = os.path.basename(command[0])
+    metrics = _metrics()
+    if metrics is not None:
+        metrics.gauge_add("sbom_scans_in_flight", {}, 1)
+    tracker = _ProgressTracker(tool, progress_cb)
+    stdout_chunks: List[str] = []
+    try:
+        usage = _watch_process(process, tracker, stdout_chunks, timeout, cancelled)
+        _record_rusage(tool, usage)
+    except subprocess.TimeoutExpired:
+        _discard_file(output_path)
+        return False, "SBOM generation timed out. Try a smaller image or increase the timeout."
+    except _ScanCancelled:
+        app.logger.info("SBOM command cancelled: %s", command_preview)
+        _discard_file(output_path)
+        raise
+    finally:
+        if metrics is not None:
+            metrics.gauge_add("sbom_scans_in_flight", {}, -1)
+        _trace_span("command", tool, "", started)
+    stdout_data = "".join(stdout_chunks)
+
+    rc = process.returncode
+    if rc != 0:
+        if output_path:
+            with open(output_path, "r", encoding="utf-8", errors="replace") as fp:
+                stdout_data = fp.read(4096)
+            _discard_file(output_path)
+        details = "\n".join(filter(None, [(stdout_data or "").strip(), "\n".join(tracker.tail), _signal_reason(rc)]))
+        snippet = (details or "").strip()
+        if len(snippet) > 1200:
+            snippet = snippet[:1200] + "...(truncated)"
+        app.logger.error("SBOM command failed (rc=%s): %s | stderr/summary: %s", rc, command_preview, snippet)
+        return False, details or "SBOM tool failed without providing output."
+
+    app.logger.info("SBOM command finished (rc=%s)", rc)
+    return True, output_path or stdout_data
+
+
+def _signal_reason(returncode: int) -> str:
+    """Explain a scanner killed by a signal (usually a resource limit or the OOM killer)."""
+    if returncode == -signal.SIGXCPU:
+        return "Scanner stopped: CPU time resource limit exceeded (SIGXCPU)."
+    if returncode == -signal.SIGKILL:
+        return "Scanner killed (SIGKILL): resource limit reached or out of memory."
+    if returncode < 0:
+        try:
+            return f"Scanner terminated by signal {signal.Signals(-returncode).name}."
+        except ValueError:
+            return f"Scanner terminated by signal {-returncode}."
+    return ""
+
+
+def _discard_file(path: Optional[str]) -> None:
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _run_multi_format(
+    tool: str,
+    image_ref: str,
+    sbom_formats: List[str],
+    prefer_local: bool = False,
+    extra_env: Dict[str, str] | None = None,
+    oci_layout: Optional[str] = None,
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    trivy_server: Optional[str] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+    profile: str = DEFAULT_SCAN_PROFILE,
+) -> Tuple[str, Dict[str, Tuple[bool, str]]]:
+    """Catalog the image once with ``tool`` and return (command_preview, {format: (success, saved_path_or_error)}).
+
+    Each produced SBOM is moved to its own fresh path under ``SBOM_OUTPUT_DIR`` and deduplicated
+    against the archive.
+    """
+    steps = _build_multi_format_commands(
+        tool,
+        image_ref,
+        sbom_formats,
+        prefer_local=prefer_local,
+        oci_layout=oci_layout,
+        trivy_server=trivy_server,
+        profile=profile,
+    )
+    profile_env = _profile_env(tool, profile)
+    command_preview = " && ".join(_command_preview(command, profile_env) for command, _ in steps)
+    os.makedirs(SBOM_OUTPUT_DIR, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix=".scan-", dir=SBOM_OUTPUT_DIR)
+    results: Dict[str, Tuple[bool, str]] = {}
+
+    try:
+        for command, written_formats in steps:
+            success, output_or_error = _run_command(
+                command,
+                extra_env=extra_env,
+                cwd=workdir,
+                progress_cb=progress_cb,
+                cancelled=cancelled,
+                env_overrides=profile_env,
+            )
+            if not success:
+                if not written_formats:
+                    # The shared catalog step failed, so nothing downstream can be produced.
+                    for sbom_format in sbom_formats:
+                        results.setdefault(sbom_format, (False, output_or_error))
+                    break
+                for sbom_format in written_formats:
+                    results[sbom_format] = (False, output_or_error)
+                continue
+            if tool == "trivy" and oci_layout and not written_formats:
+                # Every format converted from the report inherits its artifact name.
+                _name_trivy_artifact(os.path.join(workdir, TRIVY_REPORT_FILENAME), image_ref, oci_layout)
+
+            for sbom_format in written_formats:
+                filename = _build_filename(image_ref, tool, sbom_format, profile)
+                output_path = os.path.join(workdir, filename)
+                if not os.path.isfile(output_path):
+                    results[sbom_format] = (False, f"SBOM tool did not write the {sbom_format} output.")
+                    continue
+                saved_path = _new_output_path(filename)
+                os.replace(output_path, saved_path)
+                _archive_output(saved_path)
+                results[sbom_format] = (True, saved_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return command_preview, results
+
+
+def _scan_formats(
+    tool: str,
+    image_ref: str,
+    sbom_formats: List[str],
+    prefer_local: bool = False,
+    extra_env: Dict[str, str] | None = None,
+    image_digest: Optional[str] = None,
+    use_cache: bool = True,
+    oci_layout: Optional[str] = None,
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    client: str = "",
+    cancelled: Optional[Callable[[], bool]] = None,
+    profile: str = DEFAULT_SCAN_PROFILE,
+) -> Tuple[str, Dict[str, Tuple[bool, str]], Dict[str, str]]:
+    """Produce every requested format for one tool, serving digest-cached results before scanning.
+
+    Every successful SBOM is written to its own file under ``SBOM_OUTPUT_DIR``; returns
+    (command_preview, {format: (success, saved_path_or_error)}, {format: "hit"|"miss"|"bypass"}).
+    Scanning waits for one of ``client``'s slots in the fair scan scheduler.
+    """
+    cacheable = SBOM_RESULT_CACHE and bool(image_digest)
+    chain = _scan_chain(tool, sbom_formats, profile)
+    outputs: Dict[str, Tuple[bool, str]] = {}
+    cache_status: Dict[str, str] = {}
+    for sbom_format in sbom_formats:
+        cached = _result_cache_get(image_digest, tool, sbom_format, profile, chain) if cacheable and use_cache else None
+        if cached is not None:
+            saved_path = _new_output_path(_build_filename(image_ref, tool, sbom_format, profile))
+            _link_or_copy(cached, saved_path)
+            outputs[sbom_format] = (True, saved_path)
+            cache_status[sbom_format] = "hit"
+        else:
+            cache_status[sbom_format] = "miss" if cacheable and use_cache else "bypass"
+
+    pending = [sbom_format for sbom_format in sbom_formats if sbom_format not in outputs]
+    slot = _scan_slots().acquire(client, cancelled, tool) if pending else contextlib.nullcontext()
+    scan_timer = _stage_timer("scan", tool, "+".join(pending)) if pending else contextlib.nullcontext()
+    try:
+        with slot, scan_timer:
+            command_preview, scanned = _scan_admitted(
+                tool, image_ref, sbom_formats, pending, prefer_local, extra_env, oci_layout, progress_cb, cancelled, profile
+            )
+    except _ScanOverloaded as exc:
+        app.logger.warning("Scan of %s with %s rejected: %s", image_ref, tool, exc)
+        command_preview = _command_preview(
+            _build_command(tool, image_ref, pending[0], prefer_local, profile=profile), _profile_env(tool, profile)
+        )
+        scanned = {sbom_format: (False, str(exc)) for sbom_format in pending}
+    outputs.update(scanned)
+
+    if cacheable and pending:
+        with _stage_timer("cache_write", tool, "+".join(pending)):
+            for sbom_format in pending:
+                success, output = outputs[sbom_format]
+                if success:
+                    try:
+                        _result_cache_put(image_digest, tool, sbom_format, output, profile, chain)
+                    except OSError as exc:
+                        app.logger.warning("Failed to store SBOM in result cache: %s", exc)
+
+    return command_preview, outputs, cache_status
+
+
+def _scan_admitted(
+    tool: str,
+    image_ref: str,
+    sbom_formats: List[str],
+    pending: List[str],
+    prefer_local: bool,
+    extra_env: Dict[str, str] | None,
+    oci_layout: Optional[str],
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]],
+    cancelled: Optional[Callable[[], bool]],
+    profile: str = DEFAULT_SCAN_PROFILE,
+) -> Tuple[str, Dict[str, Tuple[bool, str]]]:
+    """Scan once a slot is held: Trivy goes through the managed server, retried standalone if the server fails."""
+    trivy_server = _trivy_server_url() if tool == "trivy" and pending else None
+    command_preview, scanned = _scan_pending(
+        tool,
+        image_ref,
+        sbom_formats,
+        pending,
+        prefer_local,
+        extra_env,
+        oci_layout,
+        progress_cb,
+        trivy_server,
+        cancelled,
+        profile,
+    )
+    if trivy_server and any(not success and _trivy_server_failed(output) for success, output in scanned.values()):
+        app.logger.warning("Trivy server scan of %s failed; retrying in standalone mode", image_ref)
+        server = _trivy_server()
+        if server is not None:
+            server.mark_unhealthy()
+        for success, output in scanned.values():
+            if success:
+                _discard_file(output)
+        command_preview, scanned = _scan_pending(
+            tool, image_ref, sbom_formats, pending, prefer_local, extra_env, oci_layout, progress_cb, None, cancelled, profile
+        )
+    return command_preview, scanned
+
+
+def _scan_pending(
+    tool: str,
+    image_ref: str,
+    sbom_formats: List[str],
+    pending: List[str],
+    prefer_local: bool,
+    extra_env: Dict[str, str] | None,
+    oci_layout: Optional[str],
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]],
+    trivy_server: Optional[str] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+    profile: str = DEFAULT_SCAN_PROFILE,
+) -> Tuple[str, Dict[str, Tuple[bool, str]]]:
+    """Run the scanner for the formats not served from the cache; return (command_preview, outputs)."""
+    outputs: Dict[str, Tuple[bool, str]] = {}
+    profile_env = _profile_env(tool, profile)
+    # Formats left over from a partial cache hit still go through the chain the cache key names.
+    if len(pending) > 1 or (pending and _scan_chain(tool, sbom_formats, profile)):
+        command_preview, scanned = _run_multi_format(
+            tool,
+            image_ref,
+            pending,
+            prefer_local=prefer_local,
+            extra_env=extra_env,
+            oci_layout=oci_layout,
+            progress_cb=progress_cb,
+            trivy_server=trivy_server,
+            cancelled=cancelled,
+            profile=profile,
+        )
+        outputs.update(scanned)
+    elif pending:
+        command = _build_command(
+            tool,
+            image_ref,
+            pending[0],
+            prefer_local=prefer_local,
+            oci_layout=oci_layout,
+            trivy_server=trivy_server,
+            profile=profile,
+        )
+        command_preview = _command_preview(command, profile_env)
+        output_path = _new_output_path(_build_filename(image_ref, tool, pending[0], profile))
+        outputs[pending[0]] = _run_command(
+            command,
+            extra_env=extra_env,
+            output_path=output_path,
+            progress_cb=progress_cb,
+            cancelled=cancelled,
+            env_overrides=profile_env,
+        )
+        if outputs[pending[0]][0]:
+            if tool == "trivy" and oci_layout:
+                _name_trivy_artifact(output_path, image_ref, oci_layout)
+            _archive_output(output_path)
+    else:
+        command = _build_command(tool, image_ref, sbom_formats[0], prefer_local=prefer_local, profile=profile)
+        command_preview = _command_preview(command, profile_env)
+    return command_preview, outputs
+
+
+class _ScanCancelled(RuntimeError):
+    """Raised inside a scan once every caller waiting for it has gone away (e.g. closed its SSE stream)."""
+
+
+class _ScanOverloaded(RuntimeError):
+    """Raised when a scan waited longer than ``SBOM_QUEUE_TIMEOUT`` for a slot."""
+
+
+def _load_per_cpu() -> Optional[float]:
+    """1-minute load average divided by the CPU count (None where /proc is unavailable)."""
+    try:
+        with open("/proc/loadavg", "r", encoding="ascii") as fp:
+            return float(fp.read().split()[0]) / (os.cpu_count() or 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _available_memory() -> Optional[int]:
+    """Bytes of memory available to new scans: MemAvailable, capped by the cgroup v2 limit in containers."""
+    available = None
+    try:
+        with open("/proc/meminfo", "r", encoding="ascii") as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/memory.max", "r", encoding="ascii") as fp:
+            limit = fp.read().strip()
+        if limit != "max":
+            with open("/sys/fs/cgroup/memory.current", "r", encoding="ascii") as fp:
+                headroom = int(limit) - int(fp.read().strip())
+            available = headroom if available is None else min(available, headroom)
+    except (OSError, ValueError):
+        pass
+    return available
+
+
+class _ScanSlots:
+    """Fair admission of scanner runs within one process.
+
+    At most ``limit`` scans run at once and each client holds at most ``per_client`` of them.
+    A freed slot goes to the waiting client with the fewest running scans (ties in
+    round-robin order, first-come within a client), so a client queueing many scans
+    cannot starve the others.
+
+    With ``adaptive`` the limit moves between ``min_limit`` and ``max_limit``: it drops by
+    one while the host is overloaded, is halved when memory runs short, and grows by one
+    when the host has headroom and every slot is in use.
+    """
+
+    def __init__(self, max_limit: int, per_client: int, min_limit: int = 1, adaptive: bool = False):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = max_limit
+        self.per_client = per_client
+        self.adaptive = adaptive
+        self._next_adjust = 0.0
+        self._cond = threading.Condition()
+        self._running: Dict[str, int] = collections.Counter()
+        self._waiting: "collections.OrderedDict[str, collections.deque]" = collections.OrderedDict()
+
+    def _adapt(self) -> None:
+        now = time.monotonic()
+        if not self.adaptive or now < self._next_adjust:
+            return
+        self._next_adjust = now + ADAPTIVE_INTERVAL
+        load = _load_per_cpu()
+        available = _available_memory()
+        limit = self.limit
+        if available is not None and available < SBOM_MEMORY_RESERVE:
+            limit = max(self.min_limit, limit // 2)
+        elif load is not None and load > SBOM_ADAPTIVE_LOAD_HIGH:
+            limit = max(self.min_limit, limit - 1)
+        elif (
+            (load is None or load < SBOM_ADAPTIVE_LOAD_HIGH / 2)
+            and (available is None or available > 2 * SBOM_MEMORY_RESERVE)
+            and sum(self._running.values()) >= limit
+        ):
+            limit = min(self.max_limit, limit + 1)
+        if limit != self.limit:
+            app.logger.info("Scan concurrency limit %d -> %d (load/cpu=%s, available=%s)", self.limit, limit, load, available)
+            store = _metrics()
+            if store is not None:
+                store.gauge_add("sbom_scan_concurrency_limit", {}, limit - self.limit)
+            self.limit = limit
+
+    def _granted(self, client: str, ticket: object) -> bool:
+        self._adapt()
+        if sum(self._running.values()) >= self.limit or self._waiting[client][0] is not ticket:
+            return False
+        eligible = [name for name in self._waiting if self._running[name] < self.per_client]
+        return bool(eligible) and min(eligible, key=lambda name: self._running[name]) == client
+
+    @contextlib.contextmanager
+    def acquire(self, client: str, cancelled: Optional[Callable[[], bool]] = None, tool: str = ""):
+        ticket = object()
+        deadline = time.monotonic() + SBOM_QUEUE_TIMEOUT
+        with _stage_timer("queue", tool), self._cond:
+            self._waiting.setdefault(client, collections.deque()).append(ticket)
+            try:
+                while not self._granted(client, ticket):
+                    if cancelled is not None and cancelled():
+                        raise _ScanCancelled(f"Cancelled while queued: {client}")
+                    if time.monotonic() >= deadline:
+                        raise _ScanOverloaded(
+                            f"Scan not started within {SBOM_QUEUE_TIMEOUT:g}s: server overloaded "
+                            f"({sum(self._running.values())} of {self.limit} scan slots busy)."
+                        )
+                    self._cond.wait(timeout=0.5)
+                self._running[client] += 1
+            finally:
+                waiting = self._waiting[client]
+                waiting.remove(ticket)
+                if waiting:
+                    self._waiting.move_to_end(client)
+                else:
+                    del self._waiting[client]
+                self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[client] -= 1
+                if not self._running[client]:
+                    del self._running[client]
+                self._cond.notify_all()
+
+
+@functools.lru_cache(maxsize=None)
+def _scan_slots() -> _ScanSlots:
+    slots = _ScanSlots(
+        SBOM_MAX_CONCURRENT_SCANS, SBOM_CLIENT_MAX_SCANS, SBOM_MIN_CONCURRENT_SCANS, SBOM_ADAPTIVE_CONCURRENCY
+    )
+    store = _metrics()
+    if store is not None:
+        store.gauge_add("sbom_scan_concurrency_limit", {}, slots.limit)
+    return slots
+
+
+def _client_key() -> str:
+    """Identify the requesting client for scan admission (call inside a request context)."""
+    header_value = request.headers.get(SBOM_CLIENT_HEADER, "") if SBOM_CLIENT_HEADER else ""
+    return _client_identity(header_value, request.remote_addr)
+
+
+def _client_identity(header_value: str, remote_addr: Optional[str]) -> str:
+    """Client key from the SBOM_CLIENT_HEADER value (first hop) or the peer address."""
+    value = header_value.split(",")[0].strip()
+    return value or remote_addr or "unknown"
+
+
+class _Flight:
+    """One in-flight call: its eventual result plus the progress callbacks of every caller attached to it."""
+
+    def __init__(self, provides: FrozenSet[str] = frozenset()):
+        self.provides = provides
+        self.future: Future = Future()
+        self.subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self.cancel_checks: List[Optional[Callable[[], bool]]] = []
+
+    def cancelled(self) -> bool:
+        """True once every attached caller has been cancelled (callers without a check never are)."""
+        checks = list(self.cancel_checks)
+        return bool(checks) and all(check is not None and check() for check in checks)
+
+
+class _SingleFlight:
+    """Coalesce concurrent calls with the same key onto one execution (per process).
+
+    The first caller runs the work; callers arriving while it is in flight wait for the
+    same result (or exception) and receive the progress events published from then on.
+    A call that ``provides`` several parts (e.g. SBOM formats) also serves later calls
+    with the same key that need only some of them.
+    The work is told to stop (via its ``cancelled`` argument) only when every caller
+    attached to it has been cancelled; a cancelled follower stops waiting right away.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Any, List[_Flight]] = {}
+
+    def do(
+        self,
+        key: Any,
+        fn: Callable[[Callable[[Dict[str, Any]], None], Callable[[], bool]], Any],
+        progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+        provides: FrozenSet[str] = frozenset(),
+    ) -> Tuple[Any, bool]:
+        """Run ``fn(publish, cancelled)`` or join a running call that covers it; return (result, shared)."""
+        with self._lock:
+            flight = next((item for item in self._flights.get(key, []) if provides <= item.provides), None)
+            leader = flight is None
+            if leader:
+                flight = _Flight(provides)
+                self._flights.setdefault(key, []).append(flight)
+            if progress_cb:
+                flight.subscribers.append(progress_cb)
+            flight.cancel_checks.append(cancelled)
+        if not leader:
+            while True:
+                try:
+                    return flight.future.result(timeout=0.5), True
+                except FutureTimeoutError:
+                    if cancelled is not None and cancelled():
+                        with self._lock:
+                            if progress_cb in flight.subscribers:
+                                flight.subscribers.remove(progress_cb)
+                        raise _ScanCancelled("Cancelled while waiting for a shared scan")
+
+        def publish(event: Dict[str, Any]) -> None:
+            with self._lock:
+                subscribers = list(flight.subscribers)
+            for subscriber in subscribers:
+                subscriber(event)
+
+        try:
+            result = fn(publish, flight.cancelled)
+        except BaseException as exc:
+            self._land(key, flight)
+            flight.future.set_exception(exc)
+            raise
+        self._land(key, flight)
+        flight.future.set_result(result)
+        return result, False
+
+    def _land(self, key: Any, flight: _Flight) -> None:
+        with self._lock:
+            flights = self._flights.get(key, [])
+            if flight in flights:
+                flights.remove(flight)
+            if not flights:
+                self._flights.pop(key, None)
+
+
+_PREPARE_FLIGHTS = _SingleFlight()
+_SCAN_FLIGHTS = _SingleFlight()
+# Provided by scans that bypass the result cache, so no_cache requests never join one served from it.
+_UNCACHED_SCAN = "<uncached>"
+
+
+def _credential_fingerprint(auth_kwargs: Dict[str, str] | None) -> str:
+    """Identify the caller's registry credentials without keeping them in flight keys."""
+    auth_kwargs = auth_kwargs or {}
+    material = f"{auth_kwargs.get('registry_username', '')}\0{auth_kwargs.get('registry_password', '')}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _share_output(
+    saved_path: str, image_ref: str, tool: str, sbom_format: str, profile: str = DEFAULT_SCAN_PROFILE
+) -> str:
+    """Give a coalesced caller its own output file (a hard link to the leader's where possible)."""
+    shared_path = _new_output_path(_build_filename(image_ref, tool, sbom_format, profile))
+    _link_or_copy(saved_path, shared_path)
+    return shared_path
+
+
+def _coalesced_scan(
+    tool: str,
+    image_ref: str,
+    sbom_formats: List[str],
+    prefer_local: bool = False,
+    extra_env: Dict[str, str] | None = None,
+    image_digest: Optional[str] = None,
+    use_cache: bool = True,
+    oci_layout: Optional[str] = None,
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    client: str = "",
+    cancelled: Optional[Callable[[], bool]] = None,
+    profile: str = DEFAULT_SCAN_PROFILE,
+) -> Tuple[str, Dict[str, Tuple[bool, str]], Dict[str, str], bool]:
+    """``_scan_formats`` shared between overlapping concurrent requests; the last item tells whether it was shared.
+
+    Scanner ``progress`` events, tagged with the image and formats, reach every attached ``progress_cb``.
+
+    A request joins a running scan of the same reference for the same tool and profile from the same
+    source whose formats include all of its own (e.g. a single-format Syft request joins a bulk scan); a
+    resolved digest proves read access, otherwise the credentials must match. The scanner command
+    chain is part of the key, so a direct Trivy scan never receives a converted report, and a
+    ``use_cache=False`` request only joins scans that bypass the result cache too. The shared scan is
+    admitted under the first caller's ``client`` and killed only when every caller's ``cancelled``
+    check has fired.
+    """
+    key = (
+        image_ref,
+        image_digest or _credential_fingerprint(extra_env),
+        tool,
+        oci_layout,
+        profile,
+        _scan_chain(tool, sbom_formats, profile),
+    )
+    provides = frozenset(sbom_formats) | ({_UNCACHED_SCAN} if not use_cache else frozenset())
+    started = time.monotonic()
+    (command_preview, outputs, cache_status), shared = _SCAN_FLIGHTS.do(
+        key,
+        lambda publish, flight_cancelled: _scan_formats(
+            tool,
+            image_ref,
+            sbom_formats,
+            prefer_local=prefer_local,
+            extra_env=extra_env,
+            image_digest=image_digest,
+            use_cache=use_cache,
+            oci_layout=oci_layout,
+            progress_cb=lambda event: publish({**event, "image_ref": image_ref, "formats": list(sbom_formats)}),
+            client=client,
+            cancelled=flight_cancelled,
+            profile=profile,
+        ),
+        progress_cb=progress_cb,
+        cancelled=cancelled,
+        provides=provides,
+    )
+    if shared:
+        # The leader's trace holds the scan spans; this caller only records how long it waited.
+        _trace_span("coalesced", tool, "+".join(sbom_formats), started)
+        outputs = {
+            sbom_format: (success, _share_output(output, image_ref, tool, sbom_format, profile) if success else output)
+            for sbom_format, (success, output) in ((item, outputs[item]) for item in sbom_formats)
+        }
+        cache_status = {sbom_format: cache_status[sbom_format] for sbom_format in sbom_formats}
+    return command_preview, outputs, cache_status, shared
+
+
+def _prepare_image_source(
+    image_ref: str,
+    image_digest: Optional[str],
+    prefer_local: bool,
+    auth_kwargs: Dict[str, str],
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Tuple[str, Optional[str]]:
+    """Make the image available for scanning; return (prefetch_note, oci_layout_or_None).
+
+    Uses the Docker daemon cache when reachable, otherwise stages a local OCI layout
+    (keyed by ``image_digest``) so every scanner reads the same downloaded layers.
+    Concurrent requests for the same image share one pull and its progress events.
+    """
+    key = (image_ref, image_digest or _credential_fingerprint(auth_kwargs), prefer_local)
+    result, _ = _PREPARE_FLIGHTS.do(
+        key,
+        lambda publish, _cancelled: _fetch_image_source(image_ref, image_digest, prefer_local, auth_kwargs, publish),
+        progress_cb=progress_cb,
+    )
+    return result
+
+
+def _fetch_image_source(
+    image_ref: str,
+    image_digest: Optional[str],
+    prefer_local: bool,
+    auth_kwargs: Dict[str, str],
+    progress_cb: Callable[[Dict[str, Any]], None],
+) -> Tuple[str, Optional[str]]:
+    if prefer_local or not (SBOM_OCI_STAGING and image_digest):
+        with _stage_timer("pull"):
+            return _ensure_image_cached(image_ref, auth_kwargs, progress_cb=progress_cb), None
+    try:
+        with _stage_timer("oci_stage"):
+            layout_path, note = _stage_oci_layout(image_ref, image_digest, **auth_kwargs)
+    except (urllib.error.URLError, OSError, ValueError, KeyError) as exc:
+        app.logger.warning("OCI staging failed for %s: %s", image_ref, exc)
+        return f"OCI staging failed (tool will fetch image directly): {exc}", None
+    return note, layout_path
+
+
+def _needs_image_digest() -> bool:
+    return SBOM_RESULT_CACHE or SBOM_OCI_STAGING
+
+
+def _version_key(version: str) -> str:
+    """Return a key whose string order follows version order ("3.0.9" < "3.0.13"), epoch first."""
+    epoch, _, rest = version.partition(":") if re.match(r"^\d+:", version) else ("0", "", version)
+    tokens = [epoch] + re.findall(r"\d+|[A-Za-z]+", rest)
+    return ".".join(token.zfill(10) if token.isdigit() else token for token in tokens)
+
+
+def _spdx_component(package: Dict[str, Any]) -> Tuple[str, str, Optional[str], Optional[str]]:
+    purl = next(
+        (ref.get("referenceLocator") for ref in package.get("externalRefs") or [] if ref.get("referenceType") == "purl"),
+        None,
+    )
+    license_id = next(
+        (
+            value
+            for value in (package.get("licenseConcluded"), package.get("licenseDeclared"))
+            if value and value not in {"NOASSERTION", "NONE"}
+        ),
+        None,
+    )
+    return package.get("name") or "", package.get("versionInfo") or "", purl, license_id
+
+
+def _cyclonedx_component(component: Dict[str, Any]) -> Tuple[str, str, Optional[str], Optional[str]]:
+    licenses = [
+        entry.get("expression") or (entry.get("license") or {}).get("id") or (entry.get("license") or {}).get("name")
+        for entry in component.get("licenses") or []
+    ]
+    license_id = " AND ".join(item for item in licenses if item) or None
+    return component.get("name") or "", component.get("version") or "", component.get("purl"), license_id
+
+
+def _iter_components(path: str, sbom_format: str) -> Any:
+    """Yield (name, version, purl, license) for every package in an SPDX or CycloneDX JSON file."""
+    key, extract = ("packages", _spdx_component) if sbom_format == "spdx" else ("components", _cyclonedx_component)
+    with open(path, "rb") as fp:
+        if ijson is not None:
+            items = ijson.items(fp, f"{key}.item")
+        else:
+            items = json.load(fp).get(key) or []
+        for item in items:
+            if isinstance(item, dict) and item.get("name"):
+                yield extract(item)
+
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_JSON_DECODER = json.JSONDecoder()
+_offset_indexes: "collections.OrderedDict[str, Dict[str, Any]]" = collections.OrderedDict()
+_offset_index_lock = threading.Lock()
+_OFFSET_INDEX_FLIGHTS = _SingleFlight()
+
+
+class _JsonWindow:
+    """Forward-only view of a JSON file read in ``OFFSET_INDEX_CHUNK_BYTES`` chunks.
+
+    The window is decoded as latin-1, so string positions are byte offsets; only the bytes from
+    the oldest position still needed onwards are kept, plus whatever one value needs to decode.
+    """
+
+    def __init__(self, fp: Any):
+        self.fp = fp
+        self.base = 0
+        self.raw = b""
+        self.text = ""
+        self.eof = False
+
+    def _read(self, keep_from: int) -> bool:
+        """Drop everything before ``keep_from`` and append the next chunk; False at end of file."""
+        chunk = b"" if self.eof else self.fp.read(OFFSET_INDEX_CHUNK_BYTES)
+        if not chunk:
+            self.eof = True
+            return False
+        self.raw = self.raw[keep_from - self.base :] + chunk
+        self.base = keep_from
+        self.text = self.raw.decode("latin-1")
+        return True
+
+    def char(self, pos: int) -> str:
+        while pos - self.base >= len(self.text):
+            if not self._read(pos):
+                return ""
+        return self.text[pos - self.base]
+
+    def skip_whitespace(self, pos: int) -> int:
+        while True:
+            pos = _JSON_WHITESPACE.match(self.text, pos - self.base).end() + self.base
+            if pos - self.base < len(self.text) or not self._read(pos):
+                return pos
+
+    def expect(self, pos: int, char: str) -> int:
+        if self.char(pos) != char:
+            raise ValueError(f"expected {char!r} at byte {pos}")
+        return self.skip_whitespace(pos + 1)
+
+    def decode(self, pos: int) -> Tuple[Any, int]:
+        """Decode the value at ``pos``, reading further chunks while it is cut off; return (value, end)."""
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.text, pos - self.base)
+            except ValueError:
+                if not self._read(pos):
+                    raise
+                continue
+            # A number ending exactly at the window edge may continue in the next chunk.
+            if end < len(self.text) or not self._read(pos):
+                return value, end + self.base
+
+    def slice(self, start: int, end: int) -> bytes:
+        return self.raw[start - self.base : end - self.base]
+
+
+def _build_offset_index(path: str) -> Dict[str, Any]:
+    """Index a JSON SBOM: one ``[offset, length, name, version, purl, license]`` row per package/component.
+
+    Only the top-level object is walked: members before the ``packages``/``components`` array are
+    skipped value by value, entries are decoded one at a time and nothing after the array is read.
+    """
+    rows: List[List[Any]] = []
+    with open(path, "rb") as fp:
+        window = _JsonWindow(fp)
+        pos = window.expect(window.skip_whitespace(0), "{")
+        while window.char(pos) not in {"}", ""}:
+            key, pos = window.decode(pos)
+            pos = window.expect(window.skip_whitespace(pos), ":")
+            if key in {"packages", "components"} and window.char(pos) == "[":
+                extract = _spdx_component if key == "packages" else _cyclonedx_component
+                pos = window.skip_whitespace(pos + 1)
+                while window.char(pos) != "]":
+                    item, end = window.decode(pos)
+                    raw = window.slice(pos, end)
+                    if not raw.isascii():
+                        # The latin-1 window garbles UTF-8 text; decode this entry properly.
+                        item = json.loads(raw)
+                    name, version, purl, license_id = extract(item) if isinstance(item, dict) else ("", "", None, None)
+                    rows.append([pos, end - pos, name, version, purl, license_id])
+                    pos = window.skip_whitespace(end)
+                    if window.char(pos) == ",":
+                        pos = window.skip_whitespace(pos + 1)
+                    elif window.char(pos) != "]":
+                        raise ValueError(f"expected ',' or ']' at byte {pos}")
+                return {"key": key, "rows": rows}
+            _, pos = window.decode(pos)
+            pos = window.skip_whitespace(pos)
+            if window.char(pos) == ",":
+                pos = window.skip_whitespace(pos + 1)
+            elif window.char(pos) != "}":
+                raise ValueError(f"expected ',' or '}}' at byte {pos}")
+    return {"key": "", "rows": rows}
+
+
+def _offset_index_path(sha256: str) -> str:
+    return os.path.join(SBOM_OFFSET_INDEX_DIR, f"{sha256}.json")
+
+
+def _offset_index(path: str) -> Dict[str, Any]:
+    """Return the offset index of a stored SBOM, loading or building it once per content hash.
+
+    Indexes are built on first use; concurrent first requests for the same content share one build.
+    """
+    sha256 = _content_etag(path)
+    with _offset_index_lock:
+        index = _offset_indexes.get(sha256)
+        if index is not None:
+            _offset_indexes.move_to_end(sha256)
+            return index
+    index, _ = _OFFSET_INDEX_FLIGHTS.do(sha256, lambda _publish, _cancelled: _load_offset_index(path, sha256))
+    return index
+
+
+def _load_offset_index(path: str, sha256: str) -> Dict[str, Any]:
+    index_path = _offset_index_path(sha256)
+    try:
+        with open(index_path, "r", encoding="utf-8") as fp:
+            index = json.load(fp)
+        os.utime(index_path)
+    except (OSError, ValueError):
+        with _stage_timer("offset_index"):
+            index = _build_offset_index(path)
+        os.makedirs(SBOM_OFFSET_INDEX_DIR, exist_ok=True)
+        tmp_path = f"{index_path}.tmp-{uuid.uuid4().hex}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump(index, fp, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, index_path)
+        finally:
+            _discard_file(tmp_path)
+    # Lower-cased search text per row for the server-side filter; not persisted.
+    index["haystack"] = ["\0".join(str(value or "") for value in row[2:]).lower() for row in index["rows"]]
+    with _offset_index_lock:
+        _offset_indexes[sha256] = index
+        if len(_offset_indexes) > OFFSET_INDEX_CACHE_SIZE:
+            _offset_indexes.popitem(last=False)
+    return index
+
+
+def _collect_offset_indexes() -> None:
+    """Drop offset indexes unused for ``SBOM_ARCHIVE_MAX_AGE`` seconds (loading one refreshes its mtime)."""
+    if SBOM_ARCHIVE_MAX_AGE <= 0 or not os.path.isdir(SBOM_OFFSET_INDEX_DIR):
+        return
+    now = time.time()
+    with os.scandir(SBOM_OFFSET_INDEX_DIR) as it:
+        for item in it:
+            try:
+                if now - item.stat().st_mtime > SBOM_ARCHIVE_MAX_AGE:
+                    os.remove(item.path)
+            except FileNotFoundError:
+                continue
+
+
+class _ComponentIndex:
+    """SQLite index of the components found in generated SBOMs, one document per (image, tool, format).
+
+    Re-indexing a document replaces its components, so the index always reflects the latest SBOM
+    for each image digest (or image reference when the digest is unknown).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sbom_documents (
+                    doc_id INTEGER PRIMARY KEY,
+                    image_key TEXT NOT NULL,
+                    image_ref TEXT NOT NULL,
+                    image_digest TEXT,
+                    tool TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    indexed_at REAL NOT NULL,
+                    UNIQUE (image_key, tool, format)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS components (
+                    component_id INTEGER PRIMARY KEY,
+                    doc_id INTEGER NOT NULL,
+                    name TEXT NOT NULL COLLATE NOCASE,
+                    version TEXT NOT NULL,
+                    version_key TEXT NOT NULL,
+                    purl TEXT,
+                    license TEXT
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_components_name ON components (name, version_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_components_purl ON components (purl)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_components_license ON components (license)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_components_doc ON components (doc_id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return _sqlite_connection(self.db_path)
+
+    def add(self, path: str, image_ref: str, image_digest: Optional[str], tool: str, sbom_format: str) -> None:
+        image_key = image_digest or image_ref
+        sha256 = _file_sha256(path)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT doc_id, sha256 FROM sbom_documents WHERE image_key = ? AND tool = ? AND format = ?",
+                (image_key, tool, sbom_format),
+            ).fetchone()
+            if row and row[1] == sha256:
+                conn.execute(
+                    "UPDATE sbom_documents SET image_ref = ?, indexed_at = ? WHERE doc_id = ?", (image_ref, now, row[0])
+                )
+                return
+        # Parse outside the write transaction so other workers are not blocked meanwhile.
+        rows = [
+            (name, version, _version_key(version), purl, license_id)
+            for name, version, purl, license_id in _iter_components(path, sbom_format)
+        ]
+        with self._connect() as conn:
+            doc_id = conn.execute(
+                "INSERT INTO sbom_documents (image_key, image_ref, image_digest, tool, format, sha256, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (image_key, tool, format) DO UPDATE SET "
+                "image_ref = excluded.image_ref, sha256 = excluded.sha256, indexed_at = excluded.indexed_at "
+                "RETURNING doc_id",
+                (image_key, image_ref, image_digest, tool, sbom_format, sha256, now),
+            ).fetchone()[0]
+            conn.execute("DELETE FROM components WHERE doc_id = ?", (doc_id,))
+            conn.executemany(
+                "INSERT INTO components (doc_id, name, version, version_key, purl, license) VALUES (?, ?, ?, ?, ?, ?)",
+                [(doc_id,) + row for row in rows],
+            )
+
+    def query(self, filters: Dict[str, str], cursor: int, limit: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return one page of matching components ordered by id, plus the cursor of the next page."""
+        clauses = ["c.component_id > ?"]
+        params: List[Any] = [cursor]
+        if filters.get("name"):
+            clauses.append("c.name = ?")
+            params.append(filters["name"])
+        if filters.get("purl"):
+            # Prefix match written as a range so the purl index is used.
+            clauses.append("c.purl >= ? AND c.purl < ?")
+            params.extend([filters["purl"], filters["purl"] + "\uffff"])
+        if filters.get("version"):
+            clauses.append("c.version = ?")
+            params.append(filters["version"])
+        for param, operator in (("version_lt", "<"), ("version_lte", "<="), ("version_gt", ">"), ("version_gte", ">=")):
+            if filters.get(param):
+                clauses.append(f"c.version_key {operator} ?")
+                params.append(_version_key(filters[param]))
+        if filters.get("license"):
+            clauses.append("c.license = ?")
+            params.append(filters["license"])
+        if filters.get("image"):
+            clauses.append("(d.image_ref = ? OR d.image_digest = ?)")
+            params.extend([filters["image"], filters["image"]])
+        if filters.get("tool"):
+            clauses.append("d.tool = ?")
+            params.append(filters["tool"])
+        rows = (
+            self._connect()
+            .execute(
+                "SELECT c.component_id, c.name, c.version, c.purl, c.license, d.image_ref, d.image_digest, d.tool, d.format "
+                "FROM components c JOIN sbom_documents d ON d.doc_id = c.doc_id "
+                f"WHERE {' AND '.join(clauses)} ORDER BY c.component_id LIMIT ?",
+                params + [limit + 1],
+            )
+            .fetchall()
+        )
+        keys = ("id", "name", "version", "purl", "license", "image_ref", "image_digest", "tool", "format")
+        components = [dict(zip(keys, row)) for row in rows[:limit]]
+        next_cursor = components[-1]["id"] if len(rows) > limit else None
+        return components, next_cursor
+
+
+@functools.lru_cache(maxsize=None)
+def _component_index() -> _ComponentIndex:
+    return _ComponentIndex(SBOM_COMPONENT_DB)
+
+
+@functools.lru_cache(maxsize=None)
+def _index_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="sbom-index")
+
+
+def _index_components(
+    path: str,
+    image_ref: str,
+    image_digest: Optional[str],
+    tool: str,
+    sbom_format: str,
+    profile: str = DEFAULT_SCAN_PROFILE,
+) -> None:
+    """Queue a generated SBOM for the component index; indexing never delays or fails the request.
+
+    Only default-profile SBOMs are indexed: a partial inventory must not replace a complete one.
+    """
+    if not SBOM_COMPONENT_INDEX or profile != DEFAULT_SCAN_PROFILE:
+        return
+
+    def run() -> None:
+        try:
+            with _stage_timer("index", tool, sbom_format):
+                _component_index().add(path, image_ref, image_digest, tool, sbom_format)
+        except (OSError, ValueError, sqlite3.Error) as exc:
+            app.logger.warning("Component indexing of %s failed: %s", path, exc)
+
+    _index_executor().submit(run)
+
+
+def _generate_bulk_sboms(
+    image_entries: List[Dict[str, Any]],
+    registry_username: str = "",
+    registry_password: str = "",
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True,
+    prefetch_depth: Optional[int] = None,
+    client: str = "",
+    cancelled: Optional[Callable[[], bool]] = None,
+    profile: str = DEFAULT_SCAN_PROFILE,
+) -> Dict[str, Any]:
+    """``_bulk_generate`` under a request trace: per-stage ``timings`` (and the ``profile_dump`` when sampled)."""
+    with _tracing("bulk", progress_cb) as trace:
+        result = _bulk_generate(
+            image_entries,
+            registry_username=registry_username,
+            registry_password=registry_password,
+            progress_cb=progress_cb,
+            max_workers=max_workers,
+            use_cache=use_cache,
+            prefetch_depth=prefetch_depth,
+            client=client,
+            cancelled=cancelled,
+            profile=profile,
+        )
+        result["timings"] = trace.timings()
+    if trace.profile_path:
+        result["profile_dump"] = trace.profile_path
+    return result
+
+
+def _bulk_generate(
+    image_entries: List[Dict[str, Any]],
+    registry_username: str = "",
+    registry_password: str = "",
+    progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True,
+    prefetch_depth: Optional[int] = None,
+    client: str = "",
+    cancelled: Optional[Callable[[], bool]] = None,
+    profile: str = DEFAULT_SCAN_PROFILE,
+) -> Dict[str, Any]:
+    """Generate SBOMs for multiple images (Syft/Trivy x SPDX/CycloneDX) and bundle them as a ZIP.
+
+    Scans for an image run concurrently on up to ``max_workers`` threads
+    (``SBOM_BULK_WORKERS`` by default); with ``SBOM_MULTI_FORMAT`` each tool
+    catalogs the image once and writes every format. ZIP entries and records
+    keep the deterministic tool/format order regardless of completion order.
+    Results already in the digest-keyed result cache are served without rescanning
+    unless ``use_cache`` is False. While one image is scanned, the next
+    ``prefetch_depth`` images (``SBOM_PREFETCH_DEPTH`` by default) are resolved and pulled.
+    Once ``cancelled()`` returns True, running scanners are killed, the remaining
+    combinations are skipped and ``_ScanCancelled`` is raised. Every scan uses the
+    ``profile`` entry of ``SCAN_PROFILES``. Each record carries the
+    ``timings`` of its image's preparation, its scan and its ZIP entry.
+    """
+    started = time.monotonic()
+    combinations = [(tool, sbom_format) for tool in SUPPORTED_TOOLS for sbom_format in SUPPORTED_FORMATS]
+    total = len(image_entries) * len(combinations)
+    completed = 0
+    progress_lock = threading.Lock()
+    results: List[Dict[str, Any]] = []
+    zip_filename = f"sboms-batch-{uuid.uuid4().hex}.zip"
+    zip_saved_path = _new_output_path(zip_filename)
+    zip_partial_path = f"{zip_saved_path}.part"
+    had_failure = False
+    auth_kwargs = {"registry_username": registry_username, "registry_password": registry_password}
+    prefer_local = _docker_available()
+
+    def emit(event: Dict[str, Any]) -> None:
+        if progress_cb:
+            progress_cb(event)
+
+    if SBOM_MULTI_FORMAT:
+        scan_units = [(tool, list(SUPPORTED_FORMATS)) for tool in SUPPORTED_TOOLS]
+    else:
+        scan_units = [(tool, [sbom_format]) for tool, sbom_format in combinations]
+    workers = max(1, min(max_workers or SBOM_BULK_WORKERS, len(scan_units)))
+    depth = SBOM_PREFETCH_DEPTH if prefetch_depth is None else max(0, prefetch_depth)
+
+    def check_cancelled() -> None:
+        if cancelled is not None and cancelled():
+            raise _ScanCancelled("Bulk generation cancelled")
+
+    def prepare(image_ref: str) -> Tuple[Optional[str], str, Optional[str], Dict[str, float]]:
+        """Resolve the digest and make sure the image is available before its scans start."""
+        check_cancelled()
+        with _tracing(image_ref=image_ref) as trace:
+            image_digest = (
+                _resolve_image_digest(image_ref, registry_username, registry_password) if _needs_image_digest() else None
+            )
+            if (
+                SBOM_RESULT_CACHE
+                and use_cache
+                and image_digest
+                and all(
+                    os.path.exists(
+                        _result_cache_path(image_digest, tool, sbom_format, profile, _scan_chain(tool, formats, profile))
+                    )
+                    for tool, formats in scan_units
+                    for sbom_format in formats
+                )
+            ):
+                return image_digest, "All SBOMs cached for this image digest; image fetch skipped.", None, trace.timings()
+            prefetch_note, oci_layout = _prepare_image_source(image_ref, image_digest, prefer_local, auth_kwargs, emit)
+        return image_digest, prefetch_note, oci_layout, trace.timings()
+
+    def scan(
+        image_ref: str,
+        image_digest: Optional[str],
+        oci_layout: Optional[str],
+        tool: str,
+        sbom_formats: List[str],
+        image_timings: Dict[str, float],
+    ) -> List[Dict[str, Any]]:
+        nonlocal completed
+        check_cancelled()
+        with progress_lock:
+            for sbom_format in sbom_formats:
+                emit(
+                    {
+                        "type": "start",
+                        "image_ref": image_ref,
+                        "tool": tool,
+                        "format": sbom_format,
+                        "completed": completed,
+                        "total": total,
+                    }
+                )
+
+        with _tracing(image_ref=image_ref) as trace:
+            command_preview, outputs, cache_status, coalesced = _coalesced_scan(
+                tool,
+                image_ref,
+                sbom_formats,
+                prefer_local=prefer_local,
+                extra_env=auth_kwargs,
+                image_digest=image_digest,
+                use_cache=use_cache,
+                oci_layout=oci_layout,
+                progress_cb=emit,
+                client=client,
+                cancelled=cancelled,
+                profile=profile,
+            )
+
+        scanned: List[Dict[str, Any]] = []
+        for sbom_format in sbom_formats:
+            success, output_or_error = outputs[sbom_format]
+            record: Dict[str, Any] = {
+                "image_ref": image_ref,
+                "tool": tool,
+                "format": sbom_format,
+                "command": command_preview,
+                "success": success,
+                "cache": cache_status[sbom_format],
+                "coalesced": coalesced,
+                "profile": profile,
+                "timings": {**image_timings, **trace.timings(sbom_format)},
+            }
+            if image_digest:
+                record["image_digest"] = image_digest
+
+            if success:
+                filename = _build_filename(image_ref, tool, sbom_format, profile)
+                record.update({"filename": filename, "saved_path": output_or_error})
+                _index_components(output_or_error, image_ref, image_digest, tool, sbom_format, profile)
+                app.logger.info("SBOM success [%s %s %s] -> %s", image_ref, tool, sbom_format, filename)
+            else:
+                record["error"] = _friendly_error(output_or_error)
+                _count_failure(tool, output_or_error)
+                app.logger.warning("SBOM failure [%s %s %s]: %s", image_ref, tool, sbom_format, record["error"])
+
+            with progress_lock:
+                completed += 1
+                emit(
+                    {
+                        "type": "record",
+                        "record": record,
+                        "completed": completed,
+                        "total": total,
+                    }
+                )
+            scanned.append(record)
+        return scanned
+
+    try:
+        # Entries are appended to the archive on disk as scans finish, so memory use does not grow with the batch.
+        with zipfile.ZipFile(
+            zip_partial_path, mode="w", compression=ZIP_COMPRESSION, compresslevel=ZIP_COMPRESSLEVEL
+        ) as zip_file, ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="sbom-scan"
+        ) as executor, ThreadPoolExecutor(max_workers=max(1, depth), thread_name_prefix="sbom-prefetch") as prefetcher:
+            # While an image is scanned, `depth` upcoming images prepare alongside it; with 0 the next image
+            # is only prepared once the current one is done, so pulls never overlap with scans.
+            upcoming = iter(image_entries)
+            prepared: "collections.deque[Tuple[Dict[str, Any], Any]]" = collections.deque()
+
+            def prefetch_next() -> bool:
+                next_entry = next(upcoming, None)
+                if next_entry is None:
+                    return False
+                prepared.append((next_entry, prefetcher.submit(_traced(prepare), next_entry["image_ref"])))
+                return True
+
+            for _ in range(max(1, depth)):
+                prefetch_next()
+
+            while prepared:
+                entry, prepare_future = prepared.popleft()
+                image_ref = entry["image_ref"]
+                folder = _safe_image_folder(image_ref)
+                image_digest, prefetch_note, oci_layout, image_timings = prepare_future.result()
+                app.logger.info("Prefetch result for %s: %s", image_ref, prefetch_note)
+                entry["prefetch"] = prefetch_note
+                emit(
+                    {
+                        "type": "prefetch",
+                        "image_ref": image_ref,
+                        "message": prefetch_note,
+                        "completed": completed,
+                        "total": total,
+                    }
+                )
+
+                futures = [
+                    executor.submit(_traced(scan), image_ref, image_digest, oci_layout, tool, sbom_formats, image_timings)
+                    for tool, sbom_formats in scan_units
+                ]
+                while len(prepared) < depth and prefetch_next():
+                    pass
+                # Collect in submission order so the ZIP layout does not depend on scan timing.
+                for future in futures:
+                    for record in future.result():
+                        if record["success"]:
+                            with _tracing(image_ref=image_ref) as trace, _stage_timer(
+                                "zip_write", record["tool"], record["format"]
+                            ):
+                                zip_file.write(record["saved_path"], arcname=f"{folder}/{record['filename']}")
+                            record["timings"].update(trace.timings())
+                        else:
+                            had_failure = True
+                            zip_file.writestr(f"errors/{folder}-{record['tool']}-{record['format']}.txt", record["error"])
+                        results.append(record)
+
+                with _stage_timer("cleanup"):
+                    entry["cleanup_message"] = _cleanup_image(image_ref)
+                emit(
+                    {
+                        "type": "cleanup",
+                        "image_ref": image_ref,
+                        "message": entry["cleanup_message"],
+                        "completed": completed,
+                        "total": total,
+                    }
+                )
+                if not prepared:
+                    prefetch_next()
+    except BaseException:
+        # Do not leave half-written archives behind in SBOM_OUTPUT_DIR.
+        if os.path.exists(zip_partial_path):
+            os.remove(zip_partial_path)
+        raise
+
+    os.replace(zip_partial_path, zip_saved_path)
+    zip_token = _cache_download(zip_saved_path, zip_filename, mimetype="application/zip")
+    _observe("sbom_stage_duration_seconds", {"stage": "bulk", "tool": "", "format": ""}, time.monotonic() - started)
+
+    emit(
+        {
+            "type": "zip_ready",
+            "zip_token": zip_token,
+            "zip_filename": zip_filename,
+            "zip_saved_path": zip_saved_path,
+            "completed": completed,
+            "total": total,
+            "had_failures": had_failure,
+        }
+    )
+
+    return {
+        "success": True,
+        "all_succeeded": not had_failure,
+        "had_failures": had_failure,
+        "zip_token": zip_token,
+        "zip_filename": zip_filename,
+        "zip_saved_path": zip_saved_path,
+        "records": results,
+    }
+
+
+def _scan_profile_error(payload: Dict[str, Any]) -> Optional[str]:
+    if (payload.get("profile") or DEFAULT_SCAN_PROFILE) not in SCAN_PROFILES:
+        return f"Invalid scan profile (choose from: {', '.join(SCAN_PROFILES)})."
+    return None
+
+
+def _sbom_all_request_error(payload: Dict[str, Any]) -> Optional[str]:
+    """Validate a 4-pattern ZIP payload; return an error message or None."""
+    image_ref = (payload.get("image_ref") or "").strip()
+    if not image_ref:
+        return "Docker image reference is required (example: nginx:latest)."
+    error = _scan_profile_error(payload)
+    if error:
+        return error
+    try:
+        _prepare_single_entry(image_ref)
+    except Exception as exc:  # noqa: BLE001 - return friendly message
+        return str(exc)
+    return None
+
+
+def _run_sbom_all_request(
+    payload: Dict[str, Any], progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None, client: str = ""
+) -> Tuple[Dict[str, Any], int]:
+    """Generate the 4-pattern ZIP for a validated payload; return (response_body, status_code)."""
+    image_ref = (payload.get("image_ref") or "").strip()
+    bulk_result = _generate_bulk_sboms(
+        [_prepare_single_entry(image_ref)],
+        registry_username=payload.get("registry_username") or "",
+        registry_password=payload.get("registry_password") or "",
+        progress_cb=progress_cb,
+        use_cache=not payload.get("no_cache"),
+        client=client,
+        profile=payload.get("profile") or DEFAULT_SCAN_PROFILE,
+    )
+    had_failures = bulk_result.get("had_failures", False)
+    body = {
+        "success": True,
+        "all_succeeded": not had_failures,
+        "had_failures": had_failures,
+        "image_ref": image_ref,
+        "records": bulk_result["records"],
+        "zip_download_token": bulk_result["zip_token"],
+        "zip_filename": bulk_result["zip_filename"],
+        "zip_saved_path": bulk_result["zip_saved_path"],
+        "profile": payload.get("profile") or DEFAULT_SCAN_PROFILE,
+        "timings": bulk_result["timings"],
+    }
+    if "profile_dump" in bulk_result:
+        body["profile_dump"] = bulk_result["profile_dump"]
+    return body, 200
+
+
+@app.route("/api/sbom/all", methods=["POST"])
+def api_sbom_all():
+    """Generate SBOMs for all tool/format combinations for a single image and bundle them as ZIP."""
+    payload = request.get_json(silent=True) or {}
+    error = _sbom_all_request_error(payload)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+
+    body, status_code = _run_sbom_all_request(payload, client=_client_key())
+    return jsonify(body), status_code
+
+
+@app.route("/api/sbom/all/stream", methods=["POST"])
+def api_sbom_all_stream():
+    """Stream progress for the 4-pattern ZIP generation using SSE-style events.
+
+    When the client disconnects the generation is cancelled: running scanners are killed
+    and the remaining combinations are skipped.
+    """
+    payload = request.get_json(silent=True) or {}
+    error = _sbom_all_request_error(payload)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+
+    image_ref = (payload.get("image_ref") or "").strip()
+    registry_username = payload.get("registry_username") or ""
+    registry_password = payload.get("registry_password") or ""
+    entry = _prepare_single_entry(image_ref)
+    client = _client_key()
+
+    def stream_events():
+        q: SimpleQueue = SimpleQueue()
+        sentinel = object()
+        # Set when the server closes this generator, i.e. the client went away.
+        disconnected = threading.Event()
+
+        def push(event: Dict[str, Any]):
+            event.setdefault("image_ref", image_ref)
+            q.put(event)
+
+        def worker():
             try:
                 result = _generate_bulk_sboms(
                     [entry],
                     registry_username=registry_username,
                     registry_password=registry_password,
                     progress_cb=push,
+                    use_cache=not payload.get("no_cache"),
+                    client=client,
+                    cancelled=disconnected.is_set,
+                    profile=payload.get("profile") or DEFAULT_SCAN_PROFILE,
                 )
-                push(
-                    {
-                        "type": "done",
-                        "success": True,
-                        "had_failures": result.get("had_failures", False),
-                        "zip_token": result.get("zip_token"),
-                        "zip_filename": result.get("zip_filename"),
-                        "zip_saved_path": result.get("zip_saved_path"),
-                        "records": result.get("records", []),
-                    }
-                )
+                push(_bulk_done_event(result))
+            except _ScanCancelled:
+                app.logger.info("SBOM stream for %s cancelled after client disconnect", image_ref)
             except Exception as exc:  # noqa: BLE001 - stream friendly error
                 push({"type": "error", "success": False, "error": str(exc)})
             finally:
@@ -548,111 +3725,730 @@ def api_sbom_all_stream():
 
         threading.Thread(target=worker, daemon=True).start()
 
-        while True:
-            item = q.get()
-            if item is sentinel:
-                break
-            yield f"data: {json.dumps(item, ensure_ascii=False)}\n\n"
+        try:
+            while True:
+                try:
+                    item = q.get(timeout=SBOM_SSE_KEEPALIVE)
+                except Empty:
+                    # Writing to a closed connection makes the server close this generator.
+                    yield ": keepalive\n\n"
+                    continue
+                if item is sentinel:
+                    break
+                yield f"data: {json.dumps(item, ensure_ascii=False)}\n\n"
+        finally:
+            disconnected.set()
 
     headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     return Response(stream_events(), content_type="text/event-stream", headers=headers)
 
 
-@app.route("/api/sbom", methods=["POST"])
-def api_sbom():
-    payload = request.get_json(silent=True) or {}
+def _bulk_done_event(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Final SSE event of a 4-pattern generation stream."""
+    return {
+        "type": "done",
+        "success": True,
+        "had_failures": result.get("had_failures", False),
+        "zip_token": result.get("zip_token"),
+        "zip_filename": result.get("zip_filename"),
+        "zip_saved_path": result.get("zip_saved_path"),
+        "records": result.get("records", []),
+        "timings": result.get("timings", {}),
+    }
+
+
+def _parse_image_refs(raw: Any) -> List[str]:
+    """Turn a list or newline-separated text of image refs into a de-duplicated, ordered list.
+
+    Refs naming the same image (``nginx``, ``docker.io/library/nginx:latest``) are kept once, as first written.
+    """
+    lines = raw.splitlines() if isinstance(raw, str) else list(raw or [])
+    refs: Dict[Tuple[str, str, str], str] = {}
+    for line in lines:
+        ref = line.split("#", 1)[0].strip()
+        if ref:
+            refs.setdefault(_split_image_ref(ref), ref)
+    return list(refs.values())
+
+
+def _sbom_batch_request_error(payload: Dict[str, Any]) -> Optional[str]:
+    """Validate a multi-image batch payload; return an error message or None."""
+    raw_refs = payload.get("image_refs")
+    if not (
+        raw_refs is None
+        or isinstance(raw_refs, str)
+        or (isinstance(raw_refs, list) and all(isinstance(ref, str) for ref in raw_refs))
+    ):
+        return "image_refs must be a list of strings or newline-separated text."
+    image_refs = _parse_image_refs(raw_refs)
+    if not image_refs:
+        return "At least one Docker image reference is required in image_refs."
+    if len(image_refs) > SBOM_BATCH_MAX_IMAGES:
+        return f"Too many images in one batch (max {SBOM_BATCH_MAX_IMAGES})."
+    return _scan_profile_error(payload)
+
+
+def _run_sbom_batch_request(
+    payload: Dict[str, Any], progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None, client: str = ""
+) -> Tuple[Dict[str, Any], int]:
+    """Generate all tool/format combinations for every image in a validated batch into one ZIP."""
+    image_refs = _parse_image_refs(payload.get("image_refs"))
+    bulk_result = _generate_bulk_sboms(
+        [_prepare_single_entry(image_ref) for image_ref in image_refs],
+        registry_username=payload.get("registry_username") or "",
+        registry_password=payload.get("registry_password") or "",
+        progress_cb=progress_cb,
+        use_cache=not payload.get("no_cache"),
+        client=client,
+        profile=payload.get("profile") or DEFAULT_SCAN_PROFILE,
+    )
+    had_failures = bulk_result.get("had_failures", False)
+    body = {
+        "success": True,
+        "all_succeeded": not had_failures,
+        "had_failures": had_failures,
+        "image_refs": image_refs,
+        "records": bulk_result["records"],
+        "zip_download_token": bulk_result["zip_token"],
+        "zip_filename": bulk_result["zip_filename"],
+        "zip_saved_path": bulk_result["zip_saved_path"],
+        "profile": payload.get("profile") or DEFAULT_SCAN_PROFILE,
+        "timings": bulk_result["timings"],
+    }
+    if "profile_dump" in bulk_result:
+        body["profile_dump"] = bulk_result["profile_dump"]
+    return body, 200
+
+
+@app.route("/api/sbom/batch", methods=["POST"])
+def api_sbom_batch():
+    """Generate SBOMs for a list of images (JSON ``image_refs`` or an uploaded text file) as one ZIP."""
+    if request.files.get("file") is not None:
+        payload: Dict[str, Any] = request.form.to_dict()
+        payload["image_refs"] = request.files["file"].read().decode("utf-8", errors="replace")
+    else:
+        payload = request.get_json(silent=True) or {}
+    error = _sbom_batch_request_error(payload)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+
+    body, status_code = _run_sbom_batch_request(payload, client=_client_key())
+    return jsonify(body), status_code
+
+
+def _sbom_request_error(payload: Dict[str, Any]) -> Optional[str]:
+    """Validate a single-generation payload; return an error message or None."""
     image_ref = (payload.get("image_ref") or "").strip()
     selected_tool = payload.get("tool") or "syft"
-    selected_format = payload.get("format") or "spdx"
+    requested_formats = payload.get("formats")
 
     if not image_ref:
-        return jsonify({"success": False, "error": "Docker image reference is required (example: nginx:latest)."}), 400
+        return "Docker image reference is required (example: nginx:latest)."
     if selected_tool not in SUPPORTED_TOOLS:
-        return jsonify({"success": False, "error": "Invalid SBOM tool selection."}), 400
-    if selected_format not in SUPPORTED_FORMATS:
-        return jsonify({"success": False, "error": "Invalid SBOM format selection."}), 400
+        return "Invalid SBOM tool selection."
+    if requested_formats is None:
+        selected_formats = [payload.get("format") or "spdx"]
+    elif isinstance(requested_formats, list) and requested_formats:
+        selected_formats = requested_formats
+    else:
+        return "Invalid SBOM format selection."
+    if any(not isinstance(sbom_format, str) or sbom_format not in SUPPORTED_FORMATS for sbom_format in selected_formats):
+        return "Invalid SBOM format selection."
+    return _scan_profile_error(payload)
+
+
+def _selected_formats(payload: Dict[str, Any]) -> List[str]:
+    """Formats of a validated single-generation payload, in request order without duplicates."""
+    return list(dict.fromkeys(payload.get("formats") or [payload.get("format") or "spdx"]))
+
+
+def _run_sbom_request(
+    payload: Dict[str, Any], progress_cb: Optional[Callable[[Dict[str, Any]], None]] = None, client: str = ""
+) -> Tuple[Dict[str, Any], int]:
+    """Generate the SBOM(s) for a validated single-generation payload; return (response_body, status_code).
+
+    The body carries the request's per-stage ``timings`` (and the ``profile_dump`` path when sampled).
+    """
+    with _tracing("sbom", progress_cb) as trace:
+        body, status_code = _generate_sbom_response(payload, progress_cb, client)
+        body["timings"] = trace.timings()
+    if trace.profile_path:
+        body["profile_dump"] = trace.profile_path
+    return body, status_code
+
+
+def _generate_sbom_response(
+    payload: Dict[str, Any], progress_cb: Optional[Callable[[Dict[str, Any]], None]], client: str
+) -> Tuple[Dict[str, Any], int]:
+    image_ref = (payload.get("image_ref") or "").strip()
+    selected_tool = payload.get("tool") or "syft"
+    requested_formats = payload.get("formats")
+    selected_formats = _selected_formats(payload)
+    profile = payload.get("profile") or DEFAULT_SCAN_PROFILE
 
     registry_username = payload.get("registry_username") or ""
     registry_password = payload.get("registry_password") or ""
     env_kwargs = {"registry_username": registry_username, "registry_password": registry_password}
-    prefer_local = _docker_available(env_kwargs)
-    if prefer_local:
-        prefetch_note = _ensure_image_cached(image_ref, env_kwargs)
+    use_cache = not payload.get("no_cache")
+    # include_sbom=false returns metadata and a download token without inlining the document.
+    include_sbom = payload.get("include_sbom", True) is not False
+    image_digest = _resolve_image_digest(image_ref, registry_username, registry_password) if _needs_image_digest() else None
+    all_cached = (
+        SBOM_RESULT_CACHE
+        and use_cache
+        and image_digest is not None
+        and all(
+            os.path.exists(
+                _result_cache_path(
+                    image_digest, selected_tool, f, profile, _scan_chain(selected_tool, selected_formats, profile)
+                )
+            )
+            for f in selected_formats
+        )
+    )
+    prefer_local = _docker_available()
+    oci_layout = None
+    if not all_cached:
+        prefetch_note, oci_layout = _prepare_image_source(image_ref, image_digest, prefer_local, env_kwargs, progress_cb)
         app.logger.info("Prefetch result for %s: %s", image_ref, prefetch_note)
 
-    command = _build_command(selected_tool, image_ref, selected_format, prefer_local=prefer_local)
-    command_preview = " ".join(shlex.quote(token) for token in command)
-    success, output_or_error = _run_command(command, extra_env=env_kwargs)
-    if not success:
-        return jsonify({"success": False, "error": _friendly_error(output_or_error), "command": command_preview}), 500
-
-    sbom_output = output_or_error
-    download_filename = _build_filename(image_ref, selected_tool, selected_format)
-    download_token = _cache_download(sbom_output, download_filename)
-    saved_path = _write_sbom_to_disk(sbom_output, download_filename)
-    app.logger.info("SBOM generated for %s using %s (%s). Saved to %s", image_ref, selected_tool, selected_format, saved_path)
+    command_preview, outputs, cache_status, coalesced = _coalesced_scan(
+        selected_tool,
+        image_ref,
+        selected_formats,
+        prefer_local=prefer_local,
+        extra_env=env_kwargs,
+        image_digest=image_digest,
+        use_cache=use_cache,
+        oci_layout=oci_layout,
+        progress_cb=progress_cb,
+        client=client,
+        profile=profile,
+    )
 
-    cleanup_message = _cleanup_image(image_ref)
+    generated: List[Dict[str, Any]] = []
+    for sbom_format in selected_formats:
+        success, output_or_error = outputs[sbom_format]
+        if not success:
+            _count_failure(selected_tool, output_or_error)
+            generated.append(
+                {
+                    "format": sbom_format,
+                    "success": False,
+                    "error": _friendly_error(output_or_error),
+                    "cache": cache_status[sbom_format],
+                }
+            )
+            continue
 
-    return jsonify(
-        {
+        saved_path = output_or_error
+        download_filename = _build_filename(image_ref, selected_tool, sbom_format, profile)
+        download_token = _cache_download(saved_path, download_filename)
+        _index_components(saved_path, image_ref, image_digest, selected_tool, sbom_format, profile)
+        app.logger.info("SBOM generated for %s using %s (%s). Saved to %s", image_ref, selected_tool, sbom_format, saved_path)
+        item: Dict[str, Any] = {
+            "format": sbom_format,
             "success": True,
-            "command": command_preview,
-            "sbom": sbom_output,
             "download_token": download_token,
             "download_filename": download_filename,
             "saved_path": saved_path,
-            "cleanup_message": cleanup_message,
+            "size": os.path.getsize(saved_path),
+            "cache": cache_status[sbom_format],
+        }
+        if include_sbom:
+            with open(saved_path, "r", encoding="utf-8") as fp:
+                item["sbom"] = fp.read()
+        generated.append(item)
+
+    succeeded = [item for item in generated if item["success"]]
+    if not succeeded:
+        body = {"success": False, "error": generated[0]["error"], "command": command_preview, "profile": profile}
+        return body, 500
+
+    with _stage_timer("cleanup"):
+        cleanup_message = _cleanup_image(image_ref)
+    primary = succeeded[0]
+    response: Dict[str, Any] = {
+        "success": True,
+        "command": command_preview,
+        "download_token": primary["download_token"],
+        "download_filename": primary["download_filename"],
+        "saved_path": primary["saved_path"],
+        "size": primary["size"],
+        "cleanup_message": cleanup_message,
+        "cache": primary["cache"],
+        "coalesced": coalesced,
+        "image_digest": image_digest,
+        "profile": profile,
+    }
+    if include_sbom:
+        response["sbom"] = primary["sbom"]
+    if requested_formats is not None:
+        response["outputs"] = generated
+    return response, 200
+
+
+@app.route("/api/sbom", methods=["POST"])
+def api_sbom():
+    payload = request.get_json(silent=True) or {}
+    error = _sbom_request_error(payload)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+
+    selected_formats = _selected_formats(payload)
+    with _stage_timer("request", payload.get("tool") or "syft", "+".join(selected_formats)):
+        body, status_code = _run_sbom_request(payload, client=_client_key())
+    return jsonify(body), status_code
+
+
+JOB_TYPES: Dict[str, Tuple[Callable[[Dict[str, Any]], Optional[str]], Callable[..., Tuple[Dict[str, Any], int]]]] = {
+    "sbom": (_sbom_request_error, _run_sbom_request),
+    "all": (_sbom_all_request_error, _run_sbom_all_request),
+    "batch": (_sbom_batch_request_error, _run_sbom_batch_request),
+}
+JOB_FINISHED_STATUSES = {"succeeded", "failed"}
+_JOB_LOCK = threading.Lock()
+_JOB_ACTIVE = 0
+
+
+class _JobStore:
+    """Persist job status, results and progress events in SQLite so every worker process can serve them."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    job_type TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    status_code INTEGER,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_events (
+                    job_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    PRIMARY KEY (job_id, seq)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return _sqlite_connection(self.db_path)
+
+    def create(self, job_id: str, job_type: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            # Job records are kept as long as the download tokens they hand out.
+            expired = [row[0] for row in conn.execute("SELECT job_id FROM jobs WHERE created_at < ?", (now - SBOM_DOWNLOAD_TTL,))]
+            conn.executemany("DELETE FROM job_events WHERE job_id = ?", [(job,) for job in expired])
+            conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(job,) for job in expired])
+            conn.execute(
+                "INSERT INTO jobs (job_id, job_type, status, created_at) VALUES (?, ?, 'queued', ?)",
+                (job_id, job_type, now),
+            )
+
+    def mark_running(self, job_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def finish(self, job_id: str, status: str, result: Dict[str, Any], status_code: int) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, status_code = ?, finished_at = ? WHERE job_id = ?",
+                (status, json.dumps(result, ensure_ascii=False), status_code, time.time(), job_id),
+            )
+
+    def add_event(self, job_id: str, event: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO job_events (job_id, seq, payload) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM job_events WHERE job_id = ?",
+                (job_id, json.dumps(event, ensure_ascii=False), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT job_type, status, result, status_code, created_at, started_at, finished_at "
+                "FROM jobs WHERE job_id = ?",
+                (job_id,),
+            )
+            .fetchone()
+        )
+        if not row:
+            return None
+        return {
+            "job_id": job_id,
+            "type": row[0],
+            "status": row[1],
+            "result": json.loads(row[2]) if row[2] else None,
+            "status_code": row[3],
+            "created_at": row[4],
+            "started_at": row[5],
+            "finished_at": row[6],
         }
+
+    def events_after(self, job_id: str, seq: int) -> List[Tuple[int, str]]:
+        return (
+            self._connect()
+            .execute("SELECT seq, payload FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, seq))
+            .fetchall()
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def _job_store() -> _JobStore:
+    return _JobStore(SBOM_JOB_DB)
+
+
+@functools.lru_cache(maxsize=None)
+def _job_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=SBOM_JOB_WORKERS, thread_name_prefix="sbom-job")
+
+
+def _run_job(job_id: str, job_type: str, payload: Dict[str, Any], client: str = "") -> None:
+    """Execute a queued job on the pool and record its events and final result."""
+    global _JOB_ACTIVE
+    store = _job_store()
+    _, runner = JOB_TYPES[job_type]
+    try:
+        store.mark_running(job_id)
+        store.add_event(job_id, {"type": "status", "status": "running"})
+        body, status_code = runner(payload, progress_cb=lambda event: store.add_event(job_id, event), client=client)
+        status = "succeeded" if body.get("success") else "failed"
+        store.finish(job_id, status, body, status_code)
+        store.add_event(job_id, {"type": "status", "status": status})
+    except Exception as exc:  # noqa: BLE001 - record failure on the job instead of losing it
+        app.logger.error("Job %s failed: %s", job_id, exc, exc_info=exc)
+        store.finish(job_id, "failed", {"success": False, "error": str(exc)}, 500)
+        store.add_event(job_id, {"type": "status", "status": "failed"})
+    finally:
+        with _JOB_LOCK:
+            _JOB_ACTIVE -= 1
+
+
+@app.route("/api/jobs", methods=["POST"])
+def api_jobs_create():
+    """Queue an SBOM generation job and return its id immediately."""
+    global _JOB_ACTIVE
+    payload = request.get_json(silent=True) or {}
+    job_type = payload.get("type") or "sbom"
+    if job_type not in JOB_TYPES:
+        return jsonify({"success": False, "error": "Invalid job type (use 'sbom', 'all' or 'batch')."}), 400
+    validate, _ = JOB_TYPES[job_type]
+    error = validate(payload)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    # Results are fetched through download tokens; job records never carry the SBOM body.
+    payload = {**payload, "include_sbom": False}
+
+    with _JOB_LOCK:
+        if _JOB_ACTIVE >= SBOM_JOB_WORKERS + SBOM_JOB_QUEUE_DEPTH:
+            response = jsonify({"success": False, "error": "Job queue is full. Please retry later."})
+            response.status_code = 429
+            response.headers["Retry-After"] = "5"
+            return response
+        _JOB_ACTIVE += 1
+
+    job_id = uuid.uuid4().hex
+    try:
+        _job_store().create(job_id, job_type)
+        _job_executor().submit(_run_job, job_id, job_type, payload, _client_key())
+    except Exception:
+        with _JOB_LOCK:
+            _JOB_ACTIVE -= 1
+        raise
+
+    return (
+        jsonify(
+            {
+                "success": True,
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/api/jobs/{job_id}",
+                "events_url": f"/api/jobs/{job_id}/events",
+            }
+        ),
+        202,
     )
 
 
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def api_jobs_get(job_id: str):
+    job = _job_store().get(job_id)
+    if not job:
+        abort(404)
+    return jsonify({"success": True, **job})
+
+
+@app.route("/api/jobs/<job_id>/events", methods=["GET"])
+def api_jobs_events(job_id: str):
+    """Stream a job's progress events (SSE) until it finishes; works from any worker process."""
+    store = _job_store()
+    if not store.get(job_id):
+        abort(404)
+
+    def stream_events():
+        last_seq = 0
+        while True:
+            events = store.events_after(job_id, last_seq)
+            for last_seq, event_payload in events:
+                yield f"data: {event_payload}\n\n"
+            if not events:
+                job = store.get(job_id)
+                if not job or job["status"] in JOB_FINISHED_STATUSES:
+                    # Drain events recorded between the last poll and the job finishing.
+                    for last_seq, event_payload in store.events_after(job_id, last_seq):
+                        yield f"data: {event_payload}\n\n"
+                    yield f"data: {json.dumps(_job_final_event(job_id, job), ensure_ascii=False)}\n\n"
+                    break
+                time.sleep(SBOM_JOB_EVENT_POLL)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_events(), content_type="text/event-stream", headers=headers)
+
+
+def _job_final_event(job_id: str, job: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Last SSE event of a job's event stream."""
+    if not job:
+        return {"type": "error", "error": "Job not found"}
+    return {"type": "done", "job_id": job_id, "status": job["status"], "result": job["result"]}
+
+
 @app.route("/api/download/<token>", methods=["GET"])
 def download(token: str):
-    sbom_entry = DOWNLOAD_CACHE.get(token)
+    sbom_entry = _token_store().get(token)
     if not sbom_entry:
         abort(404)
+    content, filename, mimetype = sbom_entry
+    if not os.path.isfile(content):
+        abort(404)
+    if mimetype == "application/zip":
+        return _send_download(content, filename, mimetype)
+    # Serve a precompressed sibling when the client accepts it; identity otherwise.
+    ready = [encoding for encoding in SBOM_PRECOMPRESS if os.path.isfile(content + ENCODING_SUFFIXES[encoding])]
+    encoding = _negotiate_encoding(request.headers.get("Accept-Encoding", ""), ready)
+    path = content + ENCODING_SUFFIXES[encoding] if encoding else content
+    response = _send_download(path, filename, mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
 
-    content = None
-    filename = "download"
-    mimetype = "application/json"
 
-    if isinstance(sbom_entry, tuple):
-        if len(sbom_entry) == 2:
-            content, filename = sbom_entry
-        elif len(sbom_entry) >= 3:
-            content, filename, mimetype = sbom_entry[:3]
+_ETAG_CACHE_SIZE = 1024
+_etag_cache: "collections.OrderedDict[Tuple[str, int, int, int], str]" = collections.OrderedDict()
+_etag_lock = threading.Lock()
 
-    if content is None:
-        abort(404)
 
-    payload_bytes = content if isinstance(content, (bytes, bytearray)) else str(content).encode("utf-8")
-    payload = io.BytesIO(payload_bytes)
-    payload.seek(0)
-    return send_file(
-        payload,
+def _content_etag(path: str) -> str:
+    """SHA-256 of a download file, hashed once per file version (downloadable files are never rewritten)."""
+    stat = os.stat(path)
+    key = (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _etag_lock:
+        etag = _etag_cache.get(key)
+        if etag is not None:
+            _etag_cache.move_to_end(key)
+            return etag
+    etag = _file_sha256(path)
+    with _etag_lock:
+        _etag_cache[key] = etag
+        if len(_etag_cache) > _ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    return etag
+
+
+def _send_download(path: str, filename: str, mimetype: str) -> Response:
+    """Send a file with a content-hash ETag; answers If-None-Match with 304 and Range with 206.
+
+    With ``SBOM_ACCEL_REDIRECT_PREFIX`` the body (and byte ranges) are left to nginx.
+    """
+    etag = _content_etag(path)
+    relative = os.path.relpath(path, SBOM_OUTPUT_DIR)
+    if not SBOM_ACCEL_REDIRECT_PREFIX or relative.startswith(os.pardir):
+        return send_file(path, as_attachment=True, download_name=filename, mimetype=mimetype, etag=etag)
+
+    response = send_file(
+        io.BytesIO(),
         as_attachment=True,
         download_name=filename,
         mimetype=mimetype,
+        etag=etag,
+        last_modified=os.path.getmtime(path),
+        conditional=False,
     )
+    response.make_conditional(request)
+    if response.status_code == 200:
+        response.headers["X-Accel-Redirect"] = SBOM_ACCEL_REDIRECT_PREFIX + urllib.parse.quote(relative)
+    return response
 
 
 # User-friendly error messages (overrides any earlier definition).
+ERROR_CATEGORIES: List[Tuple[str, Tuple[str, ...], str]] = [
+    (
+        "image_unavailable",
+        ("authentication required", "could not determine source", "manifest unknown"),
+        "指定された Docker イメージが見つからないか、プライベートのためアクセスできません。イメージ名と認証情報を確認してください。",
+    ),
+    (
+        "docker_daemon",
+        ("docker daemon", "connect to docker daemon"),
+        "Docker デーモンに接続できません。Docker が起動しているか確認してください。",
+    ),
+    (
+        "overloaded",
+        ("server overloaded",),
+        "サーバーが混雑しているためスキャンを開始できませんでした。しばらくしてから再試行してください。",
+    ),
+    (
+        "resource_limit",
+        ("resource limit", "out of memory", "cannot allocate memory"),
+        "スキャンがメモリまたは CPU 時間の上限を超えたため中断されました。イメージサイズを確認するか、上限を引き上げてください。",
+    ),
+    ("timeout", ("timeout", "timed out"), "処理がタイムアウトしました。イメージサイズやネットワーク状況を確認してください。"),
+]
+
+
+def _error_category(raw: str) -> str:
+    """Classify a raw tool error into one of ``ERROR_CATEGORIES`` (``other`` if none match)."""
+    text = (raw or "").lower()
+    for category, needles, _ in ERROR_CATEGORIES:
+        if any(needle in text for needle in needles):
+            return category
+    return "other"
+
+
 def _friendly_error(raw: str) -> str:
     """Return a shorter, user-friendly error message."""
-    text = (raw or "").lower()
-    if "authentication required" in text or "could not determine source" in text or "manifest unknown" in text:
-        return "指定された Docker イメージが見つからないか、プライベートのためアクセスできません。イメージ名と認証情報を確認してください。"
-    if "docker daemon" in text or "connect to docker daemon" in text:
-        return "Docker デーモンに接続できません。Docker が起動しているか確認してください。"
-    if "timeout" in text:
-        return "処理がタイムアウトしました。イメージサイズやネットワーク状況を確認してください。"
+    category = _error_category(raw)
+    for name, _, message in ERROR_CATEGORIES:
+        if name == category:
+            return message
     return raw
 
 
 @app.route("/", methods=["GET"])
 def health():
-    return jsonify({"status": "ok", "tools": list(SUPPORTED_TOOLS.keys()), "formats": list(SUPPORTED_FORMATS.keys())})
+    return jsonify(
+        {
+            "status": "ok",
+            "tools": list(SUPPORTED_TOOLS.keys()),
+            "formats": list(SUPPORTED_FORMATS.keys()),
+            "profiles": list(SCAN_PROFILES.keys()),
+        }
+    )
+
+
+@app.after_request
+def _compress_json_response(response: Response) -> Response:
+    """Compress large JSON API responses (e.g. inlined SBOMs) when the client accepts it."""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.mimetype != "application/json"
+        or "Content-Encoding" in response.headers
+        or response.content_length is None
+        or response.content_length < SBOM_COMPRESS_MIN_BYTES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    available = ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+    encoding = _negotiate_encoding(request.headers.get("Accept-Encoding", ""), available)
+    if encoding:
+        response.set_data(_compress_bytes(response.get_data(), encoding))
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+@app.route("/api/components", methods=["GET"])
+def api_components():
+    """Query the component index, e.g. ``?name=openssl&version_lt=3.0.13``; paged with ``cursor``/``limit``."""
+    if not SBOM_COMPONENT_INDEX:
+        abort(404)
+    filters = {
+        key: request.args.get(key, "").strip()
+        for key in ("name", "purl", "version", "version_lt", "version_lte", "version_gt", "version_gte", "license", "image", "tool")
+    }
+    try:
+        cursor = max(0, int(request.args.get("cursor", "0")))
+        limit = min(COMPONENT_PAGE_MAX, max(1, int(request.args.get("limit", str(COMPONENT_PAGE_SIZE)))))
+    except ValueError:
+        return jsonify({"success": False, "error": "cursor and limit must be integers."}), 400
+    components, next_cursor = _component_index().query(filters, cursor, limit)
+    return jsonify({"success": True, "components": components, "next_cursor": next_cursor})
+
+
+@app.route("/api/sbom/<token>/components", methods=["GET"])
+def api_sbom_components(token: str):
+    """Page through the packages/components of a stored SBOM, e.g. ``?offset=200&limit=100&q=openssl``.
+
+    ``q`` filters on name, version, purl and license (case-insensitive substring); ``raw=true`` adds
+    each entry as written in the document, read through the offset index.
+    """
+    sbom_entry = _token_store().get(token)
+    if not sbom_entry:
+        abort(404)
+    content, _, mimetype = sbom_entry
+    if mimetype != "application/json" or not os.path.isfile(content):
+        abort(404)
+    try:
+        offset = max(0, int(request.args.get("offset", "0")))
+        limit = min(COMPONENT_PAGE_MAX, max(1, int(request.args.get("limit", str(COMPONENT_PAGE_SIZE)))))
+    except ValueError:
+        return jsonify({"success": False, "error": "offset and limit must be integers."}), 400
+    try:
+        index = _offset_index(content)
+    except (OSError, ValueError) as exc:
+        return jsonify({"success": False, "error": f"SBOM could not be indexed: {exc}"}), 422
+
+    query = request.args.get("q", "").strip().lower()
+    positions = (
+        [position for position, text in enumerate(index["haystack"]) if query in text]
+        if query
+        else range(len(index["rows"]))
+    )
+    page = positions[offset : offset + limit]
+    items = [
+        dict(zip(("index", "name", "version", "purl", "license"), [position] + index["rows"][position][2:]))
+        for position in page
+    ]
+    if request.args.get("raw", "").lower() in {"1", "true", "yes"} and items:
+        with open(content, "rb") as fp:
+            for item in items:
+                entry_offset, length = index["rows"][item["index"]][:2]
+                fp.seek(entry_offset)
+                item["raw"] = json.loads(fp.read(length))
+    return jsonify(
+        {
+            "success": True,
+            "key": index["key"],
+            "total": len(positions),
+            "count": len(index["rows"]),
+            "offset": offset,
+            "limit": limit,
+            "items": items,
+        }
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Expose stage latencies, failures and scanner resource usage for Prometheus."""
+    if not SBOM_METRICS:
+        abort(404)
+    return Response(_render_metrics(), mimetype="text/plain; version=0.0.4")
 
 
 @app.errorhandler(404)
@@ -0,0 +1,366 @@
+"""ASGI entry point: serve the SBOM API from one asyncio event loop (``uvicorn asgi:app``).
+
+The two long-lived SSE routes are served natively:
+
+- ``POST /api/sbom/all/stream``: each subscriber is a coroutine; identical concurrent requests
+  (same image, credentials, cache mode and scan profile) share one generation and its progress
+  events, which is cancelled once every subscriber has disconnected.
+- ``GET /api/jobs/<job_id>/events``: the job store is polled with ``asyncio.sleep`` instead of a
+  sleeping thread per stream.
+
+Generations themselves are not coroutines: each one runs the synchronous pipeline on a
+``_generation_pool`` thread (which in turn uses the bulk-scan and prefetch executors), exactly as
+under gunicorn. Only the scanner's pipes and exit are handled on the event loop (see
+``app._watch_process``): the loop reads the pipes and queues stderr lines, and the thread running
+the scan turns them into progress events and checks for cancellation, so listener callbacks (such
+as the job store's SQLite writes) never run on the loop. Every other route runs the Flask app unchanged on a thread pool.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import app as sbom_app
+
+# Threads running plain Flask requests (and iterating their responses).
+SBOM_ASGI_THREADS = int(os.environ.get("SBOM_ASGI_THREADS", "32"))
+
+_JOB_EVENTS_PATH = re.compile(r"^/api/jobs/([^/]+)/events$")
+_SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_wsgi_pool = ThreadPoolExecutor(max_workers=SBOM_ASGI_THREADS, thread_name_prefix="asgi-wsgi")
+# Threads running the (synchronous) generation behind each coalesced stream.
+_generation_pool = ThreadPoolExecutor(max_workers=sbom_app.SBOM_MAX_CONCURRENT_SCANS, thread_name_prefix="asgi-gen")
+
+
+def _sse(event: Dict[str, Any]) -> bytes:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _header(scope: Scope, name: str) -> str:
+    wanted = name.lower().encode("latin-1")
+    for key, value in scope.get("headers") or []:
+        if key.lower() == wanted:
+            return value.decode("latin-1")
+    return ""
+
+
+def _client_key(scope: Scope) -> str:
+    header_value = _header(scope, sbom_app.SBOM_CLIENT_HEADER) if sbom_app.SBOM_CLIENT_HEADER else ""
+    client = scope.get("client")
+    return sbom_app._client_identity(header_value, client[0] if client else None)
+
+
+async def _read_body(receive: Receive) -> Tuple[bytes, bool]:
+    """Read the whole request body; the flag is False when the client disconnected first."""
+    chunks: List[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return b"", False
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks), True
+
+
+async def _send_json(send: Send, status: int, payload: Dict[str, Any]) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _stream(send: Send, receive: Receive, queue: "asyncio.Queue[Optional[bytes]]") -> None:
+    """Write queued SSE chunks until ``None`` arrives or the client disconnects; idle streams get keepalives."""
+    await send({"type": "http.response.start", "status": 200, "headers": _SSE_HEADERS})
+    disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {getter, disconnect}, timeout=sbom_app.SBOM_SSE_KEEPALIVE, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter not in done:
+                getter.cancel()
+                if disconnect in done:
+                    return
+                await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+                continue
+            chunk = getter.result()
+            if chunk is None:
+                break
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnect.cancel()
+
+
+async def _wait_disconnect(receive: Receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+class _Generation:
+    """One running 4-pattern generation and the queues of the streams subscribed to it."""
+
+    def __init__(self):
+        self.subscribers: Set["asyncio.Queue[Optional[bytes]]"] = set()
+        # Read by the generation thread; set on the loop once the last subscriber has left.
+        self.abandoned = False
+
+    def publish(self, chunk: Optional[bytes]) -> None:
+        for queue in self.subscribers:
+            queue.put_nowait(chunk)
+
+
+class _GenerationHub:
+    """Coalesces identical ``/api/sbom/all/stream`` requests onto one generation (event-loop only)."""
+
+    def __init__(self):
+        self._generations: Dict[Tuple[str, str, bool, str], _Generation] = {}
+
+    def subscribe(self, payload: Dict[str, Any], client: str) -> Tuple[Tuple[str, str, bool, str], "asyncio.Queue"]:
+        image_ref = (payload.get("image_ref") or "").strip()
+        registry_username = payload.get("registry_username") or ""
+        registry_password = payload.get("registry_password") or ""
+        use_cache = not payload.get("no_cache")
+        profile = payload.get("profile") or sbom_app.DEFAULT_SCAN_PROFILE
+        fingerprint = sbom_app._credential_fingerprint(
+            {"registry_username": registry_username, "registry_password": registry_password}
+        )
+        key = (image_ref, fingerprint, use_cache, profile)
+        queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+        generation = self._generations.get(key)
+        if generation is None:
+            generation = self._generations[key] = _Generation()
+            asyncio.ensure_future(
+                self._run(key, generation, image_ref, registry_username, registry_password, use_cache, profile, client)
+            )
+        generation.subscribers.add(queue)
+        return key, queue
+
+    def unsubscribe(self, key: Tuple[str, str, bool, str], queue: "asyncio.Queue") -> None:
+        generation = self._generations.get(key)
+        if generation is None:
+            return
+        generation.subscribers.discard(queue)
+        if not generation.subscribers:
+            generation.abandoned = True
+            del self._generations[key]
+
+    async def _run(
+        self,
+        key: Tuple[str, str, bool, str],
+        generation: _Generation,
+        image_ref: str,
+        registry_username: str,
+        registry_password: str,
+        use_cache: bool,
+        profile: str,
+        client: str,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+
+        def push(event: Dict[str, Any]) -> None:
+            event.setdefault("image_ref", image_ref)
+            loop.call_soon_threadsafe(generation.publish, _sse(event))
+
+        def generate() -> Dict[str, Any]:
+            return sbom_app._generate_bulk_sboms(
+                [sbom_app._prepare_single_entry(image_ref)],
+                registry_username=registry_username,
+                registry_password=registry_password,
+                progress_cb=push,
+                use_cache=use_cache,
+                client=client,
+                cancelled=lambda: generation.abandoned,
+                profile=profile,
+            )
+
+        try:
+            result = await loop.run_in_executor(_generation_pool, generate)
+            generation.publish(_sse(sbom_app._bulk_done_event(result)))
+        except sbom_app._ScanCancelled:
+            sbom_app.app.logger.info("SBOM stream for %s cancelled after client disconnect", image_ref)
+        except Exception as exc:  # noqa: BLE001 - stream friendly error
+            generation.publish(_sse({"type": "error", "success": False, "error": str(exc), "image_ref": image_ref}))
+        finally:
+            if self._generations.get(key) is generation:
+                del self._generations[key]
+            generation.publish(None)
+
+
+_hub = _GenerationHub()
+
+
+async def _sbom_all_stream(scope: Scope, receive: Receive, send: Send) -> None:
+    body, connected = await _read_body(receive)
+    if not connected:
+        return
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+    error = sbom_app._sbom_all_request_error(payload)
+    if error:
+        await _send_json(send, 400, {"success": False, "error": error})
+        return
+
+    key, queue = _hub.subscribe(payload, _client_key(scope))
+    try:
+        await _stream(send, receive, queue)
+    finally:
+        _hub.unsubscribe(key, queue)
+
+
+async def _job_events(job_id: str, receive: Receive, send: Send) -> None:
+    loop = asyncio.get_running_loop()
+    store = sbom_app._job_store()
+    queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue()
+
+    async def poll() -> None:
+        last_seq = 0
+        while True:
+            events = await loop.run_in_executor(None, store.events_after, job_id, last_seq)
+            for last_seq, event_payload in events:
+                queue.put_nowait(f"data: {event_payload}\n\n".encode("utf-8"))
+            if not events:
+                job = await loop.run_in_executor(None, store.get, job_id)
+                if not job or job["status"] in sbom_app.JOB_FINISHED_STATUSES:
+                    # Drain events recorded between the last poll and the job finishing.
+                    for last_seq, event_payload in await loop.run_in_executor(
+                        None, store.events_after, job_id, last_seq
+                    ):
+                        queue.put_nowait(f"data: {event_payload}\n\n".encode("utf-8"))
+                    queue.put_nowait(_sse(sbom_app._job_final_event(job_id, job)))
+                    queue.put_nowait(None)
+                    return
+                await asyncio.sleep(sbom_app.SBOM_JOB_EVENT_POLL)
+
+    poller = asyncio.ensure_future(poll())
+    try:
+        await _stream(send, receive, queue)
+    finally:
+        poller.cancel()
+
+
+def _wsgi_environ(scope: Scope, body: bytes) -> Dict[str, Any]:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client")
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0] if client else "",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers") or []:
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _call_wsgi(scope: Scope, receive: Receive, send: Send) -> None:
+    """Run the Flask app for one request on the thread pool and relay its response."""
+    body, connected = await _read_body(receive)
+    if not connected:
+        return
+    loop = asyncio.get_running_loop()
+    environ = _wsgi_environ(scope, body)
+    started: Dict[str, Any] = {}
+
+    def start_response(status: str, headers: List[Tuple[str, str]], exc_info: Any = None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        return lambda data: None
+
+    result = await loop.run_in_executor(_wsgi_pool, sbom_app.app.wsgi_app, environ, start_response)
+    chunks = iter(result)
+    sentinel = object()
+    try:
+        first = await loop.run_in_executor(_wsgi_pool, next, chunks, sentinel)
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        chunk = first
+        while chunk is not sentinel:
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            chunk = await loop.run_in_executor(_wsgi_pool, next, chunks, sentinel)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        close = getattr(result, "close", None)
+        if close is not None:
+            await loop.run_in_executor(_wsgi_pool, close)
+
+
+async def _lifespan(receive: Receive, send: Send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            sbom_app._SUBPROCESS_LOOP = asyncio.get_running_loop()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            sbom_app._SUBPROCESS_LOOP = None
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    if sbom_app._SUBPROCESS_LOOP is None:
+        # Servers started without lifespan support still get loop-watched scanners.
+        sbom_app._SUBPROCESS_LOOP = asyncio.get_running_loop()
+
+    method, path = scope["method"], scope["path"]
+    if method == "POST" and path == "/api/sbom/all/stream":
+        await _sbom_all_stream(scope, receive, send)
+        return
+    match = _JOB_EVENTS_PATH.match(path)
+    if method == "GET" and match:
+        job_id = match.group(1)
+        job = await asyncio.get_running_loop().run_in_executor(None, sbom_app._job_store().get, job_id)
+        if job:
+            await _job_events(job_id, receive, send)
+            return
+    await _call_wsgi(scope, receive, send)
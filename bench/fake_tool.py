@@ -0,0 +1,171 @@
+"""Stand-in for the ``syft`` and ``trivy`` CLIs used by the offline benchmark.
+
+Invoked as ``fake_tool.py <syft|trivy> <args...>``. It understands the argument
+shapes app.py builds, sleeps for ``BENCH_TOOL_LATENCY`` seconds, prints a few
+progress lines on stderr and writes a synthetic SPDX or CycloneDX document with
+``BENCH_SBOM_PACKAGES`` packages. Nothing touches the network.
+"""
+
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+VERSION = "0.0.0-bench"
+
+
+def _packages(count: int) -> Iterator[Tuple[int, str, str]]:
+    for index in range(count):
+        yield index, f"bench-package-{index}", f"1.{index % 100}.{index % 7}"
+
+
+def _write_spdx(fp: TextIO, name: str, count: int) -> None:
+    fp.write('{"spdxVersion": "SPDX-2.3", "dataLicense": "CC0-1.0", "SPDXID": "SPDXRef-DOCUMENT", ')
+    fp.write(f'"name": {json.dumps(name)}, "packages": [')
+    for index, package, version in _packages(count):
+        item = {
+            "name": package,
+            "SPDXID": f"SPDXRef-Package-{index}",
+            "versionInfo": version,
+            "licenseConcluded": "MIT",
+            "externalRefs": [
+                {
+                    "referenceCategory": "PACKAGE-MANAGER",
+                    "referenceType": "purl",
+                    "referenceLocator": f"pkg:generic/{package}@{version}",
+                }
+            ],
+        }
+        fp.write(("," if index else "") + json.dumps(item))
+    fp.write("]}\n")
+
+
+def _write_cyclonedx(fp: TextIO, name: str, count: int) -> None:
+    fp.write('{"bomFormat": "CycloneDX", "specVersion": "1.5", "version": 1, ')
+    fp.write(f'"metadata": {{"component": {{"name": {json.dumps(name)}}}}}, "components": [')
+    for index, package, version in _packages(count):
+        item = {
+            "type": "library",
+            "name": package,
+            "version": version,
+            "purl": f"pkg:generic/{package}@{version}",
+            "licenses": [{"license": {"id": "MIT"}}],
+        }
+        fp.write(("," if index else "") + json.dumps(item))
+    fp.write("]}\n")
+
+
+def _emit(sbom_format: str, name: str, path: Optional[str]) -> None:
+    count = int(os.environ.get("BENCH_SBOM_PACKAGES", "500"))
+    writer = _write_cyclonedx if "cyclonedx" in sbom_format else _write_spdx
+    if path:
+        with open(path, "w", encoding="utf-8") as fp:
+            writer(fp, name, count)
+    else:
+        writer(sys.stdout, name, count)
+
+
+def _progress(source: str) -> None:
+    latency = float(os.environ.get("BENCH_TOOL_LATENCY", "0.2"))
+    packages = int(os.environ.get("BENCH_SBOM_PACKAGES", "500"))
+    print(f"[0000]  INFO pulling image {source}", file=sys.stderr)
+    time.sleep(latency / 2)
+    print(f"[0001]  INFO cataloging packages={packages}", file=sys.stderr)
+    time.sleep(latency / 2)
+    print("[0002]  INFO writing report", file=sys.stderr)
+
+
+def _options(args: List[str], flags: Tuple[str, ...]) -> Tuple[Dict[str, List[str]], List[str]]:
+    """Split ``args`` into repeated ``--flag value`` options and positionals."""
+    options: Dict[str, List[str]] = {}
+    positionals: List[str] = []
+    iterator = iter(args)
+    for arg in iterator:
+        if arg in flags:
+            options.setdefault(arg, []).append(next(iterator, ""))
+        elif arg.startswith("-"):
+            continue
+        else:
+            positionals.append(arg)
+    return options, positionals
+
+
+def syft(args: List[str]) -> int:
+    if args[:1] == ["version"]:
+        print(f"Application: syft\nVersion: {VERSION}")
+        return 0
+    options, positionals = _options(args, ("-o", "--output", "--source-name", "--source-version"))
+    source = positionals[0] if positionals else "unknown"
+    _progress(source)
+    name = (options.get("--source-name") or [source])[0]
+    for output in options.get("-o", []) + options.get("--output", []) or ["spdx-json"]:
+        sbom_format, _, path = output.partition("=")
+        _emit(sbom_format, name, path or None)
+    return 0
+
+
+def _trivy_server(listen: str) -> int:
+    """Answer ``/healthz`` like ``trivy server`` until killed."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *_args: object) -> None:
+            pass
+
+        def do_GET(self) -> None:  # noqa: N802 - http.server naming
+            self.send_response(200 if self.path == "/healthz" else 404)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+    host, _, port = listen.rpartition(":")
+    ThreadingHTTPServer((host or "127.0.0.1", int(port)), Handler).serve_forever()
+    return 0
+
+
+def trivy(args: List[str]) -> int:
+    if args[:1] in (["--version"], ["version"]):
+        print(f"Version: {VERSION}")
+        return 0
+    command, rest = args[0], args[1:]
+    options, positionals = _options(rest, ("--format", "--output", "--scanners", "--input", "--server", "--listen"))
+    if command == "server":
+        return _trivy_server((options.get("--listen") or ["127.0.0.1:4954"])[0])
+    if options.get("--server"):
+        try:
+            urllib.request.urlopen(options["--server"][0] + "/healthz", timeout=2).close()
+        except (urllib.error.URLError, OSError) as exc:
+            print(f"scan error: twirp error internal: connection refused: {exc}", file=sys.stderr)
+            return 1
+    sbom_format = (options.get("--format") or ["json"])[0]
+    path = (options.get("--output") or [None])[0]
+    if command == "convert":
+        # Like Trivy, name the converted document after the report's artifact.
+        with open(positionals[0], encoding="utf-8") as fp:
+            name = json.load(fp).get("ArtifactName", "report")
+        _emit(sbom_format, name, path)
+        return 0
+    source = (options.get("--input") or positionals or ["unknown"])[0]
+    _progress(source)
+    if sbom_format == "json":
+        report = {"SchemaVersion": 2, "ArtifactName": source, "Results": []}
+        if path:
+            with open(path, "w", encoding="utf-8") as fp:
+                json.dump(report, fp)
+        else:
+            json.dump(report, sys.stdout)
+        return 0
+    _emit(sbom_format, source, path)
+    return 0
+
+
+def main() -> int:
+    tool, args = sys.argv[1], sys.argv[2:]
+    return {"syft": syft, "trivy": trivy}[tool](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,566 @@
+"""Offline benchmark for the SBOM service.
+
+Starts app.py (gunicorn or the Werkzeug server) with fake ``syft``/``trivy`` on PATH,
+a throwaway local registry and, optionally, a fake Docker Engine API socket, then
+drives ``/api/sbom``, ``/api/sbom/all``, ``/api/sbom/all/stream`` and
+``/api/download/<token>`` concurrently. Results (throughput, p50/p90/p99 latency,
+server peak RSS and per-stage means from ``/metrics``) are printed as JSON.
+
+Usage:
+    python bench/run.py --requests 40 --concurrency 8 --output bench_output.json
+    python bench/run.py --baseline bench_output.json   # exit 1 on regressions
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import socketserver
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_TOOL = os.path.join(REPO_ROOT, "bench", "fake_tool.py")
+SCENARIOS = ("sbom", "sbom_cached", "all", "all_cached", "stream", "download")
+FORMATS = ("spdx", "cyclonedx")
+TOOLS = ("syft", "trivy")
+
+
+def _digest(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+class _Image:
+    """Synthetic single-layer image whose manifest, config and layer are served by the fake registry."""
+
+    def __init__(self, name: str, layer_bytes: int):
+        self.config = json.dumps({"architecture": "amd64", "os": "linux", "config": {"Labels": {"bench": name}}}).encode()
+        seed = hashlib.sha256(name.encode()).digest()
+        self.layer = (seed * (layer_bytes // len(seed) + 1))[:layer_bytes]
+        self.manifest = json.dumps(
+            {
+                "schemaVersion": 2,
+                "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                "config": {
+                    "mediaType": "application/vnd.oci.image.config.v1+json",
+                    "digest": _digest(self.config),
+                    "size": len(self.config),
+                },
+                "layers": [
+                    {
+                        "mediaType": "application/vnd.oci.image.layer.v1.tar+gzip",
+                        "digest": _digest(self.layer),
+                        "size": len(self.layer),
+                    }
+                ],
+            }
+        ).encode()
+        self.blobs = {_digest(self.config): self.config, _digest(self.layer): self.layer}
+
+
+def _start_registry(layer_bytes: int) -> Tuple[ThreadingHTTPServer, int]:
+    images: Dict[str, _Image] = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *_args: Any) -> None:
+            pass
+
+        def _serve(self, with_body: bool) -> None:
+            match = re.match(r"^/v2/(.+)/(manifests|blobs)/([^/]+)$", urllib.parse.urlparse(self.path).path)
+            if not match:
+                self._send(404, b"", "text/plain", with_body)
+                return
+            repository, kind, reference = match.groups()
+            with lock:
+                image = images.get(repository) or images.setdefault(repository, _Image(repository, layer_bytes))
+            if kind == "manifests":
+                if reference.startswith("sha256:") and reference != _digest(image.manifest):
+                    self._send(404, b"", "text/plain", with_body)
+                else:
+                    self._send(200, image.manifest, "application/vnd.oci.image.manifest.v1+json", with_body)
+                return
+            body = image.blobs.get(reference)
+            if body is None:
+                self._send(404, b"", "text/plain", with_body)
+                return
+            self._send(200, body, "application/octet-stream", with_body)
+
+        def _send(self, status: int, body: bytes, content_type: str, with_body: bool) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if body:
+                self.send_header("Docker-Content-Digest", _digest(body))
+            self.end_headers()
+            if with_body:
+                self.wfile.write(body)
+
+        def do_GET(self) -> None:  # noqa: N802 - http.server naming
+            self._serve(True)
+
+        def do_HEAD(self) -> None:  # noqa: N802 - http.server naming
+            self._serve(False)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _start_docker(socket_path: str, pull_latency: float) -> _UnixHTTPServer:
+    """Fake Docker Engine API: images are "pulled" with a few streamed progress messages."""
+    pulled = set()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def address_string(self) -> str:
+            return "docker.sock"
+
+        def log_message(self, *_args: Any) -> None:
+            pass
+
+        def _reply(self, status: int, body: bytes) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:  # noqa: N802 - http.server naming
+            path = urllib.parse.urlparse(self.path).path
+            if path == "/_ping":
+                self._reply(200, b"OK")
+                return
+            match = re.match(r"^/images/(.+)/json$", path)
+            with lock:
+                present = bool(match) and urllib.parse.unquote(match.group(1)) in pulled
+            self._reply(200 if present else 404, b"{}" if present else b'{"message": "No such image"}')
+
+        def do_POST(self) -> None:  # noqa: N802 - http.server naming
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            image = query.get("fromImage", [""])[0]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for layer in range(3):
+                for status in ("Downloading", "Pull complete"):
+                    message = {"status": status, "id": f"layer{layer}", "progressDetail": {}}
+                    self.wfile.write(json.dumps(message).encode() + b"\n")
+                    self.wfile.flush()
+                    time.sleep(pull_latency / 6)
+            self.wfile.write(json.dumps({"status": f"Status: Downloaded newer image for {image}"}).encode() + b"\n")
+            with lock:
+                pulled.add(image)
+            self.close_connection = True
+
+        def do_DELETE(self) -> None:  # noqa: N802 - http.server naming
+            match = re.match(r"^/images/(.+)$", urllib.parse.urlparse(self.path).path)
+            with lock:
+                pulled.discard(urllib.parse.unquote(match.group(1)) if match else "")
+            self._reply(200, b"[]")
+
+    server = _UnixHTTPServer(socket_path, Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _write_fake_tools(bin_dir: str) -> None:
+    for tool in TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, "w", encoding="utf-8") as fp:
+            fp.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_TOOL}" {tool} "$@"\n')
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(args: argparse.Namespace, env: Dict[str, str], port: int) -> subprocess.Popen:
+    if args.server == "gunicorn":
+        command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--workers",
+            str(args.workers),
+            "--threads",
+            str(args.threads),
+            "--timeout",
+            "600",
+            "app:app",
+        ]
+    else:
+        command = [sys.executable, "-c", f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1):
+                return process
+        except (urllib.error.URLError, OSError):
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with {process.returncode}")
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("server did not become ready")
+
+
+def _process_tree(root_pid: int) -> List[int]:
+    """Return ``root_pid`` and its live descendants, excluding the fake scanners."""
+    parents: Dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r", encoding="utf-8") as fp:
+                parents[int(entry)] = int(fp.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline", "rb") as fp:
+                if FAKE_TOOL.encode() in fp.read():
+                    parents.pop(int(entry), None)
+        except (OSError, ValueError, IndexError):
+            continue
+    tree = [root_pid]
+    for pid in tree:
+        tree.extend(child for child, parent in parents.items() if parent == pid)
+    return tree
+
+
+def _peak_rss(root_pid: int) -> Dict[str, int]:
+    """Peak RSS (VmHWM) of the busiest server process and of all server processes together."""
+    peaks = []
+    for pid in _process_tree(root_pid):
+        try:
+            with open(f"/proc/{pid}/status", "r", encoding="utf-8") as fp:
+                match = re.search(r"^VmHWM:\s+(\d+) kB", fp.read(), re.MULTILINE)
+        except OSError:
+            continue
+        if match:
+            peaks.append(int(match.group(1)) * 1024)
+    return {"max_process_bytes": max(peaks, default=0), "total_bytes": sum(peaks)}
+
+
+def _request(
+    base_url: str, method: str, path: str, payload: Optional[Dict[str, Any]] = None, accept_encoding: str = ""
+) -> Tuple[int, bytes]:
+    """Send one request; the body is returned decoded, as a browser would see it."""
+    data = json.dumps(payload).encode() if payload is not None else None
+    headers = {"Content-Type": "application/json"}
+    if accept_encoding:
+        headers["Accept-Encoding"] = accept_encoding
+    req = urllib.request.Request(base_url + path, data=data, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            body = resp.read()
+            _WIRE_BYTES.add(len(body))
+            encoding = resp.headers.get("Content-Encoding")
+            if encoding == "gzip":
+                body = gzip.decompress(body)
+            elif encoding:
+                raise ValueError(f"unexpected Content-Encoding {encoding}")
+            return resp.status, body
+    except urllib.error.HTTPError as exc:
+        return exc.code, exc.read()
+
+
+class _ByteCounter:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def add(self, count: int) -> None:
+        with self._lock:
+            self.total += count
+
+    def take(self) -> int:
+        with self._lock:
+            total, self.total = self.total, 0
+        return total
+
+
+_WIRE_BYTES = _ByteCounter()
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percentile / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _run_scenario(
+    requests: int, concurrency: int, call: Callable[[int], Tuple[bool, int]]
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    received = 0
+    lock = threading.Lock()
+
+    def one(index: int) -> None:
+        nonlocal errors, received
+        started = time.perf_counter()
+        try:
+            ok, size = call(index)
+        except (OSError, ValueError, KeyError) as exc:
+            print(f"request {index} failed: {exc}", file=sys.stderr)
+            ok, size = False, 0
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            received += size
+            errors += 0 if ok else 1
+
+    _WIRE_BYTES.take()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": errors,
+        "wall_seconds": round(wall, 4),
+        "throughput_rps": round(requests / wall, 3) if wall else 0.0,
+        "bytes_received": received,
+        "bytes_on_wire": _WIRE_BYTES.take(),
+        "latency_ms": {
+            name: round(_percentile(latencies, percentile) * 1000, 2)
+            for name, percentile in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))
+        },
+    }
+
+
+def _stage_means(metrics_text: str) -> Dict[str, Dict[str, float]]:
+    """Aggregate ``sbom_stage_duration_seconds`` sums/counts per stage across tool/format labels."""
+    totals: Dict[str, Dict[str, float]] = {}
+    for line in metrics_text.splitlines():
+        match = re.match(r'^sbom_stage_duration_seconds_(sum|count)\{(.*)\} (\S+)$', line)
+        if not match:
+            continue
+        stage = re.search(r'stage="([^"]*)"', match.group(2)).group(1)
+        entry = totals.setdefault(stage, {"sum": 0.0, "count": 0.0})
+        entry[match.group(1)] += float(match.group(3))
+    return {
+        stage: {"count": int(entry["count"]), "mean_ms": round(entry["sum"] / entry["count"] * 1000, 3) if entry["count"] else 0.0}
+        for stage, entry in sorted(totals.items())
+    }
+
+
+def _compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for key in ("p50", "p99"):
+            before, after = previous["latency_ms"][key], current["latency_ms"][key]
+            if before and after > before * (1 + max_regression):
+                regressions.append(f"{name}: {key} latency {before}ms -> {after}ms")
+        before, after = previous["throughput_rps"], current["throughput_rps"]
+        if before and after < before * (1 - max_regression):
+            regressions.append(f"{name}: throughput {before} -> {after} req/s")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--images", type=int, default=4, help="distinct image references to cycle through")
+    parser.add_argument("--packages", type=int, default=500, help="packages per synthetic SBOM")
+    parser.add_argument("--tool-latency", type=float, default=0.2, help="seconds each fake scanner run takes")
+    parser.add_argument("--layer-bytes", type=int, default=256 * 1024, help="size of each synthetic image layer")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--server", choices=("gunicorn", "werkzeug"), default="gunicorn")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--docker", action="store_true", help="serve a fake Docker Engine API instead of OCI staging")
+    parser.add_argument("--pull-latency", type=float, default=0.1, help="seconds each fake docker pull takes")
+    parser.add_argument("--accept-encoding", default="", help='e.g. "gzip" to exercise compressed responses')
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="extra server environment")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="previous results to compare against; exit 1 on regressions")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="tolerated relative slowdown (0.25 = 25%%)")
+    args = parser.parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="sbom-bench-")
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir)
+    _write_fake_tools(bin_dir)
+    registry, registry_port = _start_registry(args.layer_bytes)
+    docker_socket = os.path.join(workdir, "docker.sock")
+    docker = _start_docker(docker_socket, args.pull_latency) if args.docker else None
+
+    env = os.environ.copy()
+    env.update(
+        {
+            "PATH": bin_dir + os.pathsep + env.get("PATH", ""),
+            "SBOM_OUTPUT_DIR": os.path.join(workdir, "output"),
+            "DOCKER_HOST": f"unix://{docker_socket}",
+            "DOCKER_CONFIG": os.path.join(workdir, "docker-config"),
+            "BENCH_SBOM_PACKAGES": str(args.packages),
+            "BENCH_TOOL_LATENCY": str(args.tool_latency),
+            "PYTHONDONTWRITEBYTECODE": "1",
+        }
+    )
+    for item in args.env:
+        name, _, value = item.partition("=")
+        env[name] = value
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = _start_server(args, env, port)
+    images = [f"127.0.0.1:{registry_port}/bench/img-{index}:latest" for index in range(args.images)]
+    tokens: List[str] = []
+    tokens_lock = threading.Lock()
+
+    def keep_token(token: Optional[str]) -> None:
+        if token:
+            with tokens_lock:
+                tokens.append(token)
+
+    def sbom(no_cache: bool) -> Callable[[int], Tuple[bool, int]]:
+        def call(index: int) -> Tuple[bool, int]:
+            payload = {
+                "image_ref": images[index % len(images)],
+                "tool": TOOLS[index % len(TOOLS)],
+                "format": FORMATS[(index // len(TOOLS)) % len(FORMATS)],
+                "no_cache": no_cache,
+            }
+            status, body = _request(base_url, "POST", "/api/sbom", payload, args.accept_encoding)
+            data = json.loads(body)
+            keep_token(data.get("download_token"))
+            return status == 200 and data.get("success", False), len(body)
+
+        return call
+
+    def bulk(no_cache: bool) -> Callable[[int], Tuple[bool, int]]:
+        def call(index: int) -> Tuple[bool, int]:
+            payload = {"image_ref": images[index % len(images)], "no_cache": no_cache}
+            status, body = _request(base_url, "POST", "/api/sbom/all", payload, args.accept_encoding)
+            data = json.loads(body)
+            keep_token(data.get("zip_download_token"))
+            return status == 200 and data.get("all_succeeded", False), len(body)
+
+        return call
+
+    def stream(index: int) -> Tuple[bool, int]:
+        payload = {"image_ref": images[index % len(images)]}
+        status, body = _request(base_url, "POST", "/api/sbom/all/stream", payload)
+        events = [json.loads(line[6:]) for line in body.decode().splitlines() if line.startswith("data: ")]
+        done = bool(events) and events[-1].get("type") == "done" and events[-1].get("success", True)
+        return status == 200 and done, len(body)
+
+    def download(index: int) -> Tuple[bool, int]:
+        with tokens_lock:
+            token = tokens[index % len(tokens)] if tokens else None
+        if token is None:
+            return False, 0
+        status, body = _request(base_url, "GET", f"/api/download/{token}", accept_encoding=args.accept_encoding)
+        return status == 200, len(body)
+
+    calls: Dict[str, Callable[[int], Tuple[bool, int]]] = {
+        "sbom": sbom(True),
+        "sbom_cached": sbom(False),
+        "all": bulk(True),
+        "all_cached": bulk(False),
+        "stream": stream,
+        "download": download,
+    }
+
+    results: Dict[str, Any] = {
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "requests",
+                "concurrency",
+                "images",
+                "packages",
+                "tool_latency",
+                "server",
+                "workers",
+                "threads",
+                "docker",
+                "accept_encoding",
+            )
+        },
+        "scenarios": {},
+    }
+    try:
+        for name in scenarios:
+            print(f"running {name} ...", file=sys.stderr)
+            results["scenarios"][name] = _run_scenario(args.requests, args.concurrency, calls[name])
+        results["server_peak_rss"] = _peak_rss(server.pid)
+        _, metrics_body = _request(base_url, "GET", "/metrics")
+        results["stages"] = _stage_means(metrics_body.decode())
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        registry.shutdown()
+        if docker is not None:
+            docker.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    rendered = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            fp.write(rendered + "\n")
+    else:
+        print(rendered)
+
+    for name, scenario in results["scenarios"].items():
+        latency = scenario["latency_ms"]
+        print(
+            f"{name:12s} {scenario['throughput_rps']:8.2f} req/s  p50 {latency['p50']:8.1f}ms  "
+            f"p99 {latency['p99']:8.1f}ms  errors {scenario['errors']}",
+            file=sys.stderr,
+        )
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fp:
+            regressions = _compare(results, json.load(fp), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+"""Import app.py against a scratch ``SBOM_OUTPUT_DIR`` with the benchmark's fake ``syft``/``trivy`` on PATH.
+
+app.py reads its configuration at import time, so the environment is set up here, before any test
+module imports it.
+"""
+
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_TOOL = os.path.join(REPO_ROOT, "bench", "fake_tool.py")
+
+_scratch = tempfile.mkdtemp(prefix="sbom-tests-")
+_bin_dir = os.path.join(_scratch, "bin")
+os.makedirs(_bin_dir)
+for _tool in ("syft", "trivy"):
+    _wrapper = os.path.join(_bin_dir, _tool)
+    with open(_wrapper, "w", encoding="utf-8") as fp:
+        fp.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_TOOL}" {_tool} "$@"\n')
+    os.chmod(_wrapper, 0o755)
+
+os.environ["PATH"] = _bin_dir + os.pathsep + os.environ.get("PATH", "")
+os.environ["SBOM_OUTPUT_DIR"] = os.path.join(_scratch, "sboms")
+os.environ["SBOM_ARCHIVE_GC_INTERVAL"] = "0"
+os.environ["BENCH_TOOL_LATENCY"] = "0"
+os.environ["BENCH_SBOM_PACKAGES"] = "5"
+sys.path.insert(0, REPO_ROOT)
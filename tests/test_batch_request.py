@@ -0,0 +1,28 @@
+"""Batch payloads: image_refs must be text or a list of strings, and refs naming the same image are scanned once."""
+
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("image_refs", [5, {"nginx": "x"}, ["nginx", 5], [["nginx"]], True])
+def test_malformed_image_refs_are_rejected(image_refs):
+    response = app.app.test_client().post("/api/sbom/batch", json={"image_refs": image_refs})
+    assert response.status_code == 400
+    assert "image_refs" in response.get_json()["error"]
+
+
+def test_missing_image_refs_are_rejected():
+    response = app.app.test_client().post("/api/sbom/batch", json={})
+    assert response.status_code == 400
+
+
+def test_refs_naming_the_same_image_are_kept_once():
+    refs = app._parse_image_refs(
+        ["nginx", "docker.io/nginx", "docker.io/library/nginx:latest", "index.docker.io/library/nginx", "nginx:1.27"]
+    )
+    assert refs == ["nginx", "nginx:1.27"]
+    assert app._parse_image_refs("alpine:3.20\n# comment\n\nalpine:3.20  # again\nghcr.io/acme/alpine:3.20\n") == [
+        "alpine:3.20",
+        "ghcr.io/acme/alpine:3.20",
+    ]
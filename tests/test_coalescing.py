@@ -0,0 +1,124 @@
+"""Concurrent scans of one image share a scanner run when the running scan covers the requested formats."""
+
+import threading
+import time
+
+import app
+
+
+def test_single_format_request_joins_running_multi_format_scan(monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    def fake_scan_formats(tool, image_ref, sbom_formats, **kwargs):
+        calls.append(list(sbom_formats))
+        release.wait(5)
+        outputs = {}
+        for sbom_format in sbom_formats:
+            path = app._new_output_path(app._build_filename(image_ref, tool, sbom_format))
+            with open(path, "w", encoding="utf-8") as fp:
+                fp.write("{}")
+            outputs[sbom_format] = (True, path)
+        return "scan", outputs, {sbom_format: "miss" for sbom_format in sbom_formats}
+
+    monkeypatch.setattr(app, "_scan_formats", fake_scan_formats)
+    results = {}
+
+    def bulk():
+        results["bulk"] = app._coalesced_scan("syft", "alpine:3.20", ["spdx", "cyclonedx"], prefer_local=True)
+
+    leader = threading.Thread(target=bulk)
+    leader.start()
+    while not calls:
+        time.sleep(0.01)
+    follower = threading.Thread(
+        target=lambda: results.update(single=app._coalesced_scan("syft", "alpine:3.20", ["cyclonedx"]))
+    )
+    follower.start()
+    time.sleep(0.1)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert calls == [["spdx", "cyclonedx"]]
+    _, outputs, cache_status, shared = results["single"]
+    assert shared
+    assert list(outputs) == ["cyclonedx"]
+    assert cache_status == {"cyclonedx": "miss"}
+    assert outputs["cyclonedx"][1] != results["bulk"][1]["cyclonedx"][1]
+
+
+def _scan_while_first_runs(monkeypatch, first, second):
+    """Start the ``first`` call, then the ``second`` while it runs; return the scans that reached the scanner."""
+    calls = []
+    release = threading.Event()
+
+    def fake_scan_formats(tool, image_ref, sbom_formats, **kwargs):
+        calls.append((tool, list(sbom_formats), kwargs.get("use_cache", True)))
+        release.wait(5)
+        return "scan", {sbom_format: (False, "failed") for sbom_format in sbom_formats}, {}
+
+    monkeypatch.setattr(app, "_scan_formats", fake_scan_formats)
+    threads = [
+        threading.Thread(target=app._coalesced_scan, args=args[:3], kwargs=args[3] if len(args) > 3 else {})
+        for args in (first, second)
+    ]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.01)
+    threads[1].start()
+    deadline = time.monotonic() + 5
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    return calls
+
+
+def test_wider_request_does_not_join_narrower_scan(monkeypatch):
+    calls = _scan_while_first_runs(
+        monkeypatch, ("syft", "alpine:3.20", ["spdx"]), ("syft", "alpine:3.20", ["spdx", "cyclonedx"])
+    )
+    assert [formats for _, formats, _ in calls] == [["spdx"], ["spdx", "cyclonedx"]]
+
+
+def test_direct_trivy_scan_does_not_join_converted_report_scan(monkeypatch):
+    calls = _scan_while_first_runs(
+        monkeypatch, ("trivy", "alpine:3.20", ["spdx", "cyclonedx"]), ("trivy", "alpine:3.20", ["spdx"])
+    )
+    assert [formats for _, formats, _ in calls] == [["spdx", "cyclonedx"], ["spdx"]]
+
+
+def test_uncached_request_does_not_join_scan_that_may_use_the_cache(monkeypatch):
+    calls = _scan_while_first_runs(
+        monkeypatch,
+        ("syft", "alpine:3.20", ["spdx", "cyclonedx"]),
+        ("syft", "alpine:3.20", ["spdx"], {"use_cache": False}),
+    )
+    assert [use_cache for _, _, use_cache in calls] == [True, False]
+
+
+def test_cached_request_joins_uncached_scan(monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    def fake_scan_formats(tool, image_ref, sbom_formats, **kwargs):
+        calls.append(kwargs["use_cache"])
+        release.wait(5)
+        return "scan", {sbom_format: (False, "failed") for sbom_format in sbom_formats}, {"spdx": "bypass"}
+
+    monkeypatch.setattr(app, "_scan_formats", fake_scan_formats)
+    results = {}
+    leader = threading.Thread(target=app._coalesced_scan, args=("syft", "alpine:3.20", ["spdx"]), kwargs={"use_cache": False})
+    leader.start()
+    while not calls:
+        time.sleep(0.01)
+    follower = threading.Thread(target=lambda: results.update(follower=app._coalesced_scan("syft", "alpine:3.20", ["spdx"])))
+    follower.start()
+    time.sleep(0.1)
+    release.set()
+    leader.join()
+    follower.join()
+    assert calls == [False]
+    assert results["follower"][3]
@@ -0,0 +1,59 @@
+"""The component index parses SBOMs incrementally with ijson rather than loading whole documents."""
+
+import json
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def no_whole_document_load(monkeypatch):
+    def fail(*_args, **_kwargs):
+        raise AssertionError("SBOM was loaded whole instead of streamed")
+
+    monkeypatch.setattr(app.json, "load", fail)
+
+
+def test_ijson_is_available():
+    assert app.ijson is not None
+
+
+def test_spdx_components_are_streamed(tmp_path, no_whole_document_load):
+    path = tmp_path / "sbom.spdx.json"
+    path.write_text(
+        json.dumps(
+            {
+                "spdxVersion": "SPDX-2.3",
+                "packages": [
+                    {
+                        "name": "openssl",
+                        "versionInfo": "3.0.11",
+                        "licenseConcluded": "Apache-2.0",
+                        "externalRefs": [{"referenceType": "purl", "referenceLocator": "pkg:deb/debian/openssl@3.0.11"}],
+                    },
+                    {"name": "", "versionInfo": "1"},
+                    {"name": "zlib", "versionInfo": "1.3", "licenseConcluded": "NOASSERTION"},
+                ],
+            }
+        )
+    )
+    assert list(app._iter_components(str(path), "spdx")) == [
+        ("openssl", "3.0.11", "pkg:deb/debian/openssl@3.0.11", "Apache-2.0"),
+        ("zlib", "1.3", None, None),
+    ]
+
+
+def test_cyclonedx_components_are_streamed(tmp_path, no_whole_document_load):
+    path = tmp_path / "sbom.cdx.json"
+    path.write_text(
+        json.dumps(
+            {
+                "bomFormat": "CycloneDX",
+                "components": [
+                    {"name": "lodash", "version": "4.17.21", "purl": "pkg:npm/lodash@4.17.21", "licenses": [{"license": {"id": "MIT"}}]}
+                ],
+            }
+        )
+    )
+    assert list(app._iter_components(str(path), "cyclonedx")) == [("lodash", "4.17.21", "pkg:npm/lodash@4.17.21", "MIT")]
@@ -0,0 +1,80 @@
+"""Download tokens reference generated files; ETag, Range and X-Accel-Redirect are served from that one path."""
+
+import gzip
+import hashlib
+import os
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def sbom_file():
+    path = app._new_output_path("alpine-3-syft-spdx.json")
+    with open(path, "wb") as fp:
+        fp.write(b'{"spdxVersion": "SPDX-2.3", "packages": []}' + b" " * 2048)
+    return path
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def token_store(request, monkeypatch):
+    monkeypatch.setattr(app, "SBOM_TOKEN_STORE", request.param)
+    monkeypatch.setattr(app, "SBOM_PRECOMPRESS", [])
+    app._token_store.cache_clear()
+    yield request.param
+    app._token_store.cache_clear()
+
+
+def test_download_etag_and_range(sbom_file, token_store):
+    with app.app.app_context():
+        token = app._cache_download(sbom_file, "alpine.spdx.json")
+    client = app.app.test_client()
+    with open(sbom_file, "rb") as fp:
+        body = fp.read()
+
+    response = client.get(f"/api/download/{token}")
+    assert response.status_code == 200
+    assert response.data == body
+    assert response.headers["ETag"] == f'"{hashlib.sha256(body).hexdigest()}"'
+    assert "attachment" in response.headers["Content-Disposition"]
+
+    assert client.get(f"/api/download/{token}", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+    partial = client.get(f"/api/download/{token}", headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.data == body[:10]
+    assert client.get("/api/download/unknown").status_code == 404
+
+
+def test_download_serves_precompressed_variant(sbom_file, token_store, monkeypatch):
+    with open(sbom_file, "rb") as fp:
+        body = fp.read()
+    with open(sbom_file + ".gz", "wb") as fp:
+        fp.write(gzip.compress(body))
+    monkeypatch.setattr(app, "SBOM_PRECOMPRESS", ["gzip"])
+    with app.app.app_context():
+        token = app._cache_download(sbom_file, "alpine.spdx.json")
+    app._precompress_executor().submit(lambda: None).result()
+    response = app.app.test_client().get(f"/api/download/{token}", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == body
+
+
+def test_download_hands_body_to_nginx(sbom_file, token_store, monkeypatch):
+    monkeypatch.setattr(app, "SBOM_ACCEL_REDIRECT_PREFIX", "/_sbom_files/")
+    with app.app.app_context():
+        token = app._cache_download(sbom_file, "alpine.spdx.json")
+    response = app.app.test_client().get(f"/api/download/{token}")
+    assert response.status_code == 200
+    assert response.data == b""
+    assert response.headers["X-Accel-Redirect"] == "/_sbom_files/" + os.path.basename(sbom_file)
+
+
+def test_sqlite_store_evicts_references_but_keeps_files(sbom_file, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "SBOM_DOWNLOAD_MAX_BYTES", os.path.getsize(sbom_file))
+    store = app._SqliteTokenStore(str(tmp_path / "tokens.db"))
+    store.put("older", sbom_file, "alpine.spdx.json", "application/json")
+    store.put("newer", sbom_file, "alpine.spdx.json", "application/json")
+    assert store.get("older") is None
+    assert store.get("newer") == (sbom_file, "alpine.spdx.json", "application/json")
+    assert os.path.isfile(sbom_file)
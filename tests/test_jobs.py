@@ -0,0 +1,66 @@
+"""POST /api/jobs queues work on the job pool and answers 429 with Retry-After once the queue is full."""
+
+import threading
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def blocking_jobs(monkeypatch):
+    """Replace the ``sbom`` job runner with one that waits for ``release``."""
+    release = threading.Event()
+    validate, _ = app.JOB_TYPES["sbom"]
+
+    def runner(payload, progress_cb=None, client=""):
+        progress_cb({"type": "progress", "phase": "waiting"})
+        release.wait(10)
+        return {"success": True}, 200
+
+    monkeypatch.setitem(app.JOB_TYPES, "sbom", (validate, runner))
+    monkeypatch.setattr(app, "SBOM_JOB_WORKERS", 1)
+    monkeypatch.setattr(app, "SBOM_JOB_QUEUE_DEPTH", 1)
+    yield release
+    release.set()
+
+
+def _wait_for_status(job_id, statuses, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = app._job_store().get(job_id)
+        if job and job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} never reached {statuses}")
+
+
+def test_full_queue_answers_429_with_retry_after(blocking_jobs):
+    client = app.app.test_client()
+    payload = {"type": "sbom", "image_ref": "alpine:3.20"}
+    accepted = [client.post("/api/jobs", json=payload) for _ in range(2)]
+    assert [response.status_code for response in accepted] == [202, 202]
+
+    rejected = client.post("/api/jobs", json=payload)
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "5"
+    assert app._JOB_ACTIVE == 2
+
+    blocking_jobs.set()
+    for response in accepted:
+        job = _wait_for_status(response.get_json()["job_id"], app.JOB_FINISHED_STATUSES)
+        assert job["status"] == "succeeded"
+    deadline = time.monotonic() + 5
+    while app._JOB_ACTIVE and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert app._JOB_ACTIVE == 0
+    again = client.post("/api/jobs", json=payload)
+    assert again.status_code == 202
+    _wait_for_status(again.get_json()["job_id"], app.JOB_FINISHED_STATUSES)
+
+
+def test_invalid_job_is_rejected_without_taking_a_slot():
+    response = app.app.test_client().post("/api/jobs", json={"type": "sbom", "image_ref": ""})
+    assert response.status_code == 400
+    assert app._JOB_ACTIVE == 0
@@ -0,0 +1,24 @@
+"""Histograms in /metrics must expose every configured bucket for each series."""
+
+import re
+
+import app
+
+
+def test_histogram_series_have_every_bucket(tmp_path, monkeypatch):
+    store = app._MetricsStore(str(tmp_path / "metrics.sqlite3"))
+    monkeypatch.setattr(app, "_metrics", lambda: store)
+    labels = {"stage": "scan", "tool": "syft", "format": "spdx"}
+    store.observe("sbom_stage_duration_seconds", labels, 3.0, app.DURATION_BUCKETS)
+    store.observe("sbom_stage_duration_seconds", labels, 0.07, app.DURATION_BUCKETS)
+
+    text = app._render_metrics()
+    buckets = re.findall(r'sbom_stage_duration_seconds_bucket\{.*le="([^"]+)".*\} (\d+)', text)
+    expected = [app._format_bound(bound) for bound in app.DURATION_BUCKETS] + ["+Inf"]
+    assert [le for le, _ in buckets] == expected
+    counts = [int(count) for _, count in buckets]
+    assert counts == sorted(counts)
+    assert dict(buckets)["0.05"] == "0"
+    assert dict(buckets)["0.1"] == "1"
+    assert dict(buckets)["5"] == "2"
+    assert 'sbom_stage_duration_seconds_count{format="spdx",stage="scan",tool="syft"} 2' in text
@@ -0,0 +1,44 @@
+"""Scans of a staged OCI layout must name the SBOM subject after the image, not the layout path."""
+
+import json
+
+import app
+
+IMAGE = "ghcr.io/example/web:1.2"
+
+
+def _subject(path, sbom_format):
+    with open(path, encoding="utf-8") as fp:
+        document = json.load(fp)
+    return document["name"] if sbom_format == "spdx" else document["metadata"]["component"]["name"]
+
+
+def test_image_source_name():
+    assert app._image_source_name("nginx") == ("nginx", "latest")
+    assert app._image_source_name("localhost:5000/web:1.2") == ("localhost:5000/web", "1.2")
+    assert app._image_source_name("web:1.2@sha256:abc") == ("web", "sha256:abc")
+
+
+def test_syft_names_layout_source(tmp_path):
+    command = app._build_command("syft", IMAGE, "spdx", oci_layout=str(tmp_path))
+    assert command[1:6] == [f"oci-dir:{tmp_path}", "--source-name", "ghcr.io/example/web", "--source-version", "1.2"]
+    _, outputs = app._scan_pending("syft", IMAGE, ["spdx"], ["spdx"], False, None, str(tmp_path), None)
+    success, path = outputs["spdx"]
+    assert success
+    assert _subject(path, "spdx") == "ghcr.io/example/web"
+
+
+def test_trivy_single_format_names_image(tmp_path):
+    _, outputs = app._scan_pending("trivy", IMAGE, ["cyclonedx"], ["cyclonedx"], False, None, str(tmp_path), None)
+    success, path = outputs["cyclonedx"]
+    assert success
+    assert _subject(path, "cyclonedx") == IMAGE
+
+
+def test_trivy_multi_format_names_image(tmp_path):
+    formats = ["spdx", "cyclonedx"]
+    _, outputs = app._scan_pending("trivy", IMAGE, formats, formats, False, None, str(tmp_path), None)
+    for sbom_format in formats:
+        success, path = outputs[sbom_format]
+        assert success
+        assert _subject(path, sbom_format) == IMAGE
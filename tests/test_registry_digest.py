@@ -0,0 +1,61 @@
+"""Digests are resolved with the caller's credentials, so cached SBOMs only reach callers who can read the manifest."""
+
+import email.message
+import io
+import urllib.error
+import urllib.request
+
+import pytest
+
+import app
+
+DIGEST = "sha256:" + "ab" * 32
+PRIVATE_REF = f"ghcr.io/victim/private@{DIGEST}"
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Answer manifest requests with 200 for the password ``right`` and 401 otherwise; record each request."""
+    requests = []
+
+    def open_(registry_request, timeout=None):
+        requests.append((registry_request.get_method(), registry_request.full_url))
+        if registry_request.get_header("Authorization") != "Basic dXNlcjpyaWdodA==":
+            headers = email.message.Message()
+            headers["WWW-Authenticate"] = 'Basic realm="registry"'
+            raise urllib.error.HTTPError(registry_request.full_url, 401, "Unauthorized", headers, io.BytesIO())
+        headers = email.message.Message()
+        headers["Docker-Content-Digest"] = DIGEST
+        return urllib.request.addinfourl(io.BytesIO(), headers, registry_request.full_url, 200)
+
+    monkeypatch.setattr(app._REGISTRY_OPENER, "open", open_)
+    return requests
+
+
+def test_digest_reference_is_checked_against_the_registry(registry):
+    assert app._resolve_image_digest(PRIVATE_REF, "user", "right") == DIGEST
+    assert app._resolve_image_digest(PRIVATE_REF, "user", "wrong") is None
+    assert app._resolve_image_digest(PRIVATE_REF) is None
+    assert registry and all(method == "HEAD" for method, _ in registry)
+    assert all(url.endswith(f"/v2/victim/private/manifests/{DIGEST}") for _, url in registry)
+
+
+def test_digest_reference_with_wrong_credentials_misses_the_cache(registry, monkeypatch):
+    monkeypatch.setattr(app, "SBOM_RESULT_CACHE", True)
+    monkeypatch.setattr(app, "SBOM_OCI_STAGING", False)
+    monkeypatch.setattr(app, "_docker_available", lambda: False)
+    cached = app._new_output_path("private-syft-spdx.json")
+    with open(cached, "w", encoding="utf-8") as fp:
+        fp.write('{"spdxVersion": "SPDX-2.3", "name": "private", "packages": []}')
+    app._result_cache_put(DIGEST, "syft", "spdx", cached)
+
+    payload = {"image_ref": PRIVATE_REF, "tool": "syft", "format": "spdx"}
+    body, status_code = app._run_sbom_request(dict(payload, registry_username="user", registry_password="wrong"))
+    assert status_code == 200
+    assert body["cache"] != "hit"
+    assert body["image_digest"] is None
+    assert '"name": "private"' not in body["sbom"]
+
+    body, _ = app._run_sbom_request(dict(payload, registry_username="user", registry_password="right"))
+    assert body["cache"] == "hit"
+    assert body["image_digest"] == DIGEST
@@ -0,0 +1,80 @@
+"""/api/sbom/<token>/components pages through a stored SBOM via an offset index built on first use."""
+
+import json
+import os
+
+import pytest
+
+import app
+
+
+def _spdx_document(count):
+    packages = [
+        {
+            "name": "naïve-lib" if number == 3 else f"pkg-{number}",
+            "versionInfo": f"1.{number}",
+            "licenseConcluded": "MIT" if number % 2 else "NOASSERTION",
+            "externalRefs": [{"referenceType": "purl", "referenceLocator": f"pkg:apk/alpine/pkg-{number}@1.{number}"}],
+        }
+        for number in range(count)
+    ]
+    return {"spdxVersion": "SPDX-2.3", "name": "alpine", "packages": packages, "relationships": [{"x": 1}]}
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "SBOM_TOKEN_STORE", "memory")
+    monkeypatch.setattr(app, "SBOM_PRECOMPRESS", [])
+    monkeypatch.setattr(app, "SBOM_OFFSET_INDEX_DIR", str(tmp_path / "offsets"))
+    app._token_store.cache_clear()
+    app._offset_indexes.clear()
+    yield app.app.test_client()
+    app._token_store.cache_clear()
+    app._offset_indexes.clear()
+
+
+def _register(document, indent=None):
+    path = app._new_output_path("alpine-3-syft-spdx.json")
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(document, fp, indent=indent, ensure_ascii=False)
+    with app.app.app_context():
+        return app._cache_download(path, "alpine.spdx.json")
+
+
+def test_index_is_built_on_first_request(client):
+    token = _register(_spdx_document(10))
+    assert not os.path.isdir(app.SBOM_OFFSET_INDEX_DIR)
+
+    body = client.get(f"/api/sbom/{token}/components?offset=2&limit=3").get_json()
+    assert body["key"] == "packages"
+    assert body["count"] == 10
+    assert [item["name"] for item in body["items"]] == ["pkg-2", "naïve-lib", "pkg-4"]
+    assert body["items"][0]["license"] is None
+    assert body["items"][1]["license"] == "MIT"
+    assert len(os.listdir(app.SBOM_OFFSET_INDEX_DIR)) == 1
+
+
+def test_filter_and_raw_entries(client):
+    document = _spdx_document(12)
+    token = _register(document, indent=2)
+    body = client.get(f"/api/sbom/{token}/components?q=NAÏVE&raw=true").get_json()
+    assert body["total"] == 1
+    assert body["items"][0]["raw"] == document["packages"][3]
+
+
+def test_entries_spanning_chunk_boundaries(client, monkeypatch):
+    monkeypatch.setattr(app, "OFFSET_INDEX_CHUNK_BYTES", 7)
+    document = _spdx_document(25)
+    token = _register(document, indent=1)
+    body = client.get(f"/api/sbom/{token}/components?limit=25&raw=true").get_json()
+    assert [item["raw"] for item in body["items"]] == document["packages"]
+    assert body["items"][3]["name"] == "naïve-lib"
+
+
+def test_malformed_document_is_rejected(client):
+    path = app._new_output_path("broken-syft-spdx.json")
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write('{"packages": [{"name": "a"}, {"name": ')
+    with app.app.app_context():
+        token = app._cache_download(path, "broken.spdx.json")
+    assert client.get(f"/api/sbom/{token}/components").status_code == 422
@@ -0,0 +1,43 @@
+"""Single-generation payload validation: only known format names pass, and duplicates are scanned once."""
+
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize(
+    "selection",
+    [
+        {"formats": [{"a": 1}]},
+        {"formats": [["spdx"]]},
+        {"formats": ["spdx", 1]},
+        {"formats": "spdx"},
+        {"formats": []},
+        {"format": {"a": 1}},
+        {"format": ["spdx"]},
+        {"formats": ["xml"]},
+    ],
+)
+def test_invalid_format_selection_is_rejected(selection):
+    response = app.app.test_client().post("/api/sbom", json={"image_ref": "alpine:3.20", **selection})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid SBOM format selection."
+
+
+def test_duplicate_formats_are_scanned_once(monkeypatch):
+    scanned = []
+
+    def fake_coalesced_scan(tool, image_ref, sbom_formats, **kwargs):
+        scanned.append(list(sbom_formats))
+        return "scan", {sbom_format: (False, "failed") for sbom_format in sbom_formats}, {
+            sbom_format: "miss" for sbom_format in sbom_formats
+        }, False
+
+    monkeypatch.setattr(app, "_coalesced_scan", fake_coalesced_scan)
+    monkeypatch.setattr(app, "_needs_image_digest", lambda: False)
+    monkeypatch.setattr(app, "_prepare_image_source", lambda *args, **kwargs: ("", None))
+    response = app.app.test_client().post(
+        "/api/sbom", json={"image_ref": "alpine:3.20", "formats": ["spdx", "cyclonedx", "spdx"]}
+    )
+    assert response.status_code == 500
+    assert scanned == [["spdx", "cyclonedx"]]
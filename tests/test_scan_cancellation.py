@@ -0,0 +1,39 @@
+"""Cancelling a scan kills the scanner's whole process group, including processes it started."""
+
+import os
+import time
+
+import pytest
+
+import app
+
+
+def _alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="ascii") as fp:
+            state = fp.read().rsplit(")", 1)[1].split()[0]
+    except FileNotFoundError:
+        return False
+    return state != "Z"
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self"), reason="needs /proc")
+def test_cancellation_kills_the_process_group(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    script = f"sleep 30 & echo $! > {pid_file}; wait"
+    started = time.monotonic()
+    with pytest.raises(app._ScanCancelled):
+        app._run_command(["sh", "-c", script], cancelled=pid_file.exists)
+    assert time.monotonic() - started < 10
+    child = int(pid_file.read_text().strip() or "0")
+    deadline = time.monotonic() + 5
+    while _alive(child) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _alive(child)
+
+
+def test_cancelled_output_file_is_discarded(tmp_path):
+    output_path = str(tmp_path / "sbom.json")
+    with pytest.raises(app._ScanCancelled):
+        app._run_command(["sh", "-c", "echo partial; sleep 30"], output_path=output_path, cancelled=lambda: True)
+    assert not os.path.exists(output_path)
@@ -0,0 +1,123 @@
+"""Scan admission: per-client fairness, queue timeouts, cancellation while queued and the adaptive limit."""
+
+import threading
+import time
+
+import pytest
+
+import app
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def _queued(slots, client):
+    with slots._cond:
+        return len(slots._waiting.get(client, ()))
+
+
+def test_freed_slot_goes_to_the_client_with_fewest_running_scans():
+    slots = app._ScanSlots(1, 1)
+    order = []
+
+    def scan(client, name):
+        with slots.acquire(client):
+            order.append(name)
+
+    held = slots.acquire("a")
+    held.__enter__()
+    threads = []
+    for client, name in (("a", "a1"), ("a", "a2"), ("b", "b1")):
+        thread = threading.Thread(target=scan, args=(client, name))
+        thread.start()
+        threads.append(thread)
+        # Queue the waiters one at a time so their arrival order is fixed.
+        _wait_until(lambda: _queued(slots, "a") + _queued(slots, "b") == len(threads))
+    held.__exit__(None, None, None)
+    for thread in threads:
+        thread.join(5)
+    assert order == ["a1", "b1", "a2"]
+
+
+def test_client_is_capped_at_per_client_slots():
+    slots = app._ScanSlots(2, 1)
+    started = threading.Event()
+
+    def second_scan_of_a():
+        with slots.acquire("a"):
+            started.set()
+
+    with slots.acquire("a"):
+        thread = threading.Thread(target=second_scan_of_a)
+        thread.start()
+        _wait_until(lambda: _queued(slots, "a") == 1)
+        with slots.acquire("b"):
+            assert not started.is_set()
+    thread.join(5)
+    assert started.is_set()
+
+
+def test_queue_timeout_raises_overloaded(monkeypatch):
+    monkeypatch.setattr(app, "SBOM_QUEUE_TIMEOUT", 0.2)
+    slots = app._ScanSlots(1, 1)
+    with slots.acquire("a"):
+        with pytest.raises(app._ScanOverloaded, match="overloaded"):
+            with slots.acquire("b"):
+                pass
+    assert not slots._waiting
+
+
+def test_overloaded_scan_is_reported_as_failed_output(monkeypatch):
+    monkeypatch.setattr(app, "SBOM_QUEUE_TIMEOUT", 0.2)
+    slots = app._ScanSlots(1, 1)
+    monkeypatch.setattr(app, "_scan_slots", lambda: slots)
+    with slots.acquire("a"):
+        _, outputs, cache_status = app._scan_formats("syft", "alpine:3.20", ["spdx"], client="b", use_cache=False)
+    success, error = outputs["spdx"]
+    assert not success
+    assert "overloaded" in error
+    assert cache_status == {"spdx": "bypass"}
+
+
+def test_cancelled_while_queued(monkeypatch):
+    slots = app._ScanSlots(1, 1)
+    with slots.acquire("a"):
+        with pytest.raises(app._ScanCancelled):
+            with slots.acquire("b", cancelled=lambda: True):
+                pass
+    assert not slots._waiting
+
+
+def test_adaptive_limit_shrinks_under_pressure_and_recovers(monkeypatch):
+    monkeypatch.setattr(app, "ADAPTIVE_INTERVAL", 0.0)
+    monkeypatch.setattr(app, "SBOM_ADAPTIVE_LOAD_HIGH", 1.5)
+    monkeypatch.setattr(app, "SBOM_MEMORY_RESERVE", 100)
+    host = {"load": 0.1, "available": 1000}
+    monkeypatch.setattr(app, "_load_per_cpu", lambda: host["load"])
+    monkeypatch.setattr(app, "_available_memory", lambda: host["available"])
+    slots = app._ScanSlots(4, 4, min_limit=1, adaptive=True)
+
+    host["load"] = 3.0
+    slots._adapt()
+    assert slots.limit == 3
+    host["available"] = 50
+    slots._adapt()
+    assert slots.limit == 1
+    slots._adapt()
+    assert slots.limit == 1
+
+    host.update(load=0.1, available=1000)
+    slots._adapt()
+    assert slots.limit == 1, "grows only while every slot is in use"
+    with slots.acquire("a"):
+        slots._adapt()
+        assert slots.limit == 2
+        with slots.acquire("b"):
+            slots._adapt()
+            assert slots.limit == 3
+    slots._adapt()
+    assert slots.limit == 3
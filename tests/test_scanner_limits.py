@@ -0,0 +1,42 @@
+"""Scanner limits are applied to the child pid after it starts (no preexec_fn) and still surface as resource errors."""
+
+import os
+import resource
+import subprocess
+import sys
+
+import app
+
+
+def test_limits_are_applied_to_the_child(monkeypatch):
+    monkeypatch.setattr(app, "SBOM_SCAN_NICE", 5)
+    monkeypatch.setattr(app, "SBOM_SCAN_MAX_MEMORY", 8 * 1024**3)
+    monkeypatch.setattr(app, "SBOM_SCAN_MAX_CPU_SECONDS", 60)
+    popen_kwargs = {}
+    real_popen = subprocess.Popen
+
+    def recording_popen(*args, **kwargs):
+        popen_kwargs.update(kwargs)
+        return real_popen(*args, **kwargs)
+
+    monkeypatch.setattr(app.subprocess, "Popen", recording_popen)
+    probe = (
+        "import os, resource, time; time.sleep(0.3); "
+        "print(os.getpriority(os.PRIO_PROCESS, 0), resource.getrlimit(resource.RLIMIT_AS)[0], "
+        "resource.getrlimit(resource.RLIMIT_CPU)[0])"
+    )
+    success, output = app._run_command([sys.executable, "-c", probe])
+    assert success, output
+    niceness, max_memory, max_cpu = map(int, output.split())
+    assert niceness == min(19, os.getpriority(os.PRIO_PROCESS, 0) + 5)
+    assert max_memory == 8 * 1024**3
+    assert max_cpu == 60
+    assert popen_kwargs.get("preexec_fn") is None
+
+
+def test_cpu_limit_maps_to_resource_limit_error(monkeypatch):
+    monkeypatch.setattr(app, "SBOM_SCAN_MAX_CPU_SECONDS", 1)
+    success, error = app._run_command(["sh", "-c", "while :; do :; done"])
+    assert not success
+    assert "SIGXCPU" in error
+    assert app._friendly_error(error) == app._friendly_error("resource limit")
@@ -0,0 +1,73 @@
+"""Under ASGI the event loop only reads scanner pipes; progress and cancellation callbacks run on the waiting thread."""
+
+import asyncio
+import os
+import subprocess
+import threading
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def loop(monkeypatch):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(app, "_SUBPROCESS_LOOP", loop)
+    yield loop, thread
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+class _RecordingTracker:
+    def __init__(self):
+        self.lines = []
+        self.threads = set()
+        self.flushed = False
+
+    def feed(self, line):
+        self.threads.add(threading.current_thread())
+        self.lines.append(line)
+
+    def flush(self):
+        self.flushed = True
+
+
+def _spawn(script):
+    return subprocess.Popen(
+        ["sh", "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True
+    )
+
+
+@pytest.mark.skipif(not hasattr(os, "pidfd_open"), reason="pidfd_open is Linux-only")
+def test_stderr_lines_are_fed_on_the_waiting_thread(loop):
+    _, loop_thread = loop
+    tracker = _RecordingTracker()
+    stdout_chunks = []
+    process = _spawn("echo one >&2; echo out; printf two >&2")
+    usage = app._watch_process(process, tracker, stdout_chunks, 5, None)
+    assert process.returncode == 0
+    assert usage is not None
+    assert tracker.lines == ["one", "two"]
+    assert tracker.threads == {threading.current_thread()}
+    assert loop_thread not in tracker.threads
+    assert tracker.flushed
+    assert "".join(stdout_chunks) == "out\n"
+
+
+@pytest.mark.skipif(not hasattr(os, "pidfd_open"), reason="pidfd_open is Linux-only")
+def test_cancellation_is_checked_on_the_waiting_thread(loop):
+    checks = []
+
+    def cancelled():
+        checks.append(threading.current_thread())
+        return len(checks) > 1
+
+    process = _spawn("sleep 30")
+    with pytest.raises(app._ScanCancelled):
+        app._watch_process(process, _RecordingTracker(), [], 30, cancelled)
+    assert set(checks) == {threading.current_thread()}
+    assert process.returncode is not None